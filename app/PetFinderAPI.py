@@ -1,18 +1,101 @@
+# petpy, pandas, pycountry and requests are slow to import, so they're imported where they're first
+# needed; importing this module (and so starting the app) must stay cheap and never touch the network
+import contextvars
+import heapq
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice, zip_longest
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 import datetime
-from dateutil import parser
-import pycountry
-import pandas as pd
 from flask import sessions, jsonify, json
 from ratelimit import limits, RateLimitException
-from backoff import expo, on_exception
-from petpy import Petfinder
+from backoff import expo, full_jitter, on_exception
 
 from models import User, UserAnimalPreferences  # , #UserPreferences
+from circuit import petfinder_circuits
+from autocomplete import autocomplete
+from geo import fill_missing_distances, org_index, resolve_location, set_distances
+from planner import query_planner, record_upstream
 
 load_dotenv()
 
+# Petfinder allows 50 requests per second (and 1000 per day) per key; every raw request shares this budget
+PETFINDER_CALLS_PER_PERIOD = int(os.environ.get("PETFINDER_CALLS_PER_PERIOD", 50))
+PETFINDER_PERIOD_SECONDS = int(os.environ.get("PETFINDER_PERIOD_SECONDS", 1))
+# Petfinder's default search radius (100 miles), used when orgs are looked up locally
+ORG_SEARCH_RADIUS_KM = 160.9
+# petpy tokens last an hour; refresh a little early
+AUTH_TOKEN_LIFETIME = datetime.timedelta(minutes=55)
+# a raw request gives up after PETFINDER_TIMEOUT_SECONDS, and timeouts, connection errors and 5xx answers are
+# retried PETFINDER_RETRIES times in at most PETFINDER_RETRY_MAX_SECONDS; past that the endpoint's circuit
+# breaker counts a failure (see circuit.py)
+PETFINDER_TIMEOUT_SECONDS = float(os.environ.get("PETFINDER_TIMEOUT_SECONDS", 10))
+PETFINDER_RETRIES = int(os.environ.get("PETFINDER_RETRIES", 3))
+PETFINDER_RETRY_MAX_SECONDS = float(os.environ.get("PETFINDER_RETRY_MAX_SECONDS", 15))
+# concurrent requests of a multi-type search (see fetch_animals_by_types); they share the rate budget above
+TYPE_FAN_OUT_MAX_WORKERS = 8
+
+# petpy argument names -> Petfinder API query parameters; anything else petpy takes (return_df, pages...) isn't sent
+PETPY_TO_API_PARAMS = {
+    "location": "location",
+    "distance": "distance",
+    "sort": "sort",
+    "results_per_page": "limit",
+    "page": "page",
+    "age": "age",
+    "size": "size",
+    "gender": "gender",
+    "coat": "coat",
+    "status": "status",
+    "breed": "breed",
+    "color": "color",
+    "name": "name",
+    "organization_id": "organization",
+    "good_with_children": "good_with_children",
+    "good_with_dogs": "good_with_dogs",
+    "good_with_cats": "good_with_cats",
+    "house_trained": "house_trained",
+    "declawed": "declawed",
+    "special_needs": "special_needs",
+    "before_date": "before",
+    "after_date": "after",
+}
+
+
+def is_upstream_failure(error):
+    """Whether an error means Petfinder is unwell (timeout, connection error, 5xx, rate limit) rather than the request being bad"""
+    error_type = type(error)
+    if error_type.__module__.startswith("petpy") and error_type.__name__ != "PetfinderUnexpectedError":
+        # invalid parameters, credentials, not found...
+        return False
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status >= 500 or status == 429
+
+
+def _not_transient(error):
+    # rate limits have their own, longer backoff (see _get)
+    return isinstance(error, RateLimitException) or not is_upstream_failure(error)
+
+
+# sort -> (merge key of an API animal record, largest first); each type's page comes back in this order
+MERGE_ORDERS = {
+    # animals the API couldn't place go last
+    "distance": (lambda animal: (animal.get("distance") is None, animal.get("distance") or 0), False),
+    "-distance": (lambda animal: (animal.get("distance") is not None, animal.get("distance") or 0), True),
+    "recent": (lambda animal: animal.get("published_at") or "", True),
+    "-recent": (lambda animal: animal.get("published_at") or "", False),
+}
+
+# top-results widget -> the sort whose first row it shows (see fetch_top_results)
+TOP_RESULT_SORTS = {
+    "oldest": "-recent",
+    "newest": "recent",
+    "closest": "distance",
+    "furthest": "-distance",
+}
+
 
 class PetFinderPetPyAPI:
     """
@@ -48,17 +131,30 @@ class PetFinderPetPyAPI:
     }
 
     def __init__(self, get_anon_preference_func, get_user_preference_func):
-        print(os.environ.get("API_KEY"), os.environ.get("API_SECRET"))
-        self.petpy_api = Petfinder(
-            key=os.environ.get("API_KEY"), secret=os.environ.get("API_SECRET")
-        )
-        self.auth_token_time = datetime.datetime.now()
-        # self.breed_choices = self.petpy_api.breeds() #commented out because
+        # the petpy client authenticates over the network, so it's built on first use (see petpy_api)
+        self._petpy_api = None
+        self._petpy_lock = threading.Lock()
+        self.auth_token_time = None
+        # breed/color/coat choices come from the cached catalog (catalog.py), never from here at startup
 
         # utilizing dependency injection here to prevent circular imports from app.py, form.py, helper.py and this file
         self.get_anon_preference = get_anon_preference_func
         self.get_user_preference = get_user_preference_func
 
+    @property
+    def petpy_api(self):
+        """The petpy Petfinder client, created and authenticated on first use"""
+        if self._petpy_api is None:
+            with self._petpy_lock:
+                if self._petpy_api is None:
+                    from petpy import Petfinder
+
+                    self._petpy_api = Petfinder(
+                        key=os.environ.get("API_KEY"), secret=os.environ.get("API_SECRET")
+                    )
+                    self.auth_token_time = datetime.datetime.now()
+        return self._petpy_api
+
     def create_custom_url_for_api_request(self, category, action, params):
         """Create a url to make an API request based off passed in params object.
 
@@ -70,9 +166,63 @@ class PetFinderPetPyAPI:
             action(str): what REST request to make on API eg. 'get' = GET request
             params (OBJECT {str:str}): params Python OBJECT will be iterated on to create the key:value string queries to the url separated by question marks eg. `?{parameter_1}={value_1}`
         """
+        if action.lower() != "get":
+            raise ValueError("The Petfinder API only supports GET requests.")
+
+        # drop unset params; lists become repeated values eg. ?type=dog&type=cat
+        query = {key: value for key, value in (params or {}).items() if value is not None}
+        url = f"{self.BASE_API_URL}/{category}"
+        return f"{url}?{urlencode(query, doseq=True)}" if query else url
+
+    def get_auth_headers(self):
+        """Bearer header for raw requests, re-authenticating petpy when its token is about to expire"""
+        petpy_api = self.petpy_api
+        if datetime.datetime.now() - self.auth_token_time > AUTH_TOKEN_LIFETIME:
+            petpy_api._auth = petpy_api._authenticate()
+            self.auth_token_time = datetime.datetime.now()
+        return {"Authorization": f"Bearer {self.petpy_api._auth}"}
+
+    def request_page(self, category, params):
+        """GET one page of a Petfinder listing, eg. request_page("animals", {"location": "Toronto,ON", "page": 2}).
+
+        Calls share one rate budget across threads and back off exponentially when it's
+        used up or Petfinder answers 429. Each endpoint has a circuit breaker: while
+        it's open, page views get the last good body of the same request (see
+        circuit.py). Returns the decoded JSON body.
+        """
+        url = self.create_custom_url_for_api_request(category, "get", params)
+        return petfinder_circuits.call(
+            category.split("/")[0], url, lambda: self._get(url), is_failure=is_upstream_failure
+        )
+
+    def petpy_call(self, endpoint, *args, **params):
+        """self.petpy_api.animals(...) or .organizations(...) behind the endpoint's circuit breaker, like request_page"""
+        return petfinder_circuits.call(
+            endpoint,
+            repr((args, sorted(params.items()))),
+            lambda: getattr(self.petpy_api, endpoint)(*args, **params),
+            is_failure=is_upstream_failure,
+        )
 
-        # WRITE CODE HERE
-        pass
+    @on_exception(expo, RateLimitException, max_tries=8)
+    @on_exception(
+        expo,
+        Exception,
+        max_tries=PETFINDER_RETRIES,
+        max_time=PETFINDER_RETRY_MAX_SECONDS,
+        jitter=full_jitter,
+        giveup=_not_transient,
+    )
+    @limits(calls=PETFINDER_CALLS_PER_PERIOD, period=PETFINDER_PERIOD_SECONDS)
+    def _get(self, url):
+        import requests
+
+        response = requests.get(url, headers=self.get_auth_headers(), timeout=PETFINDER_TIMEOUT_SECONDS)
+        if response.status_code == 429:
+            raise RateLimitException("Petfinder rate limit reached", PETFINDER_PERIOD_SECONDS)
+        response.raise_for_status()
+        record_upstream(calls=1, nbytes=len(response.content))
+        return response.json()
 
     def get_orgs_id_list_from_df(self, params_obj):
         """Get DataFrame of animal rescue organizations within a specified distance of a location.
@@ -86,15 +236,153 @@ class PetFinderPetPyAPI:
         if not params_obj:
             params_obj = self.default_options_obj
         location = params_obj.get("location")
+
+        # answered from the mirrored catalog (org_crawler.py) when it's loaded
+        origin = resolve_location(location)
+        if origin and len(org_index.ensure_loaded()):
+            return [org_id for _, org_id in org_index.within(*origin, radius_km=ORG_SEARCH_RADIUS_KM)]
+
         try:
-            init_orgs_df = self.petpy_api.organizations(location, sort="distance")
-            filtered_list = init_orgs_df["id"].toList()
-            print(filtered_list)
+            init_orgs_df = self.petpy_call(
+                "organizations",
+                location=location, sort="distance", results_per_page=100, pages=None, return_df=True
+            )
+            filtered_list = init_orgs_df["id"].tolist()
             return filtered_list
         except Exception as e:
             print(f"An error occurred while retrieving organizations: {e}")
             return None
 
+    @staticmethod
+    def api_search_params(params):
+        """Petfinder API query parameters of search params given with petpy or API names; anything else is dropped"""
+        query = {PETPY_TO_API_PARAMS.get(name, name): value for name, value in params.items()}
+        return {name: value for name, value in query.items() if name in PETPY_TO_API_PARAMS.values() or name == "type"}
+
+    def search_window(self, params, count, offset=0, sort="recent"):
+        """`count` animals from `offset` of a sorted search, fetching no more than that window.
+
+        The window is served from cached pages when they cover it; otherwise the
+        page size and pages are planned around it (see planner.py), eg. 12 cards
+        are one 12-row request rather than a 100-row page cut down to 12.
+
+        Args:
+            params (DICT): search parameters, petpy or Petfinder API names, eg. {"location": "Toronto,ON", "type": "dog"}
+            count (INT): animals the consumer renders
+            offset (INT, optional): animals to skip, eg. (page number - 1) * count
+            sort (STR): "recent", "-recent", "distance" or "-distance"; the distance sorts need a location
+
+        Returns: [API animal record, ...]
+        """
+        query = self.api_search_params(params)
+        query.pop("limit", None)
+        query.pop("page", None)
+        query["sort"] = sort
+
+        def fetch_page(page_size, page):
+            body = self.request_page("animals", {**query, "limit": page_size, "page": page})
+            return body.get("animals") or [], (body.get("pagination") or {}).get("total_count")
+
+        try:
+            return query_planner.fetch(fetch_page, query, count, offset)
+        except Exception as e:
+            print(f"An error occurred while retrieving animals: {e}")
+            return []
+
+    def fetch_top_results(self, params, origin=None):
+        """The top-results widgets, each the first animal of one sorted search.
+
+        A 1-row request per widget and animal type (or a cached page of the same
+        search, eg. the newest animal out of the first page of cards) instead of
+        downloading a full page to pick four animals out of it. The requests run
+        concurrently, like fetch_animals_by_types, so a cold view waits for the
+        slowest one rather than for all of them in turn. With several types, each
+        widget shows the best of the types' first animals. The distance widgets are
+        skipped without a location to measure from.
+
+        Args:
+            params (DICT): search parameters, as for search_window; "type" may be a list of types
+            origin (TUPLE, optional): (lat, lon) of the search, for animals the API returned without a distance
+
+        Returns: OBJECT = {
+            "oldest": value,
+            "newest": value,
+            "closest": value,
+            "furthest": value
+        }
+        """
+        animal_types = params.get("type") or [None]
+        if isinstance(animal_types, str):
+            animal_types = [animal_types]
+        searches = [
+            (widget, sort, {**params, "type": animal_type})
+            for widget, sort in TOP_RESULT_SORTS.items()
+            if "distance" not in sort or params.get("location")
+            for animal_type in dict.fromkeys(animal_types)
+        ]
+        with ThreadPoolExecutor(max_workers=min(len(searches), TYPE_FAN_OUT_MAX_WORKERS) or 1) as executor:
+            # each search runs in a copy of this context, so it's counted against the current page view
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.search_window, search_params, 1, 0, sort)
+                for _, sort, search_params in searches
+            ]
+            firsts = [future.result() for future in futures]
+
+        candidates = {}
+        for (widget, sort, _), animals in zip(searches, firsts):
+            candidates.setdefault(widget, []).extend(animals)
+        output_object = {}
+        for widget, animals in candidates.items():
+            if animals:
+                merge_key, reverse = MERGE_ORDERS[TOP_RESULT_SORTS[widget]]
+                best = max(animals, key=merge_key) if reverse else min(animals, key=merge_key)
+                # parsed from a JSON copy so the cached pages stay raw API records
+                output_object[widget] = self.parse_api_animals_data(api_data=json.dumps([best]), origin=origin)[0]
+        return output_object
+
+    def fetch_animals_by_types(self, animal_types, params, limit=20, sort="distance"):
+        """First `limit` animals of any of several types, in sort order.
+
+        Petfinder only filters by one type per request, so each type is requested
+        concurrently with the same filters and page size, and the sorted pages are
+        merged with a k-way heap merge that stops once `limit` animals are out. The
+        whole search takes as long as the slowest single request, and nothing of a
+        type the user didn't ask for is downloaded.
+
+        Args:
+            animal_types (LIST of STR): eg. ["dog", "cat"]
+            params (DICT): other search parameters, petpy or Petfinder API names
+            limit (INT): page size, at most 100 (Petfinder's maximum)
+            sort (STR): "distance", "-distance", "recent" or "-recent"; anything else is interleaved by rank
+
+        Returns: [API animal record, ...]
+        """
+        query = self.api_search_params(params)
+        query.update(sort=sort, limit=min(limit, 100), page=1)
+
+        def fetch_type(animal_type):
+            try:
+                return self.request_page("animals", {**query, "type": animal_type}).get("animals") or []
+            except Exception as e:
+                # the other types are still worth showing
+                print(f"An error occurred while retrieving {animal_type} animals: {e}")
+                return []
+
+        if isinstance(animal_types, str):
+            animal_types = [animal_types]
+        animal_types = list(dict.fromkeys(animal_types))
+        with ThreadPoolExecutor(max_workers=min(len(animal_types), TYPE_FAN_OUT_MAX_WORKERS) or 1) as executor:
+            # each request runs in a copy of this context, so it's counted against the current page view
+            futures = [executor.submit(contextvars.copy_context().run, fetch_type, animal_type) for animal_type in animal_types]
+            pages = [future.result() for future in futures]
+
+        if sort in MERGE_ORDERS:
+            merge_key, reverse = MERGE_ORDERS[sort]
+            merged = heapq.merge(*pages, key=merge_key, reverse=reverse)
+        else:
+            merged = (animal for animal in chain.from_iterable(zip_longest(*pages)) if animal is not None)
+        return list(islice(merged, limit))
+
     def get_animals_df(self, params_obj, user_bool, key="animal_types"):
         """Get DataFrame of animal rescue organizations within a specified distance of a location.
 
@@ -113,9 +401,6 @@ class PetFinderPetPyAPI:
             )
             params_obj = {key: saved_pref.get(key).data}
         try:
-
-            # Fetch data from API
-            animals_df = self.petpy_api.animals(**params_obj)
             animal_types = params_obj.get(
                 key,
                 (
@@ -124,11 +409,22 @@ class PetFinderPetPyAPI:
                     else self.get_anon_preference_func(key=key)
                 ),
             )
-            # Filter DataFrame based on 'animal_types'
+            # one request per preferred type instead of fetching every type and discarding most rows
             if animal_types:
-                animals_df = animals_df[animals_df["type"].isin(animal_types)]
+                import pandas
+
+                search_params = {name: value for name, value in params_obj.items() if name != key}
+                records = self.fetch_animals_by_types(
+                    animal_types,
+                    search_params,
+                    limit=search_params.get("results_per_page", 20),
+                    # the distance sorts need a location to measure from
+                    sort=search_params.get("sort", "distance" if search_params.get("location") else "recent"),
+                )
+                return pandas.json_normalize(records)
 
-            return animals_df
+            # Fetch data from API
+            return self.petpy_call("animals", **params_obj)
 
         except Exception as e:
             print(f"An error occurred while retrieving organizations: {e}")
@@ -181,25 +477,28 @@ class PetFinderPetPyAPI:
                 # add default search parameters
                 default = self.default_options_obj
                 pref_key_list = default.update(pref_key_list)
-                matching_animals = self.petpy_api.animals(pref_key_list)
+                matching_animals = self.petpy_call("animals", pref_key_list)
 
             # handle no saved user preferences found by passing in default search parameters
             else:
                 pref_key_list = self.default_options_obj
-                matching_animals = self.petpy_api.animals(pref_key_list)
+                matching_animals = self.petpy_call("animals", pref_key_list)
 
         # handle anon users
         else:
             # populate pref_key_obj with anon preferences
             pref_key_obj = {"location": country, "animal_types": animal_types}
             print(pref_key_obj)
-            matching_animals = self.petpy_api.animals(**pref_key_obj)
+            matching_animals = self.petpy_call("animals", **pref_key_obj)
 
             return matching_animals
 
     def animals_df_to_org_animal_count_dict(self, animals_df):
         """Function to group animals DataFrame by 'organization_id' and count the number of animals in each group, sorted by count in descending order, and return the result as a dictionary.
 
+        For the mirrored catalog, snapshots.org_animal_counts() gives the same counts from the Parquet snapshot
+        without an API call.
+
         Args:
             animals_df (DataFrame): pandas DataFrame of animals API results
         """
@@ -263,8 +562,17 @@ class PetFinderPetPyAPI:
         else:
             return primary
 
-    def parse_photos(self, photos_list, type):
-        """Function to parse breeds object property in API results"""
+    def parse_photos(self, photos_list, type, slot="card"):
+        """Function to parse photos object property in API results
+
+        Args:
+            photos_list (LIST of OBJECTS): the animal's photos, each in small/medium/large/full sizes
+            type (STR): animal type, picks the graphic shown when there's no photo
+            slot (STR): where the photo is shown, see photos.SLOTS
+
+        Returns: OBJECT = {"src": URL, "srcset": STR, "sizes": STR}
+        """
+        from photos import photo_set
 
         # handle invalid or empty types
         if type.lower() not in [
@@ -292,12 +600,11 @@ class PetFinderPetPyAPI:
             "misc": "../static/images/graphics/tracks_freepik.png",
         }
 
-        if not photos_list or len(photos_list) == 0:
-            return default_animal_graphic[
-                type.lower()
-            ]  # return default graphic if the animal has no photos
-        else:
-            return photos_list[0]["full"]
+        photo = photo_set(photos_list[0], slot) if photos_list else None
+        if photo is None:
+            # return default graphic if the animal has no photos
+            return {"src": default_animal_graphic[type.lower()], "srcset": "", "sizes": ""}
+        return photo
 
     def parse_location_obj(self, loc_obj):
         """Function to parse location object property in API results"
@@ -309,11 +616,14 @@ class PetFinderPetPyAPI:
         state = loc_obj.get("state", False)
         country = loc_obj.get("country", False)
         if country:
+            import pycountry
+
             # parse country string into 2 letter abbreviations
             country = (
                 country
                 if (len(country) == 2)
-                else pycountry.countries.search_fuzzy(country)[0].alpha_2
+                else autocomplete.code_for("country", country)
+                or pycountry.countries.search_fuzzy(country)[0].alpha_2
             )
             print(country)
         if not loc_obj or not country:
@@ -323,10 +633,12 @@ class PetFinderPetPyAPI:
 
             if state:
                 # parse state string into 2 letter abbreviations
+                # exact names come from the autocomplete table; only misspellings pay for the fuzzy search
                 state = (
                     state
                     if (len(state) == 2)
-                    else pycountry.subdivisions.search_fuzzy(state)[0].alpha_2
+                    else autocomplete.code_for("state", state)
+                    or pycountry.subdivisions.search_fuzzy(state)[0].code.split("-")[-1]
                 )
                 print(state)
                 return {
@@ -369,7 +681,7 @@ class PetFinderPetPyAPI:
 
         # handle if action = 'delta'
         if action == "delta":
-            date_obj = datetime.datetime.fromisoformat(pub_date.replace("+0000", "+00:00"))
+            date_obj = datetime.datetime.fromisoformat(pub_date.replace("Z", "+00:00").replace("+0000", "+00:00"))
             date_diff = today - date_obj
             # get the difference in days
             parsed_date = date_diff.days
@@ -381,12 +693,13 @@ class PetFinderPetPyAPI:
             parsed_date = date_obj.strftime("%d/%m/%Y")
             return parsed_date
 
-    def parse_api_animals_data(self, api_data):
+    def parse_api_animals_data(self, api_data, origin=None):
         """
         Function to clean up missing data from api to be used in jinja templates
 
         Args:
             api_data (json): API data to be cleaned up and turned into content for JINJA templates
+            origin (TUPLE, optional): (lat, lon) of the searcher; animals without a distance get one computed locally
         """
         # output list of parsed animals
         parsed = []
@@ -417,17 +730,21 @@ class PetFinderPetPyAPI:
                 animal["location"] = self.parse_location_obj(
                     loc_obj=animal.get("contact")
                 )
-                animal["published_date"] = self.parse_publish_date(
-                    pub_date=animal.get("published_date", ""), action="format"
-                )
+                # Petfinder's field is published_at; both are computed from it before published_date is set
                 animal["date_delta"] = self.parse_publish_date(
-                    pub_date=animal.get("published_date", ""), action="delta"
+                    pub_date=animal.get("published_at", ""), action="delta"
+                )
+                animal["published_date"] = self.parse_publish_date(
+                    pub_date=animal.get("published_at", ""), action="format"
                 )
 
                 # Remove videos
                 if "videos" in animal:
                     del animal["videos"]
                 parsed.append(animal)
+
+            # one vectorized pass for every animal the API didn't give a distance
+            fill_missing_distances(parsed, origin)
         else:
             print(
                 "Data is not valid python lists; data not in the expected format."
@@ -437,6 +754,21 @@ class PetFinderPetPyAPI:
         # Return final list of parsed animals
         return parsed
 
+    def resort_by_distance(self, parsed_data, origin):
+        """Recompute distances for a new origin and sort nearest first, so cached results can be reused without an API call
+
+        Args:
+            parsed_data (LIST of OBJECTS): animals parsed by self.parse_api_animals_data()
+            origin (TUPLE): (lat, lon) of the new searcher
+
+        Returns: the same animals sorted by distance, animals that can't be placed last
+        """
+        set_distances(parsed_data, origin)
+        return sorted(
+            parsed_data,
+            key=lambda animal: (animal["distance"] is None, animal["distance"] or 0),
+        )
+
     def find_highest_lowest(self, ani_objects, key="date_delta"):
         """
         Finds the animal objects with the highest and lowest values based on the specified key.
@@ -462,11 +794,12 @@ class PetFinderPetPyAPI:
 
         return highest_obj, lowest_obj
 
-    def get_top_results(self, parsed_data):
+    def get_top_results(self, parsed_data, origin=None):
         """Function to sort parsed_data for top-results
 
         Args:
             parsed_data (LIST of OBJECTS): returned API results that have been parsed by self.parse_api_animals_data()
+            origin (TUPLE, optional): (lat, lon) of the search; animals the API returned without a distance get one computed locally
 
         Returns: OBJECT = {
             "oldest": value,
@@ -475,11 +808,15 @@ class PetFinderPetPyAPI:
             "furthest": value
         }
         """
+        fill_missing_distances(parsed_data, origin)
+
         oldest, newest = self.find_highest_lowest(
             ani_objects=parsed_data, key="date_delta"
         )
+        # animals that still have no distance can't be compared
         furthest, closest = self.find_highest_lowest(
-            ani_objects=parsed_data, key="distance"
+            ani_objects=[animal for animal in parsed_data if animal.get("distance") is not None],
+            key="distance",
         )
 
         # Pack into an object
@@ -491,6 +828,6 @@ class PetFinderPetPyAPI:
         }
 
         # filter out object keys with the falsy values
-        output_object = {key: value for key, value in output_object if value}
+        output_object = {key: value for key, value in output_object.items() if value}
 
         return output_object
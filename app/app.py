@@ -3,11 +3,22 @@ from flask import Flask, Blueprint, render_template, request, flash, redirect, s
 import os
 
 from models import db, User
+from assets import assets
+from catalog import animal_catalog
+from circuit import petfinder_circuits
+from compression import compression
+from photos import photo_proxy
+from planner import query_planner
+from http_cache import http_cache
+from autocomplete import autocomplete
+from feed import get_timeline
+from fragments import fragment_cache
 from dotenv import load_dotenv
 # from __init__ import app
 from config import config, Config
 
 from data_routes import data_bp
+from export_routes import export_bp
 from auth_routes import auth_bp
 from users_routes import users_bp
 
@@ -29,9 +40,27 @@ def create_app():
         else "default"
     )
     app_config_instance.config_app(app=app, obj=config[flask_env_type])
+    animal_catalog.init_app(app)
+    # Cache-Control/ETag on every response, see http_cache.py
+    http_cache.init_app(app)
+    # fingerprinted, precompressed static files (see assets.py)
+    assets.init_app(app)
+    # srcset photo helpers and the optional thumbnail proxy (see photos.py)
+    photo_proxy.init_app(app)
+    # rendered animal cards and result widgets (see fragments.py)
+    fragment_cache.init_app(app)
+    # gzip/brotli responses (see compression.py)
+    compression.init_app(app)
+    # windowed Petfinder searches and per-page-view upstream usage (see planner.py)
+    query_planner.init_app(app)
+    # per-endpoint Petfinder circuit breakers, serving last good results while open (see circuit.py)
+    petfinder_circuits.init_app(app)
+    # load the prebuilt autocomplete tries now rather than on the first keystroke
+    autocomplete.kinds
 
     # register blueprints
     app.register_blueprint(data_bp)
+    app.register_blueprint(export_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(users_bp)
     return app
@@ -45,16 +74,14 @@ def homepage():
     """Show homepage:
 
     - anon users:
-    - logged in: 
+    - logged in: timeline of new animals from followed rescues
     """
 
     if g.user:
-        # users_followed_by_current_user = g.user.following
+        # new animals from the rescues this user follows, paged by cursor
+        feed = get_timeline(g.user, cursor=request.args.get("cursor"))
 
-        # Now, you can use this list of users to get their messages
-
-
-        return render_template('home.html')
+        return render_template('home.html', feed=feed)
 
     else:
         return render_template('home-anon.html')
@@ -70,21 +97,5 @@ def inject_global_vars():
 
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
-
-@app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
-
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
-
 if __name__ == '__main__':
     app.run(debug=True, use_reloader=True)
@@ -0,0 +1,214 @@
+"""Applicant index: one ApplicantProfile row per user, so rescues can filter applicants at scale.
+
+Each profile is built from UserResidence, UserCurrentPets, UserResources,
+UserTravelPreferences and UserLocation. Every boolean column listed in
+APPLICANT_FLAGS is packed into the profile's `flags` bitset (bit i is
+APPLICANT_FLAGS[i]), so "has a yard and a car, no pool" is
+`flags & yard|car = yard|car AND flags & pool = 0` on one compact row, and
+all the flag counts for a filter come back from a single scan.
+
+Profiles are kept current incrementally: a flush that touches any source row
+marks its user, and the marked users' profiles are recomputed in one
+INSERT ... SELECT ... ON CONFLICT just before the transaction commits. Bulk
+loads that skip the ORM (seed.py) call refresh_applicant_profiles() once at
+the end instead.
+"""
+
+from itertools import chain
+
+from sqlalchemy import BigInteger, case, event, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+
+from models import (
+    db,
+    ApplicantProfile,
+    MatchedRescueOrganization,
+    User,
+    UserCurrentPets,
+    UserLocation,
+    UserResidence,
+    UserResources,
+    UserTravelPreferences,
+)
+
+# bit i of ApplicantProfile.flags; only ever append, or existing profiles need a full refresh
+APPLICANT_FLAGS = [
+    UserResidence.is_urban,
+    UserResidence.is_rural,
+    UserResidence.has_yard,
+    UserResidence.has_pool,
+    UserResidence.has_fence_surrounding_dwelling,
+    UserResidence.has_doggie_door,
+    UserCurrentPets.user_has_pets,
+    UserCurrentPets.user_pets_has_medical_conditions,
+    UserCurrentPets.user_pets_friendly_to_new_dogs,
+    UserCurrentPets.user_pets_friendly_to_new_cats,
+    UserCurrentPets.user_pets_friendly_to_new_birds,
+    UserCurrentPets.user_pets_friendly_to_new_bunnies,
+    UserCurrentPets.user_pets_friendly_to_new_misc_animal_types,
+    UserResources.possesses_car,
+    UserResources.possesses_valid_drivers_license,
+    UserTravelPreferences.willing_to_fly_by_airplane,
+    UserTravelPreferences.willing_to_drive,
+    UserTravelPreferences.willing_to_carpool,
+    UserTravelPreferences.willing_to_volunteer_transport,
+]
+FLAG_BITS = {column.key: 1 << position for position, column in enumerate(APPLICANT_FLAGS)}
+
+# tables a profile is built from
+SOURCE_MODELS = (UserResidence, UserCurrentPets, UserResources, UserTravelPreferences, UserLocation)
+
+
+def flags_mask(names):
+    """OR of the bits of these flag names; raises ValueError for an unknown name"""
+    mask = 0
+    for name in names:
+        if name not in FLAG_BITS:
+            raise ValueError(f"Unknown applicant flag: {name}")
+        mask |= FLAG_BITS[name]
+    return mask
+
+
+##############################################################################
+# Maintenance
+
+
+def refresh_applicant_profiles(user_ids=None, session=None):
+    """Recompute the profiles of these users (every user if None) from the source tables in one statement"""
+    session = session or db.session
+    if user_ids is not None and not user_ids:
+        return
+
+    # users can have several rows in a source table, so booleans are ORed and the rest take any value
+    flags = sum(
+        (
+            case((func.bool_or(column), literal(bit, BigInteger)), else_=literal(0, BigInteger))
+            for column, bit in zip(APPLICANT_FLAGS, FLAG_BITS.values())
+        ),
+        literal(0, BigInteger),
+    )
+    profiles = (
+        select(
+            User.id,
+            flags,
+            func.max(UserLocation.country),
+            func.max(UserLocation.state),
+            func.max(UserResidence.dwelling_type),
+            func.max(UserResidence.dwelling_size),
+            func.max(UserCurrentPets.pet_quantity),
+            func.max(UserCurrentPets.pet_type),
+            func.max(UserCurrentPets.pets_age),
+            func.max(UserTravelPreferences.distance_filter_preference),
+        )
+        .select_from(User)
+        .outerjoin(UserLocation, UserLocation.user_id == User.id)
+        .outerjoin(UserResidence, UserResidence.user_id == User.id)
+        .outerjoin(UserCurrentPets, UserCurrentPets.user_id == User.id)
+        .outerjoin(UserResources, UserResources.user_id == User.id)
+        .outerjoin(UserTravelPreferences, UserTravelPreferences.user_id == User.id)
+        .group_by(User.id)
+    )
+    if user_ids is not None:
+        profiles = profiles.where(User.id.in_(list(user_ids)))
+
+    columns = [
+        "user_id", "flags", "country", "state", "dwelling_type", "dwelling_size",
+        "pet_quantity", "pet_types", "pets_ages", "distance_filter_preference",
+    ]
+    statement = insert(ApplicantProfile).from_select(columns, profiles)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ApplicantProfile.user_id],
+            set_={name: statement.excluded[name] for name in columns[1:]},
+        )
+    )
+
+
+@event.listens_for(db.session, "after_flush")
+def _mark_changed_applicants(session, flush_context):
+    """Remember which users' source rows this flush touched (new/dirty/deleted still hold the pre-flush state)"""
+    changed = session.info.setdefault("changed_applicants", set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, SOURCE_MODELS) and instance.user_id is not None:
+            changed.add(instance.user_id)
+        elif isinstance(instance, User) and instance in session.new:
+            changed.add(instance.id)
+
+
+@event.listens_for(db.session, "before_commit")
+def _refresh_changed_applicants(session):
+    session.flush()
+    changed = session.info.pop("changed_applicants", None)
+    if changed:
+        refresh_applicant_profiles(changed, session=session)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_changed_applicants(session):
+    session.info.pop("changed_applicants", None)
+
+
+##############################################################################
+# Queries
+
+
+def applicant_filters(require=(), exclude=(), any_of=(), country=None, state=None, pet_types=None, dwelling_types=None):
+    """WHERE clauses over ApplicantProfile for a rescue's search.
+
+    Args:
+        require (LIST): flag names that must all be set
+        exclude (LIST): flag names that must all be unset
+        any_of (LIST): flag names of which at least one must be set
+        country, state (STR, optional): region
+        pet_types (LIST, optional): applicants who currently have any of these pets
+        dwelling_types (LIST, optional): applicants living in any of these
+    """
+    conditions = []
+    if require:
+        mask = flags_mask(require)
+        conditions.append(ApplicantProfile.flags.op("&")(mask) == mask)
+    if exclude:
+        conditions.append(ApplicantProfile.flags.op("&")(flags_mask(exclude)) == 0)
+    if any_of:
+        conditions.append(ApplicantProfile.flags.op("&")(flags_mask(any_of)) != 0)
+    if country:
+        conditions.append(ApplicantProfile.country == country)
+    if state:
+        conditions.append(ApplicantProfile.state == state)
+    if pet_types:
+        conditions.append(ApplicantProfile.pet_types.overlap(pet_types))
+    if dwelling_types:
+        conditions.append(ApplicantProfile.dwelling_type.in_(dwelling_types))
+    return conditions
+
+
+def matched_to_org(org_id):
+    """WHERE clause limiting applicants to the users matched with a rescue org"""
+    return ApplicantProfile.user_id.in_(
+        select(MatchedRescueOrganization.matched_user_id).where(MatchedRescueOrganization.matched_org_id == org_id)
+    )
+
+
+def count_applicants(conditions):
+    """Total matching applicants and how many of them have each flag, in one scan.
+
+    Returns: OBJECT = {"total": INT, "flags": {flag name: count, ...}}
+    """
+    counts = db.session.execute(
+        select(
+            func.count(),
+            *[
+                func.count().filter(ApplicantProfile.flags.op("&")(bit) != 0)
+                for bit in FLAG_BITS.values()
+            ],
+        ).where(*conditions)
+    ).one()
+    return {"total": counts[0], "flags": dict(zip(FLAG_BITS, counts[1:]))}
+
+
+def find_applicants(conditions, after_user_id=None, limit=50):
+    """Page of matching user ids in user id order; pass the last id back as after_user_id for the next page"""
+    query = select(ApplicantProfile.user_id).where(*conditions)
+    if after_user_id is not None:
+        query = query.where(ApplicantProfile.user_id > after_user_id)
+    return list(db.session.scalars(query.order_by(ApplicantProfile.user_id).limit(limit)))
@@ -0,0 +1,294 @@
+"""Fingerprinted, precompressed static assets.
+
+`python assets.py build` copies every file under static/ into ASSETS_DIST_PATH
+(app/dist by default) with a content hash in its name, and writes alongside it:
+
+    style.3f2a9c1b.css.br / .gz        brotli and gzip variants of text assets,
+                                       kept only when they are actually smaller
+    photo.640.5e0c7d21.jpg / .webp     resized, re-encoded derivatives of photos,
+                                       one per IMAGE_WIDTHS narrower than the original
+    manifest.json                      {"stylesheets/style.css": {"file": ..., "encodings": [...],
+                                        "variants": [{"file": ..., "width": INT, "format": STR}, ...]}, ...}
+
+url(...) references in stylesheets are rewritten to the fingerprinted files.
+
+Templates link assets with asset_url()/asset_srcset() instead of
+url_for('static', ...), and images stored as URLs (eg. User.image_url) with
+image_src()/image_srcset(), which do the same for URLs under static/ and pass
+any other URL through. They are served from /assets/ (endpoint
+"assets.static", so http_cache gives them a year-long immutable lifetime),
+choosing the best precompressed variant the browser accepts. Nothing is
+compressed at request time. Without a manifest, eg. in development before the
+first build, the helpers fall back to plain /static URLs.
+
+Brotli and Pillow are only needed to build; without them the build skips
+brotli variants or image derivatives.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+from flask import Blueprint, abort, request, send_from_directory, url_for
+
+APP_DIR = os.path.abspath(os.path.dirname(__file__))
+STATIC_DIR = os.path.join(APP_DIR, "static")
+DIST_DIR = os.path.join(APP_DIR, "dist")
+MANIFEST = "manifest.json"
+
+HASH_LENGTH = 8
+COMPRESSIBLE = {".css", ".js", ".svg", ".ico", ".json", ".txt", ".xml", ".map"}
+# file suffix of each precompressed variant, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+# a variant must save at least this much to be worth a separate file
+MIN_COMPRESSION_RATIO = 0.95
+IMAGE_EXTENSIONS = {".jpg", ".jpeg"}
+IMAGE_WIDTHS = (320, 640, 1280)
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+# a URL of a file under static/, eg. the "../static/images/..." image defaults in models.py
+STATIC_URL = re.compile(r"^(?:\.\./)*/?static/(?P<filename>[^?#]+)$")
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def fingerprint(path, content):
+    """'stylesheets/style.css' -> 'stylesheets/style.3f2a9c1b.css'"""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{hashlib.md5(content).hexdigest()[:HASH_LENGTH]}{extension}"
+
+
+##############################################################################
+# Build
+
+
+def _write(dist_dir, path, content):
+    full_path = os.path.join(dist_dir, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "wb") as out_file:
+        out_file.write(content)
+
+
+def compressed_variants(content):
+    """{encoding: bytes} for the encodings that make content meaningfully smaller"""
+    variants = {}
+    try:
+        import brotli
+
+        variants["br"] = brotli.compress(content, quality=11)
+    except ImportError:
+        pass
+    variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+    return {
+        encoding: compressed
+        for encoding, compressed in variants.items()
+        if len(compressed) < len(content) * MIN_COMPRESSION_RATIO
+    }
+
+
+def image_derivatives(content, widths=IMAGE_WIDTHS):
+    """[(width, format, bytes), ...]: content resized to each width narrower than it, as JPEG and WebP"""
+    from io import BytesIO
+
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(content)) as image:
+        # phone photos are often stored sideways with an EXIF rotation
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        derivatives = []
+        for width in widths:
+            if width >= image.width:
+                continue
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            for image_format, options in (
+                ("jpeg", {"quality": JPEG_QUALITY, "optimize": True, "progressive": True}),
+                ("webp", {"quality": WEBP_QUALITY, "method": 6}),
+            ):
+                out = BytesIO()
+                resized.save(out, image_format, **options)
+                derivatives.append((width, image_format, out.getvalue()))
+    return derivatives
+
+
+def rewrite_css_urls(css, css_path, manifest):
+    """Point url(...) references to static files at their fingerprinted copies"""
+
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(("data:", "http:", "https:", "//", "#")):
+            return match.group(0)
+        if url.startswith("/static/"):
+            path = url[len("/static/"):]
+        else:
+            path = os.path.normpath(os.path.join(os.path.dirname(css_path), url)).replace(os.sep, "/")
+        entry = manifest.get(path)
+        if entry is None:
+            return match.group(0)
+        # the stylesheet is served from the same tree, so a path relative to it keeps working
+        relative = os.path.relpath(entry["file"], os.path.dirname(css_path) or ".").replace(os.sep, "/")
+        return f'url("{relative}")'
+
+    return CSS_URL.sub(replace, css.decode("utf-8")).encode("utf-8")
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Rebuild dist_dir from static_dir. Returns the manifest."""
+    try:
+        import PIL  # noqa: F401
+
+        make_derivatives = True
+    except ImportError:
+        print("Pillow is not installed, skipping image derivatives")
+        make_derivatives = False
+
+    paths = []
+    for directory, _, filenames in os.walk(static_dir):
+        for filename in filenames:
+            paths.append(os.path.relpath(os.path.join(directory, filename), static_dir).replace(os.sep, "/"))
+    # stylesheets last, so the files they reference are already in the manifest
+    paths.sort(key=lambda path: (path.endswith(".css"), path))
+
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+    for path in paths:
+        with open(os.path.join(static_dir, path), "rb") as asset_file:
+            content = asset_file.read()
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".css":
+            content = rewrite_css_urls(content, path, manifest)
+
+        entry = {"file": fingerprint(path, content), "encodings": [], "variants": []}
+        _write(dist_dir, entry["file"], content)
+
+        if extension in COMPRESSIBLE:
+            for encoding, compressed in compressed_variants(content).items():
+                _write(dist_dir, entry["file"] + ENCODINGS[encoding], compressed)
+                entry["encodings"].append(encoding)
+
+        if extension in IMAGE_EXTENSIONS and make_derivatives:
+            root = os.path.splitext(path)[0]
+            for width, image_format, derivative in image_derivatives(content):
+                file = fingerprint(f"{root}.{width}.{'jpg' if image_format == 'jpeg' else image_format}", derivative)
+                _write(dist_dir, file, derivative)
+                entry["variants"].append({"file": file, "width": width, "format": image_format})
+
+        manifest[path] = entry
+
+    _write(dist_dir, MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+##############################################################################
+# Serving
+
+
+class Assets:
+    """Flask extension: asset_url()/asset_srcset() template helpers and the /assets/ route"""
+
+    def __init__(self, app=None):
+        self.dist_dir = DIST_DIR
+        self.manifest = {}
+        # fingerprinted file -> encodings it has precompressed variants for
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist_dir = app.config.get("ASSETS_DIST_PATH") or DIST_DIR
+        self.load()
+
+        blueprint = Blueprint("assets", __name__)
+        blueprint.add_url_rule("/assets/<path:filename>", "static", self.send_asset)
+        app.register_blueprint(blueprint)
+        app.add_template_global(self.asset_url)
+        app.add_template_global(self.asset_srcset)
+        app.add_template_global(self.image_src)
+        app.add_template_global(self.image_srcset)
+        app.extensions["assets"] = self
+
+    def load(self):
+        """(Re)read the manifest written by build(); an empty one if there's no build"""
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST)) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            self.manifest = {}
+        self.encodings = {entry["file"]: entry["encodings"] for entry in self.manifest.values()}
+
+    def asset_url(self, filename, width=None, image_format=None):
+        """URL of a static file, eg. asset_url('stylesheets/style.css').
+
+        Args:
+            filename (STR): path under static/
+            width (INT, optional): the narrowest derivative at least this wide (or the original if none is)
+            image_format (STR, optional): "jpeg" or "webp" derivative
+        """
+        entry = self.manifest.get(filename)
+        if entry is None:
+            return url_for("static", filename=filename)
+        file = entry["file"]
+        if width or image_format:
+            variants = sorted(
+                (variant for variant in entry["variants"] if variant["format"] == (image_format or "jpeg")),
+                key=lambda variant: variant["width"],
+            )
+            wide_enough = [variant for variant in variants if not width or variant["width"] >= width]
+            if wide_enough:
+                file = wide_enough[0]["file"]
+        return url_for("assets.static", filename=file)
+
+    def asset_srcset(self, filename, image_format="jpeg"):
+        """srcset attribute value listing every derivative of an image, eg. '/assets/a.320.1f2e3d4c.jpg 320w, ...'"""
+        entry = self.manifest.get(filename)
+        if entry is None:
+            return ""
+        return ", ".join(
+            f"{url_for('assets.static', filename=variant['file'])} {variant['width']}w"
+            for variant in sorted(entry["variants"], key=lambda variant: variant["width"])
+            if variant["format"] == image_format
+        )
+
+    def image_src(self, url, width=None):
+        """asset_url() of an image URL under static/ (eg. a default profile image); any other URL as is"""
+        match = STATIC_URL.match(url or "")
+        return self.asset_url(match["filename"], width=width) if match else url
+
+    def image_srcset(self, url, image_format="jpeg"):
+        """asset_srcset() of an image URL under static/; "" for any other URL"""
+        match = STATIC_URL.match(url or "")
+        return self.asset_srcset(match["filename"], image_format) if match else ""
+
+    def send_asset(self, filename):
+        """Serve a fingerprinted file, or its best precompressed variant the browser accepts"""
+        encodings = self.encodings.get(filename)
+        if encodings is None and not os.path.isfile(os.path.join(self.dist_dir, filename)):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        accepted = [encoding for encoding in encodings or () if request.accept_encodings[encoding]]
+        # the browser's preference first, ours (the ENCODINGS order) on a tie
+        accepted.sort(key=lambda encoding: (-request.accept_encodings[encoding], list(ENCODINGS).index(encoding)))
+
+        if accepted:
+            response = send_from_directory(self.dist_dir, filename + ENCODINGS[accepted[0]], mimetype=mimetype)
+            response.headers["Content-Encoding"] = accepted[0]
+        else:
+            response = send_from_directory(self.dist_dir, filename, mimetype=mimetype)
+        if encodings:
+            response.vary.add("Accept-Encoding")
+        return response
+
+
+assets = Assets()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        sys.exit("usage: python assets.py build")
+    built = build()
+    print(f"wrote {len(built)} assets to {DIST_DIR}")
@@ -6,6 +6,7 @@ from sqlalchemy.exc import IntegrityError
 
 from models import db, User
 from forms import LoginForm, UserAddForm
+from hashing import PasswordHasherBusy
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -67,6 +68,10 @@ def signup():
             flash("Username already taken", 'danger')
             return render_template('users/signup.html', form=form)
 
+        except PasswordHasherBusy:
+            flash("We're busy right now, please try again in a moment.", 'danger')
+            return render_template('users/signup.html', form=form), 503
+
         do_login(user)
 
         return redirect("/")
@@ -82,8 +87,12 @@ def login():
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(form.username.data,
-                                 form.password.data)
+        try:
+            user = User.authenticate(form.username.data,
+                                     form.password.data)
+        except PasswordHasherBusy:
+            flash("We're busy right now, please try again in a moment.", 'danger')
+            return render_template('users/login.html', form=form), 503
 
         if user:
             do_login(user)
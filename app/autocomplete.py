@@ -0,0 +1,218 @@
+"""Prefix autocomplete for countries, provinces/states, cities and breeds.
+
+Each kind of suggestion is a compressed (radix) trie whose nodes also store
+the indexes of the TOP_K most popular entries below them. Answering a
+keystroke is one walk down the trie, as long as the typed prefix, followed by
+reading the precomputed list, so it takes microseconds.
+
+Entries are matched by any word of their name, so "york" finds "New York", and keys are
+accent and punctuation folded (see geocoder.normalize_name).
+
+Places are built offline by `python autocomplete.py build` into
+geodata/autocomplete.json, which holds the finished tries and is loaded as is
+on first use. It uses pycountry for country and subdivision names and
+geodata/places.csv for cities, ranked by population. Breeds come from the
+animal catalog (catalog.py) and are built in memory whenever it changes,
+ranked by how many mirrored animals have each breed.
+
+A node is [edges, top]: edges maps the first character of an edge label to
+[label, child node], and top is a list of entry indexes, best first. An entry
+is [label, value, score].
+"""
+
+import csv
+import heapq
+import json
+import os
+import sys
+import threading
+
+from geocoder import GEODATA_DIR, PLACES_CSV, normalize_name
+
+AUTOCOMPLETE_JSON = os.path.join(GEODATA_DIR, "autocomplete.json")
+TOP_K = 10
+PLACE_KINDS = ("country", "state", "city")
+
+# Petfinder only lists animals in these countries, so they outrank everything else
+PETFINDER_COUNTRIES = {"CA", "US"}
+
+
+def word_keys(label):
+    """Keys an entry is findable by: its name (the label up to the first comma) from each word on"""
+    words = normalize_name(label.split(",")[0]).split()
+    return [" ".join(words[start:]) for start in range(len(words))]
+
+
+def build_trie(entries):
+    """Compressed trie over entries ([label, value, score], ...) with the top TOP_K entry indexes at every node"""
+    # plain character trie first; "" holds the indexes of entries ending at a node
+    root = {}
+    for index, (label, _, _) in enumerate(entries):
+        for key in word_keys(label):
+            node = root
+            for char in key:
+                node = node.setdefault(char, {})
+            node.setdefault("", set()).add(index)
+
+    def rank(indexes):
+        return heapq.nsmallest(TOP_K, indexes, key=lambda index: (-entries[index][2], entries[index][0]))
+
+    def compress(node):
+        indexes = set(node.get("", ()))
+        edges = {}
+        for char, child in node.items():
+            if char == "":
+                continue
+            label = char
+            # collapse chains of single-child nodes that no entry ends at into one edge
+            while len(child) == 1 and "" not in child:
+                (next_char, next_child), = child.items()
+                label += next_char
+                child = next_child
+            compressed = compress(child)
+            edges[char] = [label, compressed]
+            indexes.update(compressed[1])
+        return [edges, rank(indexes)]
+
+    return compress(root)
+
+
+def find_node(trie, prefix):
+    """Node holding every completion of prefix (normalized), or None"""
+    node = trie
+    while prefix:
+        edge = node[0].get(prefix[0])
+        if edge is None:
+            return None
+        label, child = edge
+        if prefix.startswith(label):
+            prefix = prefix[len(label):]
+            node = child
+        elif label.startswith(prefix):
+            return child
+        else:
+            return None
+    return node
+
+
+##############################################################################
+# Build
+
+
+def place_entries():
+    """{kind: [[label, value, score], ...]} for countries, Canadian/US subdivisions and the bundled cities"""
+    import pycountry
+
+    with open(PLACES_CSV, newline="") as csv_file:
+        cities = list(csv.DictReader(csv_file))
+
+    state_population = {}
+    for city in cities:
+        key = (city["country"], city["state"])
+        state_population[key] = state_population.get(key, 0) + int(city["population"])
+
+    countries = [
+        [country.name, country.alpha_2, 10 ** 9 if country.alpha_2 in PETFINDER_COUNTRIES else 0]
+        for country in pycountry.countries
+    ]
+    states = []
+    for country in sorted(PETFINDER_COUNTRIES):
+        country_name = pycountry.countries.get(alpha_2=country).name
+        for subdivision in pycountry.subdivisions.get(country_code=country):
+            code = subdivision.code.split("-", 1)[1]
+            states.append([f"{subdivision.name}, {country_name}", code, state_population.get((country, code), 0)])
+    city_entries = [
+        [f"{city['city']}, {city['state']}, {city['country']}", f"{city['city']},{city['state']}", int(city["population"])]
+        for city in cities
+    ]
+    return {"country": countries, "state": states, "city": city_entries}
+
+
+def build(out_path=AUTOCOMPLETE_JSON):
+    """Write the place tries to out_path. Returns the number of entries."""
+    kinds = {kind: {"entries": entries, "trie": build_trie(entries)} for kind, entries in place_entries().items()}
+    with open(out_path, "w") as out_file:
+        json.dump(kinds, out_file, separators=(",", ":"))
+    return sum(len(kind["entries"]) for kind in kinds.values())
+
+
+##############################################################################
+# Lookup
+
+
+class Autocomplete:
+    """Suggestions from the prebuilt place tries plus a breed trie built from the animal catalog"""
+
+    def __init__(self, path=AUTOCOMPLETE_JSON):
+        self.path = path
+        self._kinds = None
+        self._breeds_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def kinds(self):
+        if self._kinds is None:
+            with self._lock:
+                if self._kinds is None:
+                    with open(self.path) as autocomplete_file:
+                        self._kinds = json.load(autocomplete_file)
+        return self._kinds
+
+    def _refresh_breeds(self):
+        """(Re)build the breed trie when the catalog has been refreshed since it was built"""
+        from catalog import animal_catalog
+        from search import animal_index
+
+        version = animal_catalog.data.get("refreshed_at")
+        if version == self._breeds_version:
+            return
+        breed_counts = animal_index.search(limit=0, facets=["breed"])["facets"]["breed"] if animal_index.loaded else {}
+        entries = [[breed, breed, breed_counts.get(breed, 0)] for breed in animal_catalog.breeds()]
+        self.kinds["breed"] = {"entries": entries, "trie": build_trie(entries)}
+        self._breeds_version = version
+
+    def suggest(self, prefix, kinds=None, limit=TOP_K):
+        """Most popular completions of prefix, best first.
+
+        Args:
+            prefix (STR): what has been typed so far
+            kinds (LIST, optional): any of "country", "state", "city", "breed"; defaults to all
+            limit (INT): at most TOP_K
+
+        Returns: [{"label": STR, "value": STR, "kind": STR}, ...]
+        """
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        kinds = kinds or (*PLACE_KINDS, "breed")
+        if "breed" in kinds:
+            self._refresh_breeds()
+
+        candidates = []
+        for kind in kinds:
+            index = self.kinds.get(kind)
+            node = find_node(index["trie"], prefix) if index else None
+            if node:
+                candidates.extend((index["entries"][position], kind) for position in node[1][:limit])
+
+        best = heapq.nsmallest(min(limit, TOP_K), candidates, key=lambda candidate: -candidate[0][2])
+        return [{"label": entry[0], "value": entry[1], "kind": kind} for entry, kind in best]
+
+    def code_for(self, kind, name):
+        """Exact (normalized) name -> code lookup, eg. code_for("state", "Ontario") -> "ON"; None if unknown"""
+        name = normalize_name(name)
+        node = find_node(self.kinds[kind]["trie"], name)
+        for position in node[1] if node else []:
+            label, value, _ = self.kinds[kind]["entries"][position]
+            if normalize_name(label.split(",")[0]) == name:
+                return value
+        return None
+
+
+autocomplete = Autocomplete()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        sys.exit("usage: python autocomplete.py build")
+    print(f"wrote {build()} entries to {AUTOCOMPLETE_JSON}")
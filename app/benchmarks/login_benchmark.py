@@ -0,0 +1,77 @@
+"""Concurrent login benchmark for the password hashing pool.
+
+Simulates a login burst: many request threads each checking a password at
+the same time. Reports logins/second, latency percentiles and how deep the
+hashing queue got. Run from the app/ directory:
+
+    python -m benchmarks.login_benchmark --logins 200 --threads 32
+    python -m benchmarks.login_benchmark --workers 0      # hash on the request threads, for comparison
+"""
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hashing import PasswordHasher
+
+
+class BenchmarkConfig:
+    def __init__(self, rounds, workers, max_queue):
+        self.config = {
+            "BCRYPT_LOG_ROUNDS": rounds,
+            "PASSWORD_HASH_WORKERS": workers,
+            "PASSWORD_HASH_MAX_QUEUE": max_queue,
+            "PASSWORD_HASH_TIMEOUT": 60,
+        }
+        self.extensions = {}
+
+
+def run_login_benchmark(logins=200, threads=32, rounds=12, workers=None, max_queue=None):
+    """Check `logins` passwords from `threads` concurrent threads and return a dict of results"""
+    workers = os.cpu_count() if workers is None else workers
+    max_queue = threads if max_queue is None else max_queue
+    hasher = PasswordHasher(BenchmarkConfig(rounds, workers, max_queue))
+    pw_hash = hasher.generate_password_hash("correct horse battery staple")
+
+    def login(_):
+        started = time.perf_counter()
+        assert hasher.check_password_hash(pw_hash, "correct horse battery staple")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as request_threads:
+        latencies = sorted(request_threads.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+    stats = hasher.stats()
+    hasher.shutdown()
+
+    return {
+        "logins": logins,
+        "threads": threads,
+        "rounds": rounds,
+        "pool_workers": workers,
+        "seconds": round(elapsed, 3),
+        "logins_per_second": round(logins / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "max_queue_depth": stats["max_queue_depth"],
+        "rejected": stats["rejected"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32, help="concurrent request threads")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost")
+    parser.add_argument("--workers", type=int, default=None, help="hashing pool size (0 = inline)")
+    parser.add_argument("--max-queue", type=int, default=None)
+    args = parser.parse_args()
+
+    results = run_login_benchmark(
+        logins=args.logins, threads=args.threads, rounds=args.rounds, workers=args.workers, max_queue=args.max_queue
+    )
+    for key, value in results.items():
+        print(f"{key:>18}: {value}")
@@ -0,0 +1,144 @@
+"""Upstream cost of a page view with and without limit pushdown (see planner.py).
+
+A page view here is a page of result cards plus the four top-results
+widgets, the way the home page renders them. Petfinder is simulated by an
+in-memory catalog of animal records the size of real ones, so the numbers
+are the calls and JSON bytes a view costs, not network timings:
+
+    before  one full 100-row page per view, cut down to the cards and
+            scanned for the widgets
+    after   planned windows: one `--cards`-row request for the cards, 1-row
+            requests for the widgets, and cached pages reused across views
+
+Run from the app/ directory:
+
+    python -m benchmarks.planner_benchmark --views 20 --cards 12
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from planner import MAX_PAGE_SIZE, QueryPlanner
+
+SORTS = {
+    "recent": (lambda animal: animal["published_at"], True),
+    "-recent": (lambda animal: animal["published_at"], False),
+    "distance": (lambda animal: animal["distance"], False),
+    "-distance": (lambda animal: animal["distance"], True),
+}
+
+
+def fake_catalog(size, seed=0):
+    """Animal records shaped (and sized, about 2KB each) like Petfinder's"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": 70_000_000 + number,
+            "organization_id": f"ON{rng.randint(1, 400)}",
+            "url": f"https://www.petfinder.com/dog/animal-{number}/on/toronto/rescue-on{number % 400}/",
+            "type": "Dog",
+            "species": "Dog",
+            "breeds": {"primary": "Labrador Retriever", "secondary": None, "mixed": True, "unknown": False},
+            "colors": {"primary": "Black", "secondary": None, "tertiary": None},
+            "age": rng.choice(["Baby", "Young", "Adult", "Senior"]),
+            "gender": rng.choice(["Male", "Female"]),
+            "size": rng.choice(["Small", "Medium", "Large"]),
+            "attributes": {"spayed_neutered": True, "house_trained": False, "shots_current": True},
+            "tags": ["Friendly", "Playful"],
+            "name": f"Animal {number}",
+            "description": "A very good dog looking for a home. " * 8,
+            "photos": [
+                {size_name: f"https://dl5zpyw5k3jeb.cloudfront.net/photos/pets/{number}/1/?bust=1&width={width}"
+                 for size_name, width in (("small", 100), ("medium", 300), ("large", 600), ("full", 1200))}
+            ],
+            "status": "adoptable",
+            "published_at": (now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))).isoformat(),
+            "distance": round(rng.uniform(0, 100), 2),
+            "contact": {"email": "adopt@example.org", "address": {"city": "Toronto", "state": "ON", "country": "CA"}},
+        }
+        for number in range(size)
+    ]
+
+
+class SimulatedPetfinder:
+    """Sorted, paginated search over a fake catalog that counts requests and response bytes"""
+
+    def __init__(self, catalog):
+        self.sorted = {sort: sorted(catalog, key=key, reverse=reverse) for sort, (key, reverse) in SORTS.items()}
+        self.calls = 0
+        self.bytes = 0
+
+    def search(self, sort, limit, page):
+        animals = self.sorted[sort][(page - 1) * limit:page * limit]
+        body = json.dumps({"animals": animals, "pagination": {"total_count": len(self.sorted[sort])}})
+        self.calls += 1
+        self.bytes += len(body)
+        return json.loads(body)
+
+
+def view_before(upstream, cards):
+    body = upstream.search("recent", MAX_PAGE_SIZE, 1)
+    animals = body["animals"]
+    shown = animals[:cards]
+    widgets = [
+        max(animals, key=lambda animal: animal["published_at"]),
+        min(animals, key=lambda animal: animal["published_at"]),
+        min(animals, key=lambda animal: animal["distance"]),
+        max(animals, key=lambda animal: animal["distance"]),
+    ]
+    return shown, widgets
+
+
+def view_after(upstream, planner, cards):
+    def fetcher(sort):
+        def fetch_page(page_size, page):
+            body = upstream.search(sort, page_size, page)
+            return body["animals"], body["pagination"]["total_count"]
+
+        return fetch_page
+
+    params = {"location": "Toronto,ON"}
+    shown = planner.fetch(fetcher("recent"), {**params, "sort": "recent"}, cards)
+    widgets = [planner.fetch(fetcher(sort), {**params, "sort": sort}, 1) for sort in SORTS]
+    return shown, widgets
+
+
+def run_planner_benchmark(views=20, cards=12, catalog_size=1000):
+    """Average calls and bytes per page view before and after planning; returns a dict of results"""
+    catalog = fake_catalog(catalog_size)
+    before, after = SimulatedPetfinder(catalog), SimulatedPetfinder(catalog)
+    planner = QueryPlanner()
+
+    first_view_calls = first_view_bytes = None
+    for view in range(views):
+        view_before(before, cards)
+        view_after(after, planner, cards)
+        if view == 0:
+            first_view_calls, first_view_bytes = after.calls, after.bytes
+
+    return {
+        "views": views,
+        "cards_per_view": cards,
+        "before_calls_per_view": round(before.calls / views, 2),
+        "before_bytes_per_view": round(before.bytes / views),
+        "after_first_view_calls": first_view_calls,
+        "after_first_view_bytes": first_view_bytes,
+        "after_calls_per_view": round(after.calls / views, 2),
+        "after_bytes_per_view": round(after.bytes / views),
+        "bytes_saved": f"{1 - after.bytes / before.bytes:.1%}",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--views", type=int, default=20)
+    parser.add_argument("--cards", type=int, default=12, help="result cards per page view")
+    parser.add_argument("--catalog-size", type=int, default=1000, help="animals matching the simulated search")
+    args = parser.parse_args()
+
+    results = run_planner_benchmark(views=args.views, cards=args.cards, catalog_size=args.catalog_size)
+    for key, value in results.items():
+        print(f"{key:>24}: {value}")
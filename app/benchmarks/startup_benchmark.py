@@ -0,0 +1,90 @@
+"""App startup benchmark: how long importing the app and create_app() take, with the network blocked.
+
+Each run is a fresh interpreter, so nothing is already imported. Sockets are
+patched to refuse connections, so anything that reaches for the network at
+startup (eg. authenticating the Petfinder client) fails the run instead of
+quietly making it slow. Exits non-zero if the median run is over budget.
+Run from the app/ directory:
+
+    python -m benchmarks.startup_benchmark --runs 5 --budget 1.5
+    python -m benchmarks.startup_benchmark --importtime    # also list the slowest imports
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# runs in the child interpreter
+CHILD = """
+import json, socket, sys, time
+
+def refuse(*args, **kwargs):
+    raise OSError("network access during startup")
+
+socket.socket.connect = refuse
+socket.create_connection = refuse
+
+started = time.perf_counter()
+import app  # builds the app with create_app() at import, as every worker does
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+HEAVY_MODULES = ("pandas", "petpy", "pycountry", "numpy", "dateutil", "requests")
+
+
+def run_once(importtime=False):
+    env = dict(os.environ)
+    # Flask-SQLAlchemy wants a URI, but startup must not connect to it
+    env.setdefault("SQLALCHEMY_DATABASE_URI", "postgresql:///startup_benchmark")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD]
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if result.returncode:
+        raise RuntimeError(f"app startup failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_output, count=15):
+    """(cumulative microseconds, module) of the slowest top-level imports from -X importtime output"""
+    imports = []
+    for line in importtime_output.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit() and not name.startswith("  "):
+                imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def run_startup_benchmark(runs=5, budget=1.5, importtime=False):
+    """Start the app `runs` times and return a dict of results; "passed" is False if the median is over budget"""
+    timings = []
+    for _ in range(runs):
+        child, stderr = run_once()
+        timings.append(child["seconds"])
+
+    results = {
+        "runs": runs,
+        "median_seconds": round(statistics.median(timings), 3),
+        "max_seconds": round(max(timings), 3),
+        "budget_seconds": budget,
+        "heavy_modules_loaded": [module for module in HEAVY_MODULES if module in child["modules"]],
+    }
+    results["passed"] = results["median_seconds"] <= budget
+    if importtime:
+        results["slowest_imports"] = slowest_imports(run_once(importtime=True)[1])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.5, help="seconds the median startup may take")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports")
+    args = parser.parse_args()
+
+    results = run_startup_benchmark(runs=args.runs, budget=args.budget, importtime=args.importtime)
+    for key, value in results.items():
+        print(f"{key:>22}: {value}")
+    sys.exit(0 if results["passed"] else 1)
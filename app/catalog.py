@@ -0,0 +1,193 @@
+"""Petfinder's animal types with their breeds, colors, coats and genders, cached on disk.
+
+The catalog changes rarely but costs one API call per type to fetch, which is
+too slow for app startup or a request. So:
+
+    - it's kept in a JSON file (ANIMAL_CATALOG_PATH) that every worker process
+      reads, loaded lazily on first use and re-read when another process
+      replaces it
+    - a daemon thread refreshes the file once it's older than
+      ANIMAL_CATALOG_MAX_AGE_HOURS; an exclusive file lock makes sure only one
+      worker does the fetching, and the file is swapped in atomically
+    - lookups never call the API: before the first refresh they return empty lists
+
+    python catalog.py refresh    # fetch it now, eg. in a deploy step
+"""
+
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+KINDS = ("breeds", "colors", "coats", "genders")
+
+
+def fetch_catalog(pf_api):
+    """Fetch every type and its breeds from Petfinder (1 + number of types requests)"""
+    types = {}
+    for animal_type in pf_api.request_page("types", {}).get("types", []):
+        breeds_path = animal_type["_links"]["breeds"]["href"].split("/v2/", 1)[-1]
+        breeds = pf_api.request_page(breeds_path, {}).get("breeds", [])
+        types[animal_type["name"]] = {
+            "breeds": sorted(breed["name"] for breed in breeds),
+            "colors": animal_type.get("colors") or [],
+            "coats": animal_type.get("coats") or [],
+            "genders": animal_type.get("genders") or [],
+        }
+    return {"refreshed_at": datetime.now(timezone.utc).isoformat(), "types": types}
+
+
+class AnimalCatalog:
+    """Flask extension serving the cached catalog; see the module docstring"""
+
+    def __init__(self, app=None):
+        self.path = None
+        self.max_age = timedelta(days=7)
+        self.check_seconds = 60
+        self.background_refresh = True
+        self._data = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config.get("ANIMAL_CATALOG_PATH") or os.path.join(app.root_path, "cache", "animal_catalog.json")
+        self.max_age = timedelta(hours=app.config.get("ANIMAL_CATALOG_MAX_AGE_HOURS", 24 * 7))
+        self.background_refresh = app.config.get("ANIMAL_CATALOG_BACKGROUND_REFRESH", True)
+        app.extensions["animal_catalog"] = self
+
+    ##########################################################################
+    # Loading
+
+    def _load(self):
+        """(Re)read the file if it changed since we last read it; at most once every check_seconds"""
+        now = time.monotonic()
+        if self._data is not None and now - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except (OSError, TypeError):
+                mtime = None
+            if mtime is not None and mtime != self._mtime:
+                with open(self.path) as catalog_file:
+                    self._data = json.load(catalog_file)
+                self._mtime = mtime
+            elif self._data is None:
+                self._data = {"refreshed_at": None, "types": {}}
+
+    @property
+    def data(self):
+        self._load()
+        if self.background_refresh and self._thread is None:
+            self.start_background_refresh()
+        return self._data
+
+    def is_stale(self):
+        refreshed_at = self.data.get("refreshed_at")
+        if not refreshed_at:
+            return True
+        return datetime.now(timezone.utc) - datetime.fromisoformat(refreshed_at) > self.max_age
+
+    ##########################################################################
+    # Lookups
+
+    def types(self):
+        return sorted(self.data["types"])
+
+    def values(self, kind, animal_type=None):
+        """Sorted breeds/colors/coats/genders of one type (matched case-insensitively), or of every type"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown catalog kind: {kind}")
+        types = self.data["types"]
+        if animal_type:
+            matches = [entry for name, entry in types.items() if name.lower() == animal_type.lower()]
+        else:
+            matches = types.values()
+        return sorted({value for entry in matches for value in entry.get(kind, [])})
+
+    def breeds(self, animal_type=None):
+        return self.values("breeds", animal_type)
+
+    def colors(self, animal_type=None):
+        return self.values("colors", animal_type)
+
+    def coats(self, animal_type=None):
+        return self.values("coats", animal_type)
+
+    def choices(self, kind, animal_type=None):
+        """[(value, label), ...] for a WTForms SelectField; kind is 'types' or one of KINDS"""
+        values = self.types() if kind == "types" else self.values(kind, animal_type)
+        return [(value, value) for value in values]
+
+    ##########################################################################
+    # Refreshing
+
+    def refresh(self, pf_api, force=False):
+        """Fetch the catalog and atomically replace the file, unless another process is already doing it.
+
+        Returns True if this call wrote a new file.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # another worker may have refreshed while we were waiting to check
+            self._checked_at = 0.0
+            if not force and not self.is_stale():
+                return False
+
+            catalog = fetch_catalog(pf_api)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as catalog_file:
+                json.dump(catalog, catalog_file)
+            os.replace(temp_path, self.path)
+
+        self._checked_at = 0.0
+        self._load()
+        return True
+
+    def start_background_refresh(self, interval_seconds=3600):
+        """Start the daemon thread that refreshes the file whenever it's stale (once per process)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._refresh_loop, args=(interval_seconds,), name="animal-catalog-refresh", daemon=True
+            )
+        self._thread.start()
+
+    def _refresh_loop(self, interval_seconds):
+        from helper import pf_api
+
+        while True:
+            try:
+                if self.is_stale():
+                    self.refresh(pf_api)
+            except Exception as e:
+                print(f"An error occurred while refreshing the animal catalog: {e}")
+            time.sleep(interval_seconds)
+
+
+animal_catalog = AnimalCatalog()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["refresh"]:
+        sys.exit("usage: python catalog.py refresh")
+
+    from app import app
+    from helper import pf_api
+
+    animal_catalog.background_refresh = False
+    animal_catalog.refresh(pf_api, force=True)
+    print(f"wrote {len(animal_catalog.types())} animal types to {animal_catalog.path}")
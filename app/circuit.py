@@ -0,0 +1,237 @@
+"""Circuit breakers around Petfinder, with a last-known-good fallback during outages.
+
+Every Petfinder endpoint ("animals", "organizations", "types") has its own
+breaker:
+
+    closed      calls go through. PETFINDER_CIRCUIT_FAILURES failures in a row
+                (or the endpoint's entry in PETFINDER_CIRCUIT_THRESHOLDS) open it
+    open        calls fail at once with CircuitOpenError rather than each
+                waiting out a timeout, so an outage can't tie up every worker.
+                It stays open PETFINDER_CIRCUIT_RESET_SECONDS, doubling each
+                time it reopens up to PETFINDER_CIRCUIT_MAX_OPEN_SECONDS, plus
+                up to a second of jitter so processes don't probe in lockstep
+    half-open   then one call goes through as a probe while the others still
+                fail fast; success closes the breaker, failure reopens it
+
+A failure is a call that still fails after request_page's own retries of
+timeouts, connection errors and 5xx/429 answers. Other 4xx answers mean a bad
+request, not a sick upstream, and don't count.
+
+The last good result of each call made for a page view is kept (LRU,
+PETFINDER_STALE_MAX_ENTRIES). When such a call fails, or its breaker is open,
+that result is returned instead and the page view is flagged:
+
+    g.upstream_stale / upstream_stale()     True, eg. for a notice in the template
+    Warning: 110 - "Response is Stale"
+    Cache-Control: no-store                 so @cacheable doesn't cache it
+
+Background jobs (sync.py, org_crawler.py) never get stale data; they get the
+error and carry on from their checkpoint on the next pass.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from backoff import expo, random_jitter
+from flask import g, has_request_context, jsonify
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open"""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"Petfinder {endpoint} circuit is open, retrying in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Closed/open/half-open state of one endpoint; see the module docstring"""
+
+    def __init__(self, endpoint, failure_threshold=5, reset_seconds=30, max_open_seconds=600):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        # times opened since startup
+        self.trips = 0
+        self.opened_until = 0.0
+        self._probing = False
+        # open durations since the breaker last closed
+        self._delays = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go through now; in half-open, only the one probe may"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.opened_until:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+            self._delays = None
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == OPEN:
+                # a call that was already in flight when the breaker opened
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._delays is None:
+                    self._delays = expo(factor=self.reset_seconds, max_value=self.max_open_seconds)
+                    # backoff's generators yield once before the first value
+                    next(self._delays)
+                self.state = OPEN
+                self.failures = 0
+                self._probing = False
+                self.trips += 1
+                self.opened_until = time.monotonic() + random_jitter(next(self._delays))
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed; 0 unless open"""
+        return max(self.opened_until - time.monotonic(), 0.0) if self.state == OPEN else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "retry_in": round(self.retry_in(), 1),
+            }
+
+
+def upstream_stale():
+    """Whether any Petfinder data on this page view is a stale fallback"""
+    return g.get("upstream_stale", False)
+
+
+class PetfinderCircuits:
+    """Flask extension: per-endpoint circuit breakers and the last-known-good results served while they're open"""
+
+    def __init__(self, app=None):
+        self.failure_threshold = 5
+        self.thresholds = {}
+        self.reset_seconds = 30
+        self.max_open_seconds = 600
+        self.stale_max_entries = 500
+        self._breakers = {}
+        # (endpoint, call key) -> last good result, least recently used first
+        self._last_good = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.failure_threshold = app.config.get("PETFINDER_CIRCUIT_FAILURES", self.failure_threshold)
+        self.thresholds = dict(app.config.get("PETFINDER_CIRCUIT_THRESHOLDS", self.thresholds))
+        self.reset_seconds = app.config.get("PETFINDER_CIRCUIT_RESET_SECONDS", self.reset_seconds)
+        self.max_open_seconds = app.config.get("PETFINDER_CIRCUIT_MAX_OPEN_SECONDS", self.max_open_seconds)
+        self.stale_max_entries = app.config.get("PETFINDER_STALE_MAX_ENTRIES", self.stale_max_entries)
+        app.after_request(self._flag_stale)
+        app.register_error_handler(CircuitOpenError, self._unavailable)
+        app.add_template_global(upstream_stale)
+        app.extensions["petfinder_circuits"] = self
+
+    def breaker(self, endpoint):
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(
+                    endpoint,
+                    failure_threshold=self.thresholds.get(endpoint, self.failure_threshold),
+                    reset_seconds=self.reset_seconds,
+                    max_open_seconds=self.max_open_seconds,
+                )
+            return breaker
+
+    def call(self, endpoint, key, func, is_failure=lambda error: True):
+        """func() through the endpoint's breaker; for a page view, the last good result of the same call if it fails.
+
+        Args:
+            endpoint (STR): Petfinder endpoint, eg. "animals"
+            key (STR): identifies the call within the endpoint, eg. its URL
+            func (FUNCTION): makes the call
+            is_failure (FUNCTION, optional): whether an error from func counts against the breaker
+
+        Returns: func()'s result, or a copy of its last good result (then g.upstream_stale is True)
+        """
+        breaker = self.breaker(endpoint)
+        page_view = has_request_context()
+        if not breaker.allow():
+            return self._stale(endpoint, key, CircuitOpenError(endpoint, breaker.retry_in()), page_view)
+        try:
+            result = func()
+        except Exception as error:
+            if not is_failure(error):
+                # Petfinder answered; the request was bad
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            return self._stale(endpoint, key, error, page_view)
+        breaker.record_success()
+        if page_view:
+            self._remember(endpoint, key, result)
+        return result
+
+    def _remember(self, endpoint, key, result):
+        # a copy, since callers parse results in place
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._last_good[(endpoint, key)] = result
+            self._last_good.move_to_end((endpoint, key))
+            while len(self._last_good) > self.stale_max_entries:
+                self._last_good.popitem(last=False)
+
+    def _stale(self, endpoint, key, error, page_view):
+        """The last good result of a call, or error re-raised if there's none (or this isn't a page view)"""
+        if not page_view:
+            raise error
+        with self._lock:
+            result = self._last_good.get((endpoint, key))
+        if result is None:
+            raise error
+        print(f"An error occurred calling Petfinder {endpoint}, serving its last good result: {error}")
+        g.upstream_stale = True
+        return copy.deepcopy(result)
+
+    def _flag_stale(self, response):
+        if upstream_stale():
+            response.headers["Warning"] = '110 - "Response is Stale"'
+            response.headers["Cache-Control"] = "no-store"
+        return response
+
+    def _unavailable(self, error):
+        response = jsonify({"error": "Petfinder is unavailable right now, please try again shortly."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(int(error.retry_in) + 1)
+        return response
+
+    def snapshot(self):
+        """State of every endpoint's breaker.
+
+        Returns: OBJECT = {endpoint: {"state": STR, "failures": INT, "trips": INT, "retry_in": FLOAT}, ...}
+        """
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {endpoint: breaker.snapshot() for endpoint, breaker in breakers.items()}
+
+
+petfinder_circuits = PetfinderCircuits()
@@ -0,0 +1,247 @@
+"""gzip/brotli compression of responses, as WSGI middleware.
+
+The JSON data routes and result pages repeat the same keys, URLs and values
+("Super Mutt", "Unknown Color") hundreds of times, so they compress 5-10x.
+A response is compressed when:
+
+    - the browser accepts br or gzip (br is preferred at equal quality)
+    - it isn't already encoded (eg. the precompressed assets, see assets.py),
+      isn't a HEAD, 204 or 304, and doesn't ask for no-transform
+    - its mimetype isn't in COMPRESS_SKIP_MIMETYPES (images, video, archives...)
+    - its Content-Length is at least COMPRESS_MIN_SIZE, or it's streamed
+
+A response with a body in memory is compressed in one go and gets a
+Content-Length and a Server-Timing entry with the CPU time and sizes, so
+they show in the browser's network panel:
+
+    Server-Timing: compress;dur=0.41;desc="gzip 48213>6120"
+
+A streamed response is compressed chunk by chunk and every chunk is flushed,
+so the client still gets each chunk as soon as it's produced.
+
+Bytes and CPU time are also totalled per mimetype; Compression.snapshot()
+returns them with the overall ratio, for tuning the levels.
+"""
+
+import threading
+import time
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+DEFAULT_SKIP_MIMETYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/pdf",
+    "application/octet-stream",
+    "application/vnd.apache.parquet",
+)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        # wbits 31: gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class Compression:
+    """Flask extension wrapping app.wsgi_app in the compressing middleware; see the module docstring"""
+
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        self.skip_mimetypes = DEFAULT_SKIP_MIMETYPES
+        self.server_timing = True
+        self.brotli_available = False
+        # mimetype -> {"responses": INT, "bytes_in": INT, "bytes_out": INT, "cpu_seconds": FLOAT}
+        self._stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get("COMPRESS_MIN_SIZE", self.min_size)
+        self.gzip_level = app.config.get("COMPRESS_GZIP_LEVEL", self.gzip_level)
+        self.brotli_quality = app.config.get("COMPRESS_BROTLI_QUALITY", self.brotli_quality)
+        self.skip_mimetypes = tuple(app.config.get("COMPRESS_SKIP_MIMETYPES", self.skip_mimetypes))
+        self.server_timing = app.config.get("COMPRESS_SERVER_TIMING", self.server_timing)
+        try:
+            import brotli  # noqa: F401
+
+            self.brotli_available = True
+        except ImportError:
+            self.brotli_available = False
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app, self)
+        app.extensions["compression"] = self
+
+    def choose_encoder(self, accept_encoding):
+        """Encoder for the best encoding the client accepts, or None"""
+        accepted = parse_accept_header(accept_encoding)
+        candidates = [("br", BrotliEncoder, self.brotli_quality)] if self.brotli_available else []
+        candidates.append(("gzip", GzipEncoder, self.gzip_level))
+        best = max(candidates, key=lambda candidate: accepted[candidate[0]])
+        if not accepted[best[0]]:
+            return None
+        return best[1](best[2])
+
+    def record(self, mimetype, bytes_in, bytes_out, cpu_seconds):
+        with self._lock:
+            stats = self._stats.setdefault(mimetype, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0})
+            stats["responses"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+            stats["cpu_seconds"] += cpu_seconds
+
+    def snapshot(self):
+        """Totals since startup.
+
+        Returns: OBJECT = {mimetype: {"responses", "bytes_in", "bytes_out", "cpu_seconds", "ratio"}, ...}
+        """
+        with self._lock:
+            return {
+                mimetype: dict(stats, ratio=round(stats["bytes_in"] / stats["bytes_out"], 2) if stats["bytes_out"] else None)
+                for mimetype, stats in self._stats.items()
+            }
+
+
+class CompressionMiddleware:
+    def __init__(self, wsgi_app, compression):
+        self.wsgi_app = wsgi_app
+        self.compression = compression
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") == "HEAD":
+            return self.wsgi_app(environ, start_response)
+        encoder = self.compression.choose_encoder(environ.get("HTTP_ACCEPT_ENCODING"))
+        if encoder is None:
+            return self.wsgi_app(environ, start_response)
+
+        response = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            response.update(status=status, headers=Headers(headers), exc_info=exc_info)
+            # the legacy write() callable isn't supported; Flask never uses it
+            return _unsupported_write
+
+        app_iter = self.wsgi_app(environ, capture_start_response)
+        headers = response["headers"]
+        mimetype = headers.get("Content-Type", "").split(";")[0].strip()
+        content_length = headers.get("Content-Length", type=int)
+
+        if not self._should_compress(response["status"], headers, mimetype, content_length):
+            start_response(response["status"], headers.to_wsgi_list(), response["exc_info"])
+            return app_iter
+
+        headers["Content-Encoding"] = encoder.name
+        vary = headers.get("Vary")
+        if not vary:
+            headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            headers["Vary"] = f"{vary}, Accept-Encoding"
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            # the compressed body is a different byte sequence than the one the ETag was made from
+            headers["ETag"] = f"W/{etag}"
+
+        if content_length is not None:
+            # the body is already complete (rendered page, JSON, file): compress it in one go
+            try:
+                body = b"".join(app_iter)
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+            started = time.thread_time()
+            compressed = encoder.compress(body) + encoder.finish()
+            cpu_seconds = time.thread_time() - started
+            self.compression.record(mimetype, len(body), len(compressed), cpu_seconds)
+
+            headers["Content-Length"] = str(len(compressed))
+            if self.compression.server_timing:
+                headers.add(
+                    "Server-Timing",
+                    f'compress;dur={cpu_seconds * 1000:.2f};desc="{encoder.name} {len(body)}>{len(compressed)}"',
+                )
+            start_response(response["status"], headers.to_wsgi_list(), response["exc_info"])
+            return [compressed]
+
+        headers.pop("Content-Length", None)
+        start_response(response["status"], headers.to_wsgi_list(), response["exc_info"])
+        return self._stream(app_iter, encoder, mimetype)
+
+    def _should_compress(self, status, headers, mimetype, content_length):
+        code = int(status.split(" ", 1)[0])
+        return not (
+            code < 200
+            or code in (204, 206, 304)
+            or "Content-Encoding" in headers
+            or "no-transform" in headers.get("Cache-Control", "")
+            or not mimetype
+            or mimetype.startswith(self.compression.skip_mimetypes)
+            or (content_length is not None and content_length < self.compression.min_size)
+        )
+
+    def _stream(self, app_iter, encoder, mimetype):
+        bytes_in = bytes_out = 0
+        cpu_seconds = 0.0
+        try:
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+                started = time.thread_time()
+                compressed = encoder.compress(chunk) + encoder.flush()
+                cpu_seconds += time.thread_time() - started
+                bytes_in += len(chunk)
+                bytes_out += len(compressed)
+                yield compressed
+            started = time.thread_time()
+            tail = encoder.finish()
+            cpu_seconds += time.thread_time() - started
+            bytes_out += len(tail)
+            yield tail
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+            self.compression.record(mimetype, bytes_in, bytes_out, cpu_seconds)
+
+
+def _unsupported_write(data):
+    raise NotImplementedError("CompressionMiddleware doesn't support the WSGI write() callable")
+
+
+compression = Compression()
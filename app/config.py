@@ -21,6 +21,86 @@ class Config:
     SQLALCHEMY_ECHO = False
     SESSION_COOKIE_PATH='/'
 
+    # password hashing (see hashing.py): bcrypt cost, process pool size and how many hashes may queue
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 4 * (os.cpu_count() or 1)))
+    PASSWORD_HASH_TIMEOUT = 5
+
+    # home timelines (see feed.py): entries kept per user, page size, and the follower count above which
+    # an org's new animals are merged in at read time instead of being copied into every follower's timeline
+    FEED_MAX_ENTRIES = 500
+    FEED_PAGE_SIZE = 20
+    FEED_FANOUT_MAX_FOLLOWERS = int(os.environ.get('FEED_FANOUT_MAX_FOLLOWERS', 10000))
+
+    # animal sync job (see sync.py): ";" separated Petfinder locations to mirror, search radius in miles, page size
+    SYNC_REGIONS = [region for region in os.environ.get('SYNC_REGIONS', 'Toronto,ON').split(';') if region]
+    SYNC_DISTANCE = int(os.environ.get('SYNC_DISTANCE', 100))
+    SYNC_PAGE_SIZE = 100
+
+    # organization crawler (see org_crawler.py): pages fetched at once (within the shared Petfinder rate budget)
+    # and orgs upserted per transaction
+    ORG_CRAWL_WORKERS = int(os.environ.get('ORG_CRAWL_WORKERS', 4))
+    ORG_CRAWL_BATCH_SIZE = 500
+
+    # types/breeds/colors/coats catalog (see catalog.py): shared file, and how old it may get before a background refresh
+    ANIMAL_CATALOG_PATH = os.environ.get('ANIMAL_CATALOG_PATH', os.path.join(basedir, 'cache', 'animal_catalog.json'))
+    ANIMAL_CATALOG_MAX_AGE_HOURS = 24 * 7
+    ANIMAL_CATALOG_BACKGROUND_REFRESH = True
+
+    # HTTP caching (see http_cache.py): seconds browsers may reuse static files, fingerprinted static files
+    # and personalized pages before revalidating them
+    CACHE_STATIC_MAX_AGE = 3600
+    CACHE_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+    CACHE_PRIVATE_MAX_AGE = int(os.environ.get('CACHE_PRIVATE_MAX_AGE', 0))
+
+    # output of `python assets.py build`: fingerprinted static files and their manifest
+    ASSETS_DIST_PATH = os.environ.get('ASSETS_DIST_PATH', os.path.join(basedir, 'dist'))
+
+    # thumbnail proxy (see photos.py): resized Petfinder photos cached on disk, least recently used evicted
+    # once the directory holds more than IMAGE_PROXY_MAX_BYTES
+    IMAGE_PROXY_ENABLED = os.environ.get('IMAGE_PROXY_ENABLED', '').lower() in ('1', 'true', 'yes')
+    IMAGE_PROXY_PATH = os.environ.get('IMAGE_PROXY_PATH', os.path.join(basedir, 'cache', 'photos'))
+    IMAGE_PROXY_MAX_BYTES = int(os.environ.get('IMAGE_PROXY_MAX_BYTES', 256 * 1024 * 1024))
+    IMAGE_PROXY_WIDTHS = (100, 200, 300, 600)
+    IMAGE_PROXY_HOSTS = ('photos.petfinder.com', 'dl5zpyw5k3jeb.cloudfront.net')
+
+    # rendered fragment cache (see fragments.py): entries kept per process, seconds before one is re-rendered,
+    # and the locales fragments are rendered for
+    FRAGMENT_CACHE_MAX_ENTRIES = 5000
+    FRAGMENT_CACHE_TTL = 300
+    FRAGMENT_CACHE_LOCALES = ('en',)
+
+    # response compression (see compression.py): smallest body worth compressing, gzip level (1-9), brotli quality
+    # (0-11), and whether each compressed response reports its CPU time and sizes in a Server-Timing header
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    COMPRESS_SERVER_TIMING = True
+
+    # bulk exports (see exports.py): rows fetched per round trip of the server-side cursor
+    EXPORT_CHUNK_SIZE = 1000
+
+    # Parquet snapshots of the animal catalog for analytics (see snapshots.py): dataset directory and how many
+    # days of snapshots to keep
+    ANALYTICS_SNAPSHOT_PATH = os.environ.get('ANALYTICS_SNAPSHOT_PATH', os.path.join(basedir, 'cache', 'snapshots'))
+    ANALYTICS_SNAPSHOT_KEEP_DAYS = 90
+
+    # Petfinder search planning (see planner.py): fetched pages kept per process, seconds before one is refetched,
+    # and whether each page view reports its Petfinder calls and bytes in a Server-Timing header
+    PLANNER_PAGE_CACHE_SIZE = 1000
+    PLANNER_PAGE_CACHE_TTL = int(os.environ.get('PLANNER_PAGE_CACHE_TTL', 300))
+    PLANNER_SERVER_TIMING = True
+
+    # Petfinder circuit breakers (see circuit.py): failures in a row that open an endpoint's breaker (with
+    # per-endpoint overrides), seconds it first stays open and the most it backs off to, and how many last good
+    # results are kept to serve while it's open
+    PETFINDER_CIRCUIT_FAILURES = int(os.environ.get('PETFINDER_CIRCUIT_FAILURES', 5))
+    PETFINDER_CIRCUIT_THRESHOLDS = {'types': 3}
+    PETFINDER_CIRCUIT_RESET_SECONDS = 30
+    PETFINDER_CIRCUIT_MAX_OPEN_SECONDS = 600
+    PETFINDER_STALE_MAX_ENTRIES = 500
+
     @staticmethod
     def config_app(app, obj):
         """
@@ -45,9 +125,14 @@ class TestingConfig(Config):
     PRESERVE_CONTEXT_ON_EXCEPTION = False
     # hardcoding in the postgresql DB for now as the URI is not being set as an env variable properly
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_TEST_DATABASE_URI')
+    # cheap hashes, hashed inline, so tests don't spend their time in bcrypt
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_HASH_WORKERS = 0
+    ANIMAL_CATALOG_BACKGROUND_REFRESH = False
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_PROD_DATABASE_URI')
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 13))
 
 # Configuration dictionary
 config = {
@@ -1,12 +1,25 @@
-from flask import Blueprint, render_template, g, request, session, jsonify
+from datetime import date
 
-from helper import get_anon_preference, get_user_preference
-from .PetFinderAPI import pf_api
+from flask import Blueprint, current_app, render_template, g, request, session, jsonify
+
+from http_cache import cacheable
+from helper import get_anon_preference, get_user_preference, pf_api
+from autocomplete import autocomplete
+from catalog import KINDS, animal_catalog
+from circuit import petfinder_circuits
+from compression import compression
+from applicants import applicant_filters, count_applicants, find_applicants, matched_to_org
+from geo import org_index, resolve_location
+from models import Animal
+from planner import query_planner
+from search import FACETS, animal_index
+from snapshots import SNAPSHOT_DIR, breed_distribution, days_listed_by_type, org_animal_counts
 
 data_bp = Blueprint('data', __name__, template_folder='templates', url_prefix='/data')
 
 
 @data_bp.route("/data/animals", methods=["GET", "POST"])
+@cacheable(max_age=300, private=True)
 def data():
     """TEST ROUTE TO USE PETPY API
 
@@ -25,8 +38,8 @@ def data():
 
     location = country + "," + state
     print(country)
-    results = pf_api.petpy_api.animals(
-        location=location, sort="distance"
+    results = pf_api.petpy_call(
+        "animals", location=location, sort="distance"
     )  # (**pf_api.default_options_obj)
     print([(org.name, org.adoption.policy) for org in results.organizations])
     # return jsonify(results)
@@ -34,6 +47,7 @@ def data():
 
 
 @data_bp.route("/data/orgs", methods=["GET", "POST"])
+@cacheable(max_age=300, private=True)
 def orgs_data():
     """TEST ROUTE TO GET ORGS DATA
 
@@ -50,14 +64,227 @@ def orgs_data():
         country = get_anon_preference(key="country")
         state = get_anon_preference(key="state")
 
-    results = pf_api.petpy_api.organizations(
-        country=country, state=state, sort="distance"
+    results = pf_api.petpy_call(
+        "organizations", country=country, state=state, sort="distance"
     )  # (**pf_api.default_options_obj)
     print([(org.name, org.adoption.policy) for org in results.organizations])
     # return jsonify(results)
     return render_template("results.html", results=results)
 
 
+@data_bp.route("/orgs/nearby", methods=["GET"])
+@cacheable(max_age=300)
+def nearby_orgs():
+    """Orgs near a location, answered from the local geospatial index (no Petfinder call)
+
+    Query string:
+        location (STR): postcode or "latitude,longitude"
+        radius (FLOAT, optional): km; returns every org within it
+        k (INT, optional): when no radius is given, return the k nearest orgs. Defaults to 10.
+    """
+    origin = resolve_location(request.args.get("location", ""))
+    if not origin:
+        return jsonify({"error": "Unknown location"}), 400
+
+    org_index.ensure_loaded()
+    radius = request.args.get("radius", type=float)
+    if radius:
+        matches = org_index.within(*origin, radius_km=radius)
+    else:
+        matches = org_index.nearest(*origin, k=request.args.get("k", 10, type=int))
+
+    return jsonify(
+        {
+            "origin": origin,
+            "orgs": [{"id": org_id, "distance": round(distance, 2)} for distance, org_id in matches],
+        }
+    )
+
+
+@data_bp.route("/search", methods=["GET"])
+@cacheable(max_age=60)
+def search_animals():
+    """Faceted search over the mirrored animal catalog, answered from the local index (no Petfinder call)
+
+    Query string:
+        <facet> (STR, repeatable): eg. type=Dog&age=Baby&age=Young; values are ORed, facets ANDed
+        location (STR, optional): postcode, "city,state" or "latitude,longitude"
+        radius (FLOAT, optional): km around location, defaults to 50
+        offset, limit (INT, optional): page of results, limit defaults to 20
+    """
+    filters = {facet: request.args.getlist(facet) for facet in FACETS if facet in request.args}
+    page = dict(
+        offset=request.args.get("offset", 0, type=int),
+        limit=min(request.args.get("limit", 20, type=int), 100),
+    )
+
+    animal_index.ensure_loaded()
+    if "location" in request.args:
+        origin = resolve_location(request.args["location"])
+        if not origin:
+            return jsonify({"error": "Unknown location"}), 400
+        results = animal_index.search_near(
+            *origin, radius_km=request.args.get("radius", 50, type=float), filters=filters, **page
+        )
+    else:
+        results = animal_index.search(filters=filters, **page)
+
+    # the index can lag a sync pass by up to its check_seconds; never show an animal since removed
+    animals = {
+        animal.id: animal
+        for animal in Animal.query.filter(Animal.id.in_(results["animal_ids"]), Animal.removed_at.is_(None))
+    }
+    return jsonify(
+        {
+            "total": results["total"],
+            "animals": [
+                {
+                    "id": animal.id,
+                    "name": animal.name,
+                    "type": animal.type,
+                    "organization_id": animal.organization_id,
+                    "url": animal.url,
+                    "photo_url": animal.photo_url,
+                }
+                for animal in (animals.get(animal_id) for animal_id in results["animal_ids"])
+                if animal
+            ],
+            "facets": results["facets"],
+        }
+    )
+
+
+@data_bp.route("/applicants", methods=["GET"])
+def search_applicants():
+    """Filter the profiles of applicants matched with the user's rescue org (see applicants.py) and count how many match each flag
+
+    Only rescue staff (users with a rescue_org_id) may search applicants; others get a 403.
+
+    Query string:
+        require, exclude, any_of (STR, repeatable): flag names, eg. require=has_yard&exclude=has_pool
+        country, state (STR, optional): region
+        pet_type, dwelling_type (STR, repeatable): match any of these
+        after (INT, optional): last user id of the previous page
+        limit (INT, optional): page size, defaults to 50
+    """
+    if not g.user:
+        return jsonify({"error": "Access unauthorized."}), 401
+    if not g.user.rescue_org_id:
+        return jsonify({"error": "Only rescue organizations can search applicants."}), 403
+
+    try:
+        conditions = applicant_filters(
+            require=request.args.getlist("require"),
+            exclude=request.args.getlist("exclude"),
+            any_of=request.args.getlist("any_of"),
+            country=request.args.get("country"),
+            state=request.args.get("state"),
+            pet_types=request.args.getlist("pet_type"),
+            dwelling_types=request.args.getlist("dwelling_type"),
+        )
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    # only the applicants matched with the user's own org
+    conditions.append(matched_to_org(g.user.rescue_org_id))
+
+    user_ids = find_applicants(
+        conditions,
+        after_user_id=request.args.get("after", type=int),
+        limit=min(request.args.get("limit", 50, type=int), 500),
+    )
+    return jsonify(dict(count_applicants(conditions), user_ids=user_ids))
+
+
+@data_bp.route("/catalog", methods=["GET"])
+@cacheable(max_age=3600)
+def animal_catalog_data():
+    """Animal types and their breeds, colors, coats and genders from the cached catalog (no Petfinder call)
+
+    Query string:
+        type (STR, optional): only this animal type's values
+    """
+    animal_type = request.args.get("type")
+    return jsonify(
+        {
+            "types": animal_catalog.types(),
+            **{kind: animal_catalog.values(kind, animal_type) for kind in KINDS},
+        }
+    )
+
+
+@data_bp.route("/autocomplete", methods=["GET"])
+@cacheable(max_age=3600)
+def autocomplete_data():
+    """Most popular countries, provinces/states, cities and breeds starting with what has been typed
+
+    Query string:
+        q (STR): prefix typed so far
+        kind (STR, repeatable, optional): country, state, city or breed; defaults to all of them
+        limit (INT, optional): at most 10
+    """
+    suggestions = autocomplete.suggest(
+        request.args.get("q", ""),
+        kinds=request.args.getlist("kind") or None,
+        limit=request.args.get("limit", 10, type=int),
+    )
+    return jsonify({"suggestions": suggestions})
+
+
+@data_bp.route("/analytics", methods=["GET"])
+@cacheable(max_age=3600)
+def catalog_analytics():
+    """Animals per org, breed distribution and days listed per type from the latest catalog snapshot (see snapshots.py)
+
+    Query string:
+        country, state (STR, optional): region
+        type (STR, optional): animal type
+        date (STR, optional): snapshot date, YYYY-MM-DD; defaults to the latest
+    """
+    try:
+        snapshot_date = date.fromisoformat(request.args["date"]) if "date" in request.args else None
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+
+    filters = dict(
+        root=current_app.config.get("ANALYTICS_SNAPSHOT_PATH", SNAPSHOT_DIR),
+        snapshot_date=snapshot_date,
+        country=request.args.get("country"),
+        state=request.args.get("state"),
+        animal_type=request.args.get("type"),
+    )
+    return jsonify(
+        {
+            "org_animal_counts": org_animal_counts(**filters),
+            "breeds": breed_distribution(**filters),
+            "days_listed": days_listed_by_type(**filters),
+        }
+    )
+
+
+@data_bp.route("/compression", methods=["GET"])
+def compression_stats():
+    """Bytes in and out, compression ratio and CPU time of compressed responses per mimetype, since this worker started"""
+    if not g.user:
+        return jsonify({"error": "Access unauthorized."}), 401
+    return jsonify(compression.snapshot())
+
+
+@data_bp.route("/upstream", methods=["GET"])
+def upstream_stats():
+    """Petfinder calls, bytes and cached-page hits per page view, since this worker started"""
+    if not g.user:
+        return jsonify({"error": "Access unauthorized."}), 401
+    return jsonify(query_planner.snapshot())
+
+
+@data_bp.route("/circuits", methods=["GET"])
+def circuit_stats():
+    """State, consecutive failures and trips of each Petfinder endpoint's circuit breaker in this worker"""
+    if not g.user:
+        return jsonify({"error": "Access unauthorized."}), 401
+    return jsonify(petfinder_circuits.snapshot())
+
+
 # Route to set & get API data in Flask Session
 @data_bp.route("/data/session", methods=["GET", "POST"])
 def update_data_session():
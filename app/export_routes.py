@@ -0,0 +1,117 @@
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+
+from applicants import applicant_filters, matched_to_org
+from exports import FORMATS, animal_export, applicant_export, export_chunks, organization_export
+
+export_bp = Blueprint('export', __name__, url_prefix='/export')
+
+
+def rescue_staff_required(view):
+    """Exports are for partner rescues: 401 without a logged-in user, 403 unless they're rescue staff (have a rescue_org_id)"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not g.user:
+            return jsonify({"error": "Access unauthorized."}), 401
+        if not g.user.rescue_org_id:
+            return jsonify({"error": "Only rescue organizations can use exports."}), 403
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def stream_export(name, query, key_column):
+    """Streamed response of an export in the requested format (see exports.py)
+
+    Query string:
+        format (STR, optional): "ndjson" (default) or "csv"
+        after (STR, optional): key of the last row already received, to resume an interrupted export
+    """
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), 400
+
+    after = request.args.get("after")
+    if after is not None:
+        try:
+            key_column.type.python_type(after)
+        except ValueError:
+            return jsonify({"error": "Invalid after cursor"}), 400
+
+    chunks = export_chunks(
+        query,
+        key_column,
+        export_format,
+        after=after,
+        chunk_size=current_app.config.get("EXPORT_CHUNK_SIZE", 1000),
+    )
+    return Response(
+        stream_with_context(chunks),
+        mimetype=FORMATS[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename={name}.{export_format}",
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@export_bp.route("/animals", methods=["GET"])
+@rescue_staff_required
+def export_animals():
+    """Mirrored animals, ordered by id
+
+    Query string:
+        region (STR, optional): sync region, eg. "Toronto,ON"
+        type (STR, repeatable): animal types
+        org (STR, repeatable): organization ids
+        include_removed (BOOL, optional): also export adopted/removed animals
+    """
+    query, key_column = animal_export(
+        region=request.args.get("region"),
+        types=request.args.getlist("type"),
+        org_ids=request.args.getlist("org"),
+        include_removed=request.args.get("include_removed", "").lower() in ("1", "true", "yes"),
+    )
+    return stream_export("animals", query, key_column)
+
+
+@export_bp.route("/organizations", methods=["GET"])
+@rescue_staff_required
+def export_organizations():
+    """Mirrored rescue orgs, ordered by id
+
+    Query string:
+        country, state (STR, optional): region
+        org (STR, repeatable): organization ids
+    """
+    query, key_column = organization_export(
+        country=request.args.get("country"),
+        state=request.args.get("state"),
+        org_ids=request.args.getlist("org"),
+    )
+    return stream_export("organizations", query, key_column)
+
+
+@export_bp.route("/applicants", methods=["GET"])
+@rescue_staff_required
+def export_applicants():
+    """Profiles of the applicants matched with the user's rescue org, filtered and ordered by user id; same filters as /data/applicants"""
+    try:
+        conditions = applicant_filters(
+            require=request.args.getlist("require"),
+            exclude=request.args.getlist("exclude"),
+            any_of=request.args.getlist("any_of"),
+            country=request.args.get("country"),
+            state=request.args.get("state"),
+            pet_types=request.args.getlist("pet_type"),
+            dwelling_types=request.args.getlist("dwelling_type"),
+        )
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    # only the applicants matched with the user's own org
+    conditions.append(matched_to_org(g.user.rescue_org_id))
+
+    query, key_column = applicant_export(conditions)
+    return stream_export("applicants", query, key_column)
@@ -0,0 +1,153 @@
+"""Bulk exports of the mirrored catalog and of matched applicants, streamed as NDJSON or CSV.
+
+Rows come from a server-side cursor (stream_results, fetched yield_per rows
+at a time) and are written out in small batches, so an export of any size
+holds only one batch in memory. Rows are ordered by their key column, so an
+interrupted download resumes by passing the key of the last row received as
+`after`:
+
+    GET /export/animals?format=csv&region=Toronto,ON&type=Dog
+    GET /export/animals?format=csv&region=Toronto,ON&type=Dog&after=71234567
+
+Each download holds a cursor and a transaction open until it ends, so the
+endpoints are only for partner rescues: logged-in users with a rescue_org_id.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from applicants import FLAG_BITS
+from models import db, Animal, ApplicantProfile, RescueOrganization
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# rows serialized per chunk written to the response
+BATCH_ROWS = 500
+
+
+def animal_export(region=None, types=None, org_ids=None, include_removed=False):
+    """(query, key column) of mirrored animals"""
+    query = select(
+        Animal.id,
+        Animal.organization_id,
+        Animal.type,
+        Animal.name,
+        Animal.status,
+        Animal.region,
+        Animal.published_at,
+        Animal.removed_at,
+        Animal.url,
+        Animal.photo_url,
+    )
+    if region:
+        query = query.where(Animal.region == region)
+    if types:
+        query = query.where(Animal.type.in_(types))
+    if org_ids:
+        query = query.where(Animal.organization_id.in_(org_ids))
+    if not include_removed:
+        query = query.where(Animal.removed_at.is_(None))
+    return query, Animal.id
+
+
+def organization_export(country=None, state=None, org_ids=None):
+    """(query, key column) of mirrored rescue orgs"""
+    query = select(
+        RescueOrganization.id,
+        RescueOrganization.name,
+        RescueOrganization.city,
+        RescueOrganization.state,
+        RescueOrganization.country,
+        RescueOrganization.postcode,
+        RescueOrganization.latitude,
+        RescueOrganization.longitude,
+        RescueOrganization.followers_count,
+    )
+    if country:
+        query = query.where(RescueOrganization.country == country)
+    if state:
+        query = query.where(RescueOrganization.state == state)
+    if org_ids:
+        query = query.where(RescueOrganization.id.in_(org_ids))
+    return query, RescueOrganization.id
+
+
+def applicant_export(conditions):
+    """(query, key column) of the applicant profiles matching applicants.applicant_filters() conditions"""
+    query = select(
+        ApplicantProfile.user_id,
+        ApplicantProfile.country,
+        ApplicantProfile.state,
+        ApplicantProfile.dwelling_type,
+        ApplicantProfile.dwelling_size,
+        ApplicantProfile.pet_quantity,
+        ApplicantProfile.pet_types,
+        ApplicantProfile.pets_ages,
+        ApplicantProfile.flags,
+    ).where(*conditions)
+    return query, ApplicantProfile.user_id
+
+
+def iter_rows(query, key_column, after=None, chunk_size=1000):
+    """Rows of query as dicts in key order, after the given key, from a server-side cursor"""
+    if after is not None:
+        query = query.where(key_column > key_column.type.python_type(after))
+    result = db.session.execute(
+        query.order_by(key_column).execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    try:
+        for row in result.mappings():
+            row = dict(row)
+            if "flags" in row:
+                row["flags"] = [name for name, bit in FLAG_BITS.items() if row["flags"] & bit]
+            yield row
+    finally:
+        # an abandoned download closes the server-side cursor too
+        result.close()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_chunks(rows):
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row, default=_json_default, separators=(",", ":")))
+        if len(batch) == BATCH_ROWS:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch) + "\n"
+
+
+def csv_chunks(rows, columns):
+    """CSV with a header row; list values are joined with "|" """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(
+            [
+                "|".join(map(str, value)) if isinstance(value, list) else value.isoformat() if isinstance(value, datetime) else value
+                for value in (row[column] for column in columns)
+            ]
+        )
+        if count % BATCH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_chunks(query, key_column, export_format, after=None, chunk_size=1000):
+    """Chunks of the export's body in export_format ("ndjson" or "csv")"""
+    rows = iter_rows(query, key_column, after=after, chunk_size=chunk_size)
+    if export_format == "csv":
+        return csv_chunks(rows, [column.key for column in query.selected_columns])
+    return ndjson_chunks(rows)
@@ -2,75 +2,353 @@
 
 You should only need to run this if you wanted to
 tweak the CSV formats or generate fewer/more rows.
+
+Every table in models.py gets a CSV. Generation is split into shards of
+user ids that run across a process pool; each shard gets its own seed
+derived from --seed, so the same arguments always produce the same files
+no matter how many workers are used. Nothing is fetched over the network:
+images point at files already in app/static and everything else comes from
+Faker's local providers.
+
+    python create_csvs.py --users 300 --follows 5000
+    python create_csvs.py --users 5000000 --follows 50000000 --workers 16
 """
 
-import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
+import argparse
+import os
+import random
+from datetime import datetime
 from faker import Faker
-from helpers import get_random_datetime
-
-MAX_MESSAGE_LENGTH = 140
+from helpers import (
+    KeyedPermutation,
+    concat_csv_shards,
+    get_random_datetime,
+    index_to_ordered_pair,
+    run_sharded,
+    shard_ranges,
+    shard_seed,
+    write_shard_csv,
+)
 
-USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio', 'header_image_url', 'location']
-MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
-FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+GENERATOR_DIR = os.path.abspath(os.path.dirname(__file__))
+STATIC_IMAGES_DIR = os.path.join(GENERATOR_DIR, "..", "static", "images")
 
 NUM_USERS = 300
-NUM_MESSAGES = 1000
-NUM_FOLLWERS = 5000
+NUM_FOLLOWS = 5000
+NUM_ORGS = 50
+NUM_ORG_FOLLOWS = 600
+MAX_MATCHES_PER_USER = 3
+SHARD_SIZE = 50_000
+GENERATED_AT = datetime(2024, 1, 1)
 
-fake = Faker()
+# placeholder hash for the password "password"
+FAKE_PASSWORD_HASH = "$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe"
 
-# Generate random profile image URLs to use for users
+ANIMAL_TYPES = ["dog", "cat", "rabbit", "small-furry", "horse", "bird", "scales-fins-other", "barnyard"]
+RESCUE_ACTION_TYPES = ["volunteering", "donation", "adoption", "animal foster"]
+PET_AGES = ["baby", "young", "adult", "senior"]
+DWELLING_TYPES = ["house", "townhouse", "apartment", "condo", "farm"]
+DWELLING_SIZES = ["small", "medium", "large"]
+ANIMAL_PREFERENCES = {
+    "age": PET_AGES,
+    "size": ["small", "medium", "large", "xlarge"],
+    "gender": ["male", "female"],
+    "coat": ["hairless", "short", "medium", "long", "wire", "curly"],
+    "good_with_children": ["true", "false"],
+}
 
-image_urls = [
-    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
-    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
-    for i in range(count)
+# (country, state, city) used for user locations
+LOCATIONS = [
+    ("CA", "ON", "Toronto"), ("CA", "ON", "Ottawa"), ("CA", "ON", "Hamilton"), ("CA", "ON", "London"),
+    ("CA", "QC", "Montreal"), ("CA", "QC", "Quebec City"), ("CA", "BC", "Vancouver"), ("CA", "BC", "Victoria"),
+    ("CA", "AB", "Calgary"), ("CA", "AB", "Edmonton"), ("CA", "MB", "Winnipeg"), ("CA", "NS", "Halifax"),
+    ("US", "NY", "New York"), ("US", "NY", "Buffalo"), ("US", "WA", "Seattle"), ("US", "CA", "Los Angeles"),
+    ("US", "CA", "San Francisco"), ("US", "TX", "Austin"), ("US", "IL", "Chicago"), ("US", "MA", "Boston"),
 ]
 
-# Generate random header image URLs to use for users
+# table name -> CSV header, in the order seed.py loads them
+CSV_HEADERS = {
+    "rescue_org": ["id", "name"],
+    "users": ["id", "email", "username", "image_url", "header_image_url", "password", "bio",
+              "rescue_action_type", "animal_types", "registration_date"],
+    "user_location": ["id", "user_id", "country", "state", "city"],
+    "user_animal_preferences": ["user_id", "species", "user_preference_name", "user_preference_data"],
+    "matched_rescue_org": ["matched_user_id", "matched_org_id", "matched_pct", "matched_datetime",
+                           "followed_by_user_bool"],
+    "user_travel_preferences": ["id", "user_id", "distance_filter_preference", "willing_to_fly_by_airplane",
+                                "willing_to_drive", "willing_to_carpool", "willing_to_volunteer_transport"],
+    "user_resources": ["id", "user_id", "possesses_car", "possesses_valid_drivers_license"],
+    "user_residence": ["id", "user_id", "is_urban", "is_rural", "dwelling_type", "dwelling_size",
+                       "potential_hazards_description", "has_yard", "has_pool",
+                       "has_fence_surrounding_dwelling", "has_doggie_door"],
+    "user_current_pets": ["id", "user_id", "user_has_pets", "pet_quantity", "pet_type", "pets_age",
+                          "user_pets_has_medical_conditions", "user_pets_friendly_to_new_dogs",
+                          "user_pets_friendly_to_new_cats", "user_pets_friendly_to_new_birds",
+                          "user_pets_friendly_to_new_bunnies", "user_pets_friendly_to_new_misc_animal_types"],
+    "user_follows": ["user_being_followed_id", "user_following_id"],
+    "follows": ["rescue_org_being_followed_id", "user_following_id"],
+}
 
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
-]
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
+def list_local_images(sub_dir):
+    """List the images in app/static/images/<sub_dir> as URLs relative to the templates (same form as models.py defaults)"""
+    folder = os.path.join(STATIC_IMAGES_DIR, sub_dir)
+    return [
+        f"../static/images/{sub_dir}/{file_name}"
+        for file_name in sorted(os.listdir(folder))
+        if file_name.lower().endswith((".jpg", ".jpeg", ".png"))
+    ]
+
+
+def pg_array(values):
+    """Format a python list as a postgres array literal eg. ['dog', 'cat'] -> '{dog,cat}'"""
+    return "{" + ",".join(values) + "}"
+
+
+def org_id_for(index):
+    """Petfinder style org id for org #index (0-based) eg. 'ON1'"""
+    return f"{LOCATIONS[index % len(LOCATIONS)][1]}{index + 1}"
+
+
+def rescue_org_rows(rng, fake, start, stop, options):
+    """Rows for rescue orgs, one per org index in [start, stop)"""
+    for index in range(start, stop):
+        city = LOCATIONS[index % len(LOCATIONS)][2]
+        yield dict(id=org_id_for(index), name=f"{fake.last_name()} {city} Animal Rescue")
+
 
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
+def user_rows(rng, fake, start, stop, options):
+    """Rows for users, one per user id in (start, stop]"""
+    image_urls = list_local_images("profile-images")
+    header_image_urls = list_local_images("animal-pictures")
+    now = options["now"]
+
+    for user_id in range(start + 1, stop + 1):
+        # suffix with the id so usernames and emails stay unique at any scale
+        username = f"{fake.user_name()}{user_id}"
+        yield dict(
+            id=user_id,
+            email=f"{username}@{fake.free_email_domain()}",
+            username=username,
+            image_url=rng.choice(image_urls),
+            header_image_url=rng.choice(header_image_urls),
+            password=FAKE_PASSWORD_HASH,
             bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
+            rescue_action_type=pg_array(rng.sample(RESCUE_ACTION_TYPES, rng.randint(1, 2))),
+            animal_types=pg_array(rng.sample(ANIMAL_TYPES, rng.randint(1, 3))),
+            registration_date=get_random_datetime(rng=rng, now=now),
+        )
+
+
+def user_location_rows(rng, fake, start, stop, options):
+    for user_id in range(start + 1, stop + 1):
+        country, state, city = rng.choice(LOCATIONS)
+        yield dict(id=user_id, user_id=user_id, country=country, state=state, city=city)
+
+
+def user_animal_preferences_rows(rng, fake, start, stop, options):
+    for user_id in range(start + 1, stop + 1):
+        species = rng.choice(ANIMAL_TYPES)
+        for name in rng.sample(sorted(ANIMAL_PREFERENCES), rng.randint(1, 3)):
+            yield dict(
+                user_id=user_id,
+                species=species,
+                user_preference_name=name,
+                user_preference_data=rng.choice(ANIMAL_PREFERENCES[name]),
+            )
+
+
+def matched_rescue_org_rows(rng, fake, start, stop, options):
+    now = options["now"]
+    for user_id in range(start + 1, stop + 1):
+        num_matches = rng.randint(0, min(MAX_MATCHES_PER_USER, options["num_orgs"]))
+        for org_index in rng.sample(range(options["num_orgs"]), num_matches):
+            yield dict(
+                matched_user_id=user_id,
+                matched_org_id=org_id_for(org_index),
+                matched_pct=rng.randint(0, 100),
+                matched_datetime=get_random_datetime(rng=rng, now=now),
+                followed_by_user_bool=rng.random() < 0.3,
+            )
+
+
+def user_travel_preferences_rows(rng, fake, start, stop, options):
+    for user_id in range(start + 1, stop + 1):
+        yield dict(
+            id=user_id,
+            user_id=user_id,
+            distance_filter_preference=rng.choice([10, 25, 50, 100, 250, 500]),
+            willing_to_fly_by_airplane=rng.random() < 0.1,
+            willing_to_drive=rng.random() < 0.7,
+            willing_to_carpool=rng.random() < 0.4,
+            willing_to_volunteer_transport=rng.random() < 0.2,
+        )
+
+
+def user_resources_rows(rng, fake, start, stop, options):
+    for user_id in range(start + 1, stop + 1):
+        has_license = rng.random() < 0.75
+        yield dict(
+            id=user_id,
+            user_id=user_id,
+            possesses_car=has_license and rng.random() < 0.8,
+            possesses_valid_drivers_license=has_license,
+        )
+
+
+def user_residence_rows(rng, fake, start, stop, options):
+    for user_id in range(start + 1, stop + 1):
+        is_urban = rng.random() < 0.7
+        has_yard = rng.random() < 0.5
+        yield dict(
+            id=user_id,
+            user_id=user_id,
+            is_urban=is_urban,
+            is_rural=not is_urban,
+            dwelling_type=rng.choice(DWELLING_TYPES),
+            dwelling_size=rng.choice(DWELLING_SIZES),
+            potential_hazards_description=fake.sentence() if rng.random() < 0.2 else "",
+            has_yard=has_yard,
+            has_pool=rng.random() < 0.1,
+            has_fence_surrounding_dwelling=has_yard and rng.random() < 0.6,
+            has_doggie_door=has_yard and rng.random() < 0.2,
+        )
+
+
+def user_current_pets_rows(rng, fake, start, stop, options):
+    for user_id in range(start + 1, stop + 1):
+        pet_quantity = rng.choice([0, 0, 1, 1, 2, 3])
+        yield dict(
+            id=user_id,
+            user_id=user_id,
+            user_has_pets=pet_quantity > 0,
+            pet_quantity=pet_quantity,
+            pet_type=pg_array(rng.sample(ANIMAL_TYPES, min(pet_quantity, 2))),
+            pets_age=pg_array(rng.sample(PET_AGES, min(pet_quantity, 2))),
+            user_pets_has_medical_conditions=pet_quantity > 0 and rng.random() < 0.1,
+            user_pets_friendly_to_new_dogs=rng.random() < 0.6,
+            user_pets_friendly_to_new_cats=rng.random() < 0.5,
+            user_pets_friendly_to_new_birds=rng.random() < 0.3,
+            user_pets_friendly_to_new_bunnies=rng.random() < 0.4,
+            user_pets_friendly_to_new_misc_animal_types=rng.random() < 0.3,
+        )
+
+
+def user_follows_rows(rng, fake, start, stop, options):
+    """Rows for user_follows: slice [start, stop) of a seeded permutation over every ordered (followed, follower) pair.
+
+    Nothing proportional to the number of pairs is ever held in memory and the shards can't produce duplicates.
+    """
+    num_users = options["num_users"]
+    pairs = KeyedPermutation(num_users * (num_users - 1), seed=options["seed"])
+    for index in range(start, stop):
+        followed_user, follower = index_to_ordered_pair(pairs[index], num_users)
+        yield dict(user_being_followed_id=followed_user, user_following_id=follower)
+
+
+def follows_rows(rng, fake, start, stop, options):
+    """Rows for follows (user -> rescue org): slice [start, stop) of a seeded permutation over every (user, org) pair"""
+    num_orgs = options["num_orgs"]
+    pairs = KeyedPermutation(options["num_users"] * num_orgs, seed=shard_seed(options["seed"], "follows"))
+    for index in range(start, stop):
+        user_index, org_index = divmod(pairs[index], num_orgs)
+        yield dict(rescue_org_being_followed_id=org_id_for(org_index), user_following_id=user_index + 1)
+
+
+ROW_GENERATORS = {
+    "rescue_org": rescue_org_rows,
+    "users": user_rows,
+    "user_location": user_location_rows,
+    "user_animal_preferences": user_animal_preferences_rows,
+    "matched_rescue_org": matched_rescue_org_rows,
+    "user_travel_preferences": user_travel_preferences_rows,
+    "user_resources": user_resources_rows,
+    "user_residence": user_residence_rows,
+    "user_current_pets": user_current_pets_rows,
+    "user_follows": user_follows_rows,
+    "follows": follows_rows,
+}
+
+
+def generate_shard(table, shard_index, start, stop, shard_path, options):
+    """Worker entry point: write one shard of one table and return its path"""
+    seed = shard_seed(options["seed"], table, shard_index)
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    rows = ROW_GENERATORS[table](rng, fake, start, stop, options)
+    return write_shard_csv(shard_path, CSV_HEADERS[table], rows)
+
+
+def generate_csvs(out_dir=GENERATOR_DIR, num_users=NUM_USERS, num_follows=NUM_FOLLOWS, num_orgs=NUM_ORGS,
+                  num_org_follows=NUM_ORG_FOLLOWS, seed=0, workers=None, shard_size=SHARD_SIZE, tables=None):
+    """Generate the CSVs into out_dir and return {table: csv_path}"""
+    if num_users < 2:
+        raise ValueError("At least 2 users are needed to generate follows.")
+    if num_follows > num_users * (num_users - 1):
+        raise ValueError(f"{num_users} users can only have {num_users * (num_users - 1)} unique follows.")
+    if num_org_follows > num_users * num_orgs:
+        raise ValueError(f"{num_users} users and {num_orgs} orgs can only have {num_users * num_orgs} unique org follows.")
+
+    tables = tables or list(ROW_GENERATORS)
+    options = {
+        "seed": seed,
+        "num_users": num_users,
+        "num_orgs": num_orgs,
+        # anchor timestamps to a fixed date rather than the wall clock so runs are reproducible
+        "now": GENERATED_AT,
+    }
+
+    shard_dir = os.path.join(out_dir, ".shards")
+    os.makedirs(shard_dir, exist_ok=True)
+
+    tasks = []
+    shard_paths = {}
+    totals = {"rescue_org": num_orgs, "user_follows": num_follows, "follows": num_org_follows}
+    for table in tables:
+        total = totals.get(table, num_users)
+        shard_paths[table] = []
+        for shard_index, start, stop in shard_ranges(total, shard_size):
+            shard_path = os.path.join(shard_dir, f"{table}-{shard_index:06d}.csv")
+            shard_paths[table].append(shard_path)
+            tasks.append((generate_shard, (table, shard_index, start, stop, shard_path, options)))
+
+    run_sharded(tasks, workers=workers)
 
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
+    outputs = {}
+    for table in tables:
+        out_path = os.path.join(out_dir, f"{table}.csv")
+        outputs[table] = concat_csv_shards(out_path, CSV_HEADERS[table], shard_paths[table])
+        print(f"Wrote {out_path}")
 
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
+    os.rmdir(shard_dir)
+    return outputs
 
-# Generate follows.csv from random pairings of users
 
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=NUM_USERS, help="number of users (one row per user in every user_* table)")
+    parser.add_argument("--follows", type=int, default=NUM_FOLLOWS, help="number of unique user -> user follows")
+    parser.add_argument("--orgs", type=int, default=NUM_ORGS, help="number of rescue orgs")
+    parser.add_argument("--org-follows", type=int, default=NUM_ORG_FOLLOWS, help="number of unique user -> org follows")
+    parser.add_argument("--seed", type=int, default=0, help="base seed; the same seed always produces the same CSVs")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: number of CPUs, 1 = no pool)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="rows of users/follows per shard")
+    parser.add_argument("--out-dir", default=GENERATOR_DIR, help="where to write the CSVs")
+    parser.add_argument("--tables", nargs="*", choices=list(ROW_GENERATORS), help="only generate these tables")
+    return parser.parse_args()
 
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
 
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+if __name__ == "__main__":
+    args = parse_args()
+    generate_csvs(
+        out_dir=args.out_dir,
+        num_users=args.users,
+        num_follows=args.follows,
+        num_orgs=args.orgs,
+        num_org_follows=args.org_follows,
+        seed=args.seed,
+        workers=args.workers,
+        shard_size=args.shard_size,
+        tables=args.tables,
+    )
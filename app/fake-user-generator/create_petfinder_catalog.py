@@ -0,0 +1,397 @@
+"""Generate Petfinder-shaped animal and organization datasets for benchmarks.
+
+Records follow the field shapes of the Petfinder v2 API (see
+petfinder-API-resp-example.json at the repo root): nested breeds/colors,
+photos in small/medium/large/full, contact address, published_at, distance,
+tags and _links. Sizes and skew are configurable:
+
+    --orgs / --animals      how many of each to generate
+    --org-skew              zipf exponent for animals per org (0 = uniform)
+    --breed-skew            zipf exponent for breed popularity within a type
+    --type-weights          relative weight of each animal type
+    --null-distance         fraction of animals with distance = null
+
+Work is sharded across a process pool and every shard is seeded from --seed,
+so the same arguments give byte-identical output on any number of workers.
+
+    python create_petfinder_catalog.py --orgs 15000 --animals 2000000 --format ndjson
+    python create_petfinder_catalog.py --animals 10000000 --format parquet --workers 16
+"""
+
+import argparse
+import bisect
+import json
+import os
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import accumulate
+from helpers import concat_files, run_sharded, shard_ranges, shard_seed
+
+GENERATOR_DIR = os.path.abspath(os.path.dirname(__file__))
+
+NUM_ORGS = 500
+NUM_ANIMALS = 20_000
+SHARD_SIZE = 100_000
+GENERATED_AT = datetime(2024, 3, 1, tzinfo=timezone.utc)
+PUBLISHED_WITHIN_DAYS = 365
+PHOTO_HOST = "https://dl5zpyw5k3jeb.cloudfront.net"
+PHOTO_WIDTHS = {"small": 100, "medium": 300, "large": 600}
+
+# type -> (relative weight, breeds, colors, coats)
+ANIMAL_TYPES = {
+    "Dog": (45, ["Labrador Retriever", "Pit Bull Terrier", "German Shepherd Dog", "Chihuahua", "Beagle",
+                 "Boxer", "Husky", "Australian Shepherd", "Hound", "Terrier", "Border Collie", "Dachshund",
+                 "Shih Tzu", "Poodle", "Rottweiler", "Great Pyrenees", "Cattle Dog", "Mixed Breed"],
+            ["Black", "Brown / Chocolate", "White / Cream", "Tricolor (Brown, Black, & White)",
+             "Golden", "Red / Chestnut / Orange", "Brindle", "Gray / Blue / Silver", "Merle (Blue)"],
+            ["Hairless", "Short", "Medium", "Long", "Wire", "Curly"]),
+    "Cat": (35, ["Domestic Short Hair", "Domestic Medium Hair", "Domestic Long Hair", "Tabby", "Siamese",
+                 "Tuxedo", "Calico", "Maine Coon", "Russian Blue", "Bengal"],
+            ["Black", "Orange / Red", "Gray / Blue / Silver", "Tabby (Brown / Chocolate)", "Calico",
+             "Tortoiseshell", "White", "Black & White / Tuxedo"],
+            ["Hairless", "Short", "Medium", "Long"]),
+    "Rabbit": (5, ["Lionhead", "Mini Rex", "Dutch", "Lop Eared", "New Zealand", "Rex"],
+               ["Agouti", "Black", "Blue / Gray", "Brown / Chocolate", "White", "Tricolor"],
+               ["Short", "Long"]),
+    "Small & Furry": (4, ["Guinea Pig", "Hamster", "Rat", "Mouse", "Ferret", "Chinchilla", "Gerbil"],
+                      ["Black", "White", "Brown / Chocolate", "Gray / Blue / Silver", "Tricolor"],
+                      ["Short", "Long"]),
+    "Bird": (4, ["Parakeet", "Cockatiel", "Conure", "Lovebird", "Chicken", "Duck", "Parrot"],
+             ["Green", "Yellow", "Blue", "White", "Gray", "Red"], []),
+    "Horse": (2, ["Quarterhorse", "Thoroughbred", "Paint / Pinto", "Pony", "Mustang", "Donkey"],
+              ["Bay", "Chestnut", "Black", "Gray", "Palomino", "Buckskin"], []),
+    "Scales, Fins & Other": (3, ["Turtle", "Bearded Dragon", "Snake", "Gecko", "Iguana", "Fish"],
+                             ["Green", "Brown", "Black", "Yellow", "Red"], []),
+    "Barnyard": (2, ["Goat", "Pig", "Sheep", "Cow", "Alpaca", "Llama"],
+                 ["Black", "White", "Brown", "Pink", "Spotted"], []),
+}
+AGES = [("Baby", 20), ("Young", 35), ("Adult", 35), ("Senior", 10)]
+SIZES = [("Small", 30), ("Medium", 35), ("Large", 28), ("Extra Large", 7)]
+GENDERS = [("Male", 50), ("Female", 48), ("Unknown", 2)]
+TAGS = ["Friendly", "Affectionate", "Playful", "Gentle", "Quiet", "Curious", "Loyal", "Smart", "Funny",
+        "Independent", "Couch Potato", "Active", "Shy", "Dignified", "Protective", "Brave"]
+NAMES = ["Luna", "Bella", "Max", "Charlie", "Daisy", "Milo", "Lucy", "Cooper", "Bailey", "Rocky", "Sadie",
+         "Oliver", "Leo", "Nala", "Simba", "Coco", "Ginger", "Pepper", "Buddy", "Rosie", "Ziggy", "Biscuit",
+         "Maple", "Olive", "Peanut", "Ruby", "Toby", "Willow", "Juniper", "Hazel"]
+ORG_NAME_PARTS = (["Happy Tails", "Second Chance", "Paws & Claws", "Forever Home", "Safe Haven", "New Leash",
+                   "Furry Friends", "Whiskers", "Rescue Ranch", "Hope"],
+                  ["Animal Rescue", "Humane Society", "Animal Shelter", "SPCA", "Pet Adoption Society",
+                   "Rescue Network"])
+# (city, state, country, postcode prefix)
+ORG_LOCATIONS = [
+    ("Toronto", "ON", "CA", "M5V"), ("Ottawa", "ON", "CA", "K1P"), ("Hamilton", "ON", "CA", "L8P"),
+    ("Montreal", "QC", "CA", "H2X"), ("Vancouver", "BC", "CA", "V6B"), ("Calgary", "AB", "CA", "T2P"),
+    ("Edmonton", "AB", "CA", "T5J"), ("Winnipeg", "MB", "CA", "R3C"), ("Halifax", "NS", "CA", "B3H"),
+    ("New York", "NY", "US", "100"), ("Buffalo", "NY", "US", "142"), ("Seattle", "WA", "US", "981"),
+    ("Los Angeles", "CA", "US", "900"), ("San Francisco", "CA", "US", "941"), ("Austin", "TX", "US", "787"),
+    ("Pilot Point", "TX", "US", "762"), ("Chicago", "IL", "US", "606"), ("Boston", "MA", "US", "021"),
+    ("Spanish Fork", "UT", "US", "846"), ("Denver", "CO", "US", "802"),
+]
+
+
+@lru_cache(maxsize=None)
+def zipf_cum_weights(n, skew):
+    """Cumulative zipf weights over ranks 1..n (cached once per worker)"""
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def zipf_index(rng, n, skew):
+    """Draw a 0-based rank from a zipf(skew) distribution over n items"""
+    cum_weights = zipf_cum_weights(n, skew)
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def weighted_choice(rng, choices):
+    return rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices])[0]
+
+
+def slugify(text):
+    """eg. 'Scales, Fins & Other' -> 'scales-fins-other' (the same slugs Petfinder uses for types)"""
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def make_postcode(rng, country, prefix):
+    if country == "CA":
+        return f"{prefix} {rng.randint(0, 9)}{rng.choice('ABCEGHJKLMNPRSTVWXYZ')}{rng.randint(0, 9)}"
+    return f"{prefix}{rng.randint(0, 99):02d}"
+
+
+def make_photos(rng, photo_path, count):
+    photos = []
+    for number in range(1, count + 1):
+        base = f"{PHOTO_HOST}/{photo_path}/{number}/?bust={rng.randint(1_500_000_000, 1_710_000_000)}"
+        photo = {size: f"{base}&width={width}" for size, width in PHOTO_WIDTHS.items()}
+        photo["full"] = base
+        photos.append(photo)
+    return photos
+
+
+@lru_cache(maxsize=4096)
+def make_org(index, seed):
+    """Build organization #index. Seeded per org so any shard can rebuild the same org for animal contacts."""
+    rng = random.Random(shard_seed(seed, "org", index))
+    city, state, country, prefix = ORG_LOCATIONS[index % len(ORG_LOCATIONS)]
+    org_id = f"{state}{index + 1}"
+    name = f"{rng.choice(ORG_NAME_PARTS[0])} {rng.choice(ORG_NAME_PARTS[1])} of {city}"
+    slug = f"{slugify(name)}-{org_id.lower()}"
+    return {
+        "id": org_id,
+        "name": name,
+        "email": f"adopt@{slugify(name)}.org",
+        "phone": f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+        "address": {
+            "address1": None,
+            "address2": None,
+            "city": city,
+            "state": state,
+            "postcode": make_postcode(rng, country, prefix),
+            "country": country,
+        },
+        "hours": {day: None for day in
+                  ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]},
+        "url": f"https://www.petfinder.com/member/{country.lower()}/{state.lower()}/{slugify(city)}/{slug}/",
+        "website": f"https://www.{slugify(name)}.org" if rng.random() < 0.6 else None,
+        "mission_statement": None,
+        "adoption": {"policy": None, "url": None},
+        "social_media": {network: None for network in
+                         ["facebook", "twitter", "youtube", "instagram", "pinterest"]},
+        "photos": make_photos(rng, f"organization-photos/{index + 1}", rng.randint(0, 1)),
+        "distance": None,
+        "_links": {
+            "self": {"href": f"/v2/organizations/{org_id.lower()}"},
+            "animals": {"href": f"/v2/animals?organization={org_id.lower()}"},
+        },
+    }
+
+
+def make_animal(rng, animal_id, options):
+    type_names = list(ANIMAL_TYPES)
+    animal_type = rng.choices(type_names, weights=options["type_weights"])[0]
+    _, breeds, colors, coats = ANIMAL_TYPES[animal_type]
+    org = make_org(zipf_index(rng, options["num_orgs"], options["org_skew"]), options["seed"])
+
+    primary_breed = breeds[zipf_index(rng, len(breeds), options["breed_skew"])]
+    mixed = rng.random() < 0.4
+    unknown = rng.random() < 0.03
+    published_at = GENERATED_AT - timedelta(
+        days=PUBLISHED_WITHIN_DAYS * rng.random() ** 2, seconds=rng.randint(0, 86399)
+    )
+    name = rng.choice(NAMES)
+    type_slug = slugify(animal_type)
+
+    return {
+        "id": animal_id,
+        "organization_id": org["id"],
+        "url": f"https://www.petfinder.com/{type_slug}/{slugify(name)}-{animal_id}/"
+               f"{org['address']['state'].lower()}/{slugify(org['address']['city'])}/{org['id'].lower()}/",
+        "type": animal_type,
+        "species": animal_type,
+        "breeds": {
+            "primary": primary_breed,
+            "secondary": rng.choice(breeds) if mixed and rng.random() < 0.5 else None,
+            "mixed": mixed,
+            "unknown": unknown,
+        },
+        "colors": {
+            "primary": rng.choice(colors) if rng.random() < 0.85 else None,
+            "secondary": rng.choice(colors) if rng.random() < 0.3 else None,
+            "tertiary": None,
+        },
+        "age": weighted_choice(rng, AGES),
+        "gender": weighted_choice(rng, GENDERS),
+        "size": weighted_choice(rng, SIZES),
+        "coat": rng.choice(coats) if coats and rng.random() < 0.7 else None,
+        "attributes": {
+            "spayed_neutered": rng.random() < 0.7,
+            "house_trained": rng.random() < 0.5,
+            "declawed": rng.random() < 0.05 if animal_type == "Cat" else None,
+            "special_needs": rng.random() < 0.08,
+            "shots_current": rng.random() < 0.8,
+        },
+        "environment": {
+            "children": rng.choice([True, False, None]),
+            "dogs": rng.choice([True, False, None]),
+            "cats": rng.choice([True, False, None]),
+        },
+        "tags": rng.sample(TAGS, rng.randint(0, 4)),
+        "name": name,
+        "description": f"{name} is a {primary_breed.lower()} looking for a forever home.",
+        "organization_animal_id": None,
+        "photos": make_photos(rng, f"photos/pets/{animal_id}", rng.choice([0, 1, 1, 2, 3, 4])),
+        "videos": [],
+        "status": "adoptable",
+        "status_changed_at": published_at.strftime("%Y-%m-%dT%H:%M:%S+0000"),
+        "published_at": published_at.strftime("%Y-%m-%dT%H:%M:%S+0000"),
+        "distance": None if rng.random() < options["null_distance"] else round(rng.expovariate(1 / 40), 4),
+        "contact": {
+            "email": org["email"],
+            "phone": org["phone"],
+            "address": dict(org["address"]),
+        },
+        "_links": {
+            "self": {"href": f"/v2/animals/{animal_id}"},
+            "type": {"href": f"/v2/types/{type_slug}"},
+            "organization": {"href": f"/v2/organizations/{org['id'].lower()}"},
+        },
+    }
+
+
+def shard_records(kind, shard_index, start, stop, options):
+    if kind == "organizations":
+        for index in range(start, stop):
+            yield make_org(index, options["seed"])
+    else:
+        rng = random.Random(shard_seed(options["seed"], kind, shard_index))
+        for index in range(start, stop):
+            yield make_animal(rng, options["first_animal_id"] + index, options)
+
+
+def arrow_schema(kind):
+    """Explicit schema so every parquet part agrees even when a shard happens to have only nulls in a column"""
+    import pyarrow as pa
+
+    string, boolean = pa.string(), pa.bool_()
+    photo = pa.struct([(size, string) for size in ["small", "medium", "large", "full"]])
+    address = pa.struct([(key, string) for key in
+                         ["address1", "address2", "city", "state", "postcode", "country"]])
+    href = pa.struct([("href", string)])
+    if kind == "organizations":
+        return pa.schema([
+            ("id", string), ("name", string), ("email", string), ("phone", string), ("address", address),
+            ("hours", pa.struct([(day, string) for day in
+                                 ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+                                  "sunday"]])),
+            ("url", string), ("website", string), ("mission_statement", string),
+            ("adoption", pa.struct([("policy", string), ("url", string)])),
+            ("social_media", pa.struct([(network, string) for network in
+                                        ["facebook", "twitter", "youtube", "instagram", "pinterest"]])),
+            ("photos", pa.list_(photo)), ("distance", pa.float64()),
+            ("_links", pa.struct([("self", href), ("animals", href)])),
+        ])
+    return pa.schema([
+        ("id", pa.int64()), ("organization_id", string), ("url", string), ("type", string),
+        ("species", string),
+        ("breeds", pa.struct([("primary", string), ("secondary", string), ("mixed", boolean),
+                              ("unknown", boolean)])),
+        ("colors", pa.struct([("primary", string), ("secondary", string), ("tertiary", string)])),
+        ("age", string), ("gender", string), ("size", string), ("coat", string),
+        ("attributes", pa.struct([(key, boolean) for key in
+                                  ["spayed_neutered", "house_trained", "declawed", "special_needs",
+                                   "shots_current"]])),
+        ("environment", pa.struct([("children", boolean), ("dogs", boolean), ("cats", boolean)])),
+        ("tags", pa.list_(string)), ("name", string), ("description", string),
+        ("organization_animal_id", string), ("photos", pa.list_(photo)), ("videos", pa.list_(string)),
+        ("status", string), ("status_changed_at", string), ("published_at", string),
+        ("distance", pa.float64()),
+        ("contact", pa.struct([("email", string), ("phone", string), ("address", address)])),
+        ("_links", pa.struct([("self", href), ("type", href), ("organization", href)])),
+    ])
+
+
+def generate_shard(kind, shard_index, start, stop, shard_path, output_format, options):
+    """Worker entry point: write one shard of records and return its path"""
+    records = shard_records(kind, shard_index, start, stop, options)
+
+    if output_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(list(records), schema=arrow_schema(kind))
+        pq.write_table(table, shard_path, compression="zstd")
+        return shard_path
+
+    with open(shard_path, "w") as shard_file:
+        for record in records:
+            shard_file.write(json.dumps(record, separators=(",", ":")))
+            shard_file.write("\n")
+    return shard_path
+
+
+def generate_catalog(out_dir=GENERATOR_DIR, num_orgs=NUM_ORGS, num_animals=NUM_ANIMALS, output_format="ndjson",
+                     org_skew=1.1, breed_skew=1.0, type_weights=None, null_distance=0.3, seed=0,
+                     first_animal_id=10_000_000, workers=None, shard_size=SHARD_SIZE):
+    """Generate organizations and animals and return {kind: output path}
+
+    NDJSON output is one file per kind; parquet output is one directory of part files per kind.
+    """
+    if output_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow")
+    if num_orgs < 1:
+        raise ValueError("At least 1 organization is needed to own the animals.")
+
+    options = {
+        "seed": seed,
+        "num_orgs": num_orgs,
+        "org_skew": org_skew,
+        "breed_skew": breed_skew,
+        "type_weights": type_weights or [weight for weight, *_ in ANIMAL_TYPES.values()],
+        "null_distance": null_distance,
+        "first_animal_id": first_animal_id,
+    }
+    if len(options["type_weights"]) != len(ANIMAL_TYPES):
+        raise ValueError(f"type_weights needs one weight per type: {list(ANIMAL_TYPES)}")
+
+    extension = "parquet" if output_format == "parquet" else "ndjson"
+    tasks = []
+    shard_paths = {}
+    for kind, total in [("organizations", num_orgs), ("animals", num_animals)]:
+        shard_dir = os.path.join(out_dir, f"{kind}.parquet" if output_format == "parquet" else ".shards")
+        os.makedirs(shard_dir, exist_ok=True)
+        shard_paths[kind] = []
+        for shard_index, start, stop in shard_ranges(total, shard_size):
+            shard_path = os.path.join(shard_dir, f"{kind}-{shard_index:06d}.{extension}")
+            shard_paths[kind].append(shard_path)
+            tasks.append((generate_shard, (kind, shard_index, start, stop, shard_path, output_format, options)))
+
+    run_sharded(tasks, workers=workers)
+
+    outputs = {}
+    for kind in shard_paths:
+        if output_format == "parquet":
+            outputs[kind] = os.path.join(out_dir, f"{kind}.parquet")
+        else:
+            outputs[kind] = concat_files(os.path.join(out_dir, f"{kind}.ndjson"), shard_paths[kind])
+        print(f"Wrote {outputs[kind]}")
+
+    if output_format != "parquet":
+        os.rmdir(os.path.join(out_dir, ".shards"))
+    return outputs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orgs", type=int, default=NUM_ORGS)
+    parser.add_argument("--animals", type=int, default=NUM_ANIMALS)
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    parser.add_argument("--org-skew", type=float, default=1.1, help="zipf exponent for animals per org")
+    parser.add_argument("--breed-skew", type=float, default=1.0, help="zipf exponent for breed popularity")
+    parser.add_argument("--type-weights", type=float, nargs=len(ANIMAL_TYPES), metavar="W",
+                        help=f"relative weights for {list(ANIMAL_TYPES)}")
+    parser.add_argument("--null-distance", type=float, default=0.3, help="fraction of animals with distance=null")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (1 = no pool)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--out-dir", default=GENERATOR_DIR)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    generate_catalog(
+        out_dir=args.out_dir,
+        num_orgs=args.orgs,
+        num_animals=args.animals,
+        output_format=args.format,
+        org_skew=args.org_skew,
+        breed_skew=args.breed_skew,
+        type_weights=args.type_weights,
+        null_distance=args.null_distance,
+        seed=args.seed,
+        workers=args.workers,
+        shard_size=args.shard_size,
+    )
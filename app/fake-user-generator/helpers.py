@@ -1,14 +1,139 @@
 """Support functions for CSV generation."""
 
+import csv
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from random import uniform
+import random
 
 
-def get_random_datetime(year_gap=2):
-    """Get a random datetime within the last few years."""
+def get_random_datetime(year_gap=2, rng=None, now=None):
+    """Get a random datetime within the last few years.
 
-    now = datetime.now()
+    Args:
+        year_gap (INT): how many years back the random datetime can go
+        rng (random.Random, optional): seeded generator to draw from. Defaults to the module level generator.
+        now (datetime, optional): fixed anchor for "now" so that seeded runs are reproducible. Defaults to datetime.now()
+    """
+
+    rng = rng or random
+    now = now or datetime.now()
     then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+    random_timestamp = rng.uniform(then.timestamp(), now.timestamp())
 
     return datetime.fromtimestamp(random_timestamp)
+
+
+def shard_seed(seed, *parts):
+    """Derive a deterministic 64-bit seed for one shard of work.
+
+    The same (seed, *parts) always returns the same value, no matter which process or in which order the shard runs.
+    eg. shard_seed(42, "users", 3)
+    """
+    key = ":".join(str(part) for part in (seed, *parts)).encode("utf8")
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], "big")
+
+
+def shard_ranges(total, shard_size):
+    """Split range(total) into (shard_index, start, stop) tuples of at most shard_size items."""
+    for shard_index, start in enumerate(range(0, total, shard_size)):
+        yield shard_index, start, min(start + shard_size, total)
+
+
+class KeyedPermutation:
+    """Pseudo-random permutation of range(domain_size) that never materializes the range.
+
+    Uses a small Feistel network keyed from the seed plus cycle-walking, so permutation[i] is computed in O(1) memory
+    and every index maps to a unique value. Taking the first k items gives k unique samples from the domain, and
+    any slice of indexes can be computed independently by a different process.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, domain_size, seed):
+        if domain_size < 1:
+            raise ValueError("domain_size must be at least 1")
+        self.domain_size = domain_size
+        bits = max(2, (domain_size - 1).bit_length())
+        # Feistel halves need an even number of bits
+        bits += bits % 2
+        self.half_bits = bits // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.round_keys = [
+            shard_seed(seed, "feistel", round_number) for round_number in range(self.ROUNDS)
+        ]
+
+    def _round(self, value, key):
+        mixed = ((value ^ key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return (mixed ^ (mixed >> 29)) & self.half_mask
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for key in self.round_keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def __len__(self):
+        return self.domain_size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.domain_size:
+            raise IndexError(index)
+        # cycle-walk: the cipher permutes [0, 2**bits), keep going until we land back inside the domain
+        value = self._encrypt(index)
+        while value >= self.domain_size:
+            value = self._encrypt(value)
+        return value
+
+
+def index_to_ordered_pair(index, n):
+    """Map an index in range(n * (n - 1)) to a unique ordered pair (a, b) of ids in 1..n with a != b."""
+    first, second = divmod(index, n - 1)
+    if second >= first:
+        second += 1
+    return first + 1, second + 1
+
+
+def write_shard_csv(path, fieldnames, rows):
+    """Write rows (an iterable of dicts) to a header-less CSV shard file and return the path."""
+    with open(path, "w", newline="") as shard_file:
+        writer = csv.DictWriter(shard_file, fieldnames=fieldnames)
+        for row in rows:
+            writer.writerow(row)
+    return path
+
+
+def concat_csv_shards(out_path, fieldnames, shard_paths):
+    """Stream the shard files (in order) into one CSV with a header, then delete the shards."""
+    with open(out_path, "w", newline="") as out_file:
+        csv.DictWriter(out_file, fieldnames=fieldnames).writeheader()
+        for shard_path in shard_paths:
+            with open(shard_path, newline="") as shard_file:
+                shutil.copyfileobj(shard_file, out_file)
+            os.remove(shard_path)
+    return out_path
+
+
+def concat_files(out_path, shard_paths):
+    """Stream shard files (in order) into out_path byte for byte, then delete the shards."""
+    with open(out_path, "wb") as out_file:
+        for shard_path in shard_paths:
+            with open(shard_path, "rb") as shard_file:
+                shutil.copyfileobj(shard_file, out_file)
+            os.remove(shard_path)
+    return out_path
+
+
+def run_sharded(tasks, workers=None):
+    """Run (func, args) tasks across a process pool and return their results in task order.
+
+    workers=1 runs everything in the current process, which is handy for debugging.
+    """
+    if workers == 1:
+        return [func(*args) for func, args in tasks]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(func, *args) for func, args in tasks]
+        return [future.result() for future in futures]
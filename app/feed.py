@@ -0,0 +1,186 @@
+"""Home timeline of newly listed animals from the rescue orgs a user follows.
+
+Fan-out-on-write: when the sync job stores newly listed animals,
+fan_out_new_animals copies each one into the timeline (feed_entries) of
+every follower of its org, in one set-based INSERT ... SELECT per batch.
+Reading a page of the home feed is then one range scan of feed_entries by
+its primary key (user_id, published_at, animal_id).
+
+Orgs with more than FEED_FANOUT_MAX_FOLLOWERS followers are skipped at write
+time, since copying every animal into that many timelines costs more than it
+saves. Their animals are merged in at read time from the animals table
+instead (fan-out-on-read), only for users who follow such an org.
+
+Timelines are trimmed to FEED_MAX_ENTRIES after each fan-out and paged with
+an opaque cursor rather than an offset.
+"""
+
+import base64
+import heapq
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import DateTime, Integer, String, column, delete, func, select, tuple_, values
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Animal, FeedEntry, Follows, RescueOrganization
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def encode_cursor(published_at, animal_id):
+    """Opaque cursor pointing just past an animal in a timeline"""
+    raw = f"{published_at.isoformat()}|{animal_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into (published_at, animal_id). Returns None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        published_at, animal_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf8").split("|")
+        return datetime.fromisoformat(published_at), int(animal_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def get_fanout_max_followers():
+    return current_app.config.get("FEED_FANOUT_MAX_FOLLOWERS", 10000)
+
+
+def fan_out_new_animals(animals):
+    """Copy newly listed animals into the timelines of their orgs' followers.
+
+    Args:
+        animals (LIST of Animal): animals that were new in this sync
+
+    Returns: number of feed entries written
+    """
+    if not animals:
+        return 0
+
+    org_ids = {animal.organization_id for animal in animals}
+    large_org_ids = set(
+        db.session.scalars(
+            select(RescueOrganization.id).where(
+                RescueOrganization.id.in_(org_ids),
+                RescueOrganization.followers_count > get_fanout_max_followers(),
+            )
+        )
+    )
+    fan_out = [animal for animal in animals if animal.organization_id not in large_org_ids]
+
+    written = 0
+    for start in range(0, len(fan_out), FANOUT_BATCH_SIZE):
+        batch = fan_out[start:start + FANOUT_BATCH_SIZE]
+        new_animals = values(
+            column("animal_id", Integer),
+            column("organization_id", String),
+            column("published_at", DateTime(timezone=True)),
+            name="new_animals",
+        ).data([(animal.id, animal.organization_id, animal.published_at) for animal in batch])
+
+        # every (follower, new animal) pair in one statement
+        followers_x_animals = select(
+            Follows.user_following_id,
+            new_animals.c.published_at,
+            new_animals.c.animal_id,
+            new_animals.c.organization_id,
+        ).join(new_animals, Follows.rescue_org_being_followed_id == new_animals.c.organization_id)
+
+        result = db.session.execute(
+            insert(FeedEntry)
+            .from_select(["user_id", "published_at", "animal_id", "organization_id"], followers_x_animals)
+            .on_conflict_do_nothing()
+        )
+        written += result.rowcount
+
+    trim_timelines(org_ids - large_org_ids)
+    return written
+
+
+def trim_timelines(org_ids):
+    """Drop the oldest entries past FEED_MAX_ENTRIES from the timelines of these orgs' followers"""
+    if not org_ids:
+        return
+
+    followers = select(Follows.user_following_id).where(Follows.rescue_org_being_followed_id.in_(org_ids))
+    ranked = (
+        select(
+            FeedEntry.user_id,
+            FeedEntry.published_at,
+            FeedEntry.animal_id,
+            func.row_number()
+            .over(
+                partition_by=FeedEntry.user_id,
+                order_by=(FeedEntry.published_at.desc(), FeedEntry.animal_id.desc()),
+            )
+            .label("position"),
+        )
+        .where(FeedEntry.user_id.in_(followers))
+        .subquery()
+    )
+    overflow = select(ranked.c.user_id, ranked.c.published_at, ranked.c.animal_id).where(
+        ranked.c.position > current_app.config.get("FEED_MAX_ENTRIES", 500)
+    )
+    db.session.execute(
+        delete(FeedEntry).where(
+            tuple_(FeedEntry.user_id, FeedEntry.published_at, FeedEntry.animal_id).in_(overflow)
+        )
+    )
+
+
+def get_timeline(user, cursor=None, limit=None):
+    """Get one page of a user's home timeline, newest first.
+
+    Args:
+        user (User): logged in user
+        cursor (STR, optional): next_cursor from the previous page
+        limit (INT, optional): page size, defaults to FEED_PAGE_SIZE
+
+    Returns: OBJECT = {
+        "animals": [Animal, ...],
+        "next_cursor": STR or None if this is the last page
+    }
+    """
+    limit = limit or current_app.config.get("FEED_PAGE_SIZE", 20)
+    position = decode_cursor(cursor)
+
+    # fan-out-on-write entries: one range scan of the feed_entries primary key
+    pushed_query = select(FeedEntry).where(FeedEntry.user_id == user.id)
+    if position:
+        pushed_query = pushed_query.where(tuple_(FeedEntry.published_at, FeedEntry.animal_id) < position)
+    pushed_query = pushed_query.order_by(FeedEntry.published_at.desc(), FeedEntry.animal_id.desc()).limit(limit)
+    pushed = [entry.animal for entry in db.session.scalars(pushed_query)]
+
+    # fan-out-on-read: only users following a very large org pay for this query
+    pulled = []
+    if user.orgs_following_count:
+        large_org_ids = (
+            select(Follows.rescue_org_being_followed_id)
+            .join(RescueOrganization, RescueOrganization.id == Follows.rescue_org_being_followed_id)
+            .where(
+                Follows.user_following_id == user.id,
+                RescueOrganization.followers_count > get_fanout_max_followers(),
+            )
+        )
+        pulled_query = select(Animal).where(Animal.organization_id.in_(large_org_ids), Animal.removed_at.is_(None))
+        if position:
+            pulled_query = pulled_query.where(tuple_(Animal.published_at, Animal.id) < position)
+        pulled_query = pulled_query.order_by(Animal.published_at.desc(), Animal.id.desc()).limit(limit)
+        pulled = list(db.session.scalars(pulled_query))
+
+    merged = heapq.merge(pushed, pulled, key=lambda animal: (animal.published_at, animal.id), reverse=True)
+    animals = []
+    seen_ids = set()
+    # an org that crossed the threshold can have an animal in both lists
+    for animal in merged:
+        if animal.id not in seen_ids:
+            seen_ids.add(animal.id)
+            animals.append(animal)
+        if len(animals) == limit:
+            break
+
+    next_cursor = encode_cursor(animals[-1].published_at, animals[-1].id) if len(animals) == limit else None
+    return {"animals": animals, "next_cursor": next_cursor}
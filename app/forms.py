@@ -2,7 +2,7 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, TextAreaField
 from wtforms.validators import DataRequired, Email, Length
 from wtforms_alchemy import model_form_factory
-from .models import db, User
+from models import db, User
 
 class MessageForm(FlaskForm):
     """Form for adding/editing messages."""
@@ -20,6 +20,8 @@ class UserAddForm(ModelForm):
     """Form for adding users."""
     class Meta:
         model = User
+        # wtforms_alchemy has no field type for ARRAY columns
+        exclude = ["rescue_action_type", "animal_types"]
 
 
 
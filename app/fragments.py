@@ -0,0 +1,223 @@
+"""Cache of rendered HTML fragments: animal cards and search result widgets.
+
+The same cards and widgets are rendered for thousands of visitors, so their
+HTML is kept in a per-process LRU with a TTL. Every key includes:
+
+    the template name and version   a hash of the template source, so editing a
+                                    partial can't serve HTML from the old one
+    the locale                      the best of FRAGMENT_CACHE_LOCALES the browser accepts
+    the content key                 for cards, the animal id and its content hash;
+                                    for widgets, a normalized search key (see search_key)
+
+A page of cached cards renders as a string join:
+
+    {{ cached_cards(feed.animals) }}
+    {{ cached_fragment("partials/<widget>.html", key=search_key(location=..., type=...), animal_ids=[...], ...) }}
+
+Invalidation when the sync job (sync.py) changes animals:
+
+    - a card is keyed by its animal's content hash, so a changed animal gets a
+      new card in every process
+    - fragments are tagged with the animals they show; the sync job drops the
+      tags of changed and removed animals, and every widget, in its own process
+    - other processes notice a finished sync pass through
+      SyncCheckpoint.completed_at (checked every check_seconds) and drop every
+      widget; the TTL bounds staleness for anything else
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_request_context, render_template, request
+from markupsafe import Markup
+from sqlalchemy import func, select
+
+from models import db, SyncCheckpoint
+
+CARD_TEMPLATE = "partials/animal_card.html"
+# tag of every fragment keyed by a search rather than by the animals in it
+SEARCH_TAG = "search"
+
+
+def search_key(**params):
+    """Hashable key of search parameters that ignores order, case, blanks and repeated values.
+
+    search_key(type=["Dog", "cat"], location=" Toronto,ON ") == search_key(location="toronto,on", type=["Cat", "dog"])
+    """
+    items = []
+    for name, value in params.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        values = sorted({str(value).strip().lower() for value in values if value not in (None, "")})
+        if values:
+            items.append((name, tuple(values)))
+    return tuple(sorted(items))
+
+
+def animal_identity(animal):
+    """(id, content version) of an Animal row or an API animal record"""
+    if isinstance(animal, dict):
+        content = json.dumps(animal, sort_keys=True, default=str).encode("utf8")
+        return animal["id"], hashlib.md5(content).hexdigest()
+    return animal.id, animal.content_hash
+
+
+class FragmentCache:
+    """Flask extension: LRU + TTL cache of rendered template fragments; see the module docstring"""
+
+    def __init__(self, app=None):
+        self.max_entries = 5000
+        self.ttl = 300
+        self.locales = ("en",)
+        self.check_seconds = 60
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires at, html, tags), least recently used first
+        self._entries = OrderedDict()
+        # tag -> keys of the fragments carrying it
+        self._tags = {}
+        # template name -> (version, uptodate function from the Jinja loader)
+        self._versions = {}
+        self._sync_generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("FRAGMENT_CACHE_MAX_ENTRIES", self.max_entries)
+        self.ttl = app.config.get("FRAGMENT_CACHE_TTL", self.ttl)
+        self.locales = tuple(app.config.get("FRAGMENT_CACHE_LOCALES", self.locales))
+        app.add_template_global(self.cards, "cached_cards")
+        app.add_template_global(self.render, "cached_fragment")
+        app.add_template_global(search_key)
+        app.extensions["fragment_cache"] = self
+
+    ##########################################################################
+    # Keys
+
+    def template_version(self, template_name):
+        """Short hash of a template's source; re-read only when template auto-reload is on and the file changed"""
+        version, uptodate = self._versions.get(template_name, (None, None))
+        if version is None or (current_app.jinja_env.auto_reload and uptodate is not None and not uptodate()):
+            jinja_env = current_app.jinja_env
+            source, _, uptodate = jinja_env.loader.get_source(jinja_env, template_name)
+            version = hashlib.md5(source.encode("utf8")).hexdigest()[:12]
+            self._versions[template_name] = (version, uptodate)
+        return version
+
+    def locale(self):
+        if not has_request_context():
+            return self.locales[0]
+        return request.accept_languages.best_match(self.locales) or self.locales[0]
+
+    ##########################################################################
+    # Storage
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, html, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, html, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        """Remove one fragment and its tag index entries; the caller holds the lock"""
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tags):
+        """Drop every fragment carrying any of tags"""
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def invalidate_animals(self, animal_ids):
+        """Drop the fragments showing these animals, and every search widget (which animals match may have changed)"""
+        self.invalidate([SEARCH_TAG, *(f"animal:{animal_id}" for animal_id in animal_ids)])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _check_sync(self):
+        """Drop every search widget once another process has finished a sync pass"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_seconds:
+            return
+        self._checked_at = now
+        generation = db.session.scalar(select(func.max(SyncCheckpoint.completed_at)))
+        if generation != self._sync_generation:
+            if self._sync_generation is not None:
+                self.invalidate([SEARCH_TAG])
+            self._sync_generation = generation
+
+    ##########################################################################
+    # Rendering
+
+    def render(self, template_name, key, animal_ids=(), **context):
+        """A template rendered with context, cached under key.
+
+        Args:
+            template_name (STR): the fragment's template
+            key (TUPLE): everything the output depends on besides the template and locale, eg. search_key(...)
+            animal_ids (LIST, optional): animals shown, so the sync job can invalidate the fragment
+
+        Returns: Markup
+        """
+        self._check_sync()
+        full_key = (template_name, self.template_version(template_name), self.locale(), key)
+        html = self.get(full_key)
+        if html is None:
+            html = render_template(template_name, **context)
+            tags = [SEARCH_TAG, *(f"animal:{animal_id}" for animal_id in animal_ids)]
+            self.set(full_key, html, tags)
+        return Markup(html)
+
+    def cards(self, animals, template_name=CARD_TEMPLATE):
+        """Every animal's card, each rendered once per version of the animal and then reused.
+
+        The card template gets only `animal`, so it can't vary by visitor.
+
+        Returns: Markup
+        """
+        version = self.template_version(template_name)
+        locale = self.locale()
+        parts = []
+        for animal in animals:
+            animal_id, content_version = animal_identity(animal)
+            key = (template_name, version, locale, animal_id, content_version)
+            html = self.get(key)
+            if html is None:
+                html = render_template(template_name, animal=animal)
+                self.set(key, html, [f"animal:{animal_id}"])
+            parts.append(html)
+        return Markup("".join(parts))
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,302 @@
+"""Local geospatial index of rescue organizations.
+
+Answers "which orgs are within R km of here" and "which k orgs are closest"
+without calling Petfinder. Orgs are bucketed into a fixed lat/lon grid, so a
+query only looks at the cells that can contain a match and computes
+great-circle distances for those few orgs.
+
+Coordinates come from the org's postcode or city, resolved by the offline
+geocoder (see geocoder.py). An org it can only place at its province/state's
+centre isn't indexed: distances to it would look exact but could be off by
+hundreds of km.
+"""
+
+import math
+import threading
+
+from geocoder import CITY, geocoder
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.195
+# Petfinder's distances (animal["distance"], the distance search parameter) are in miles
+KM_PER_MILE = 1.609344
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two points given in degrees"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+##############################################################################
+# Locations
+
+
+def guess_postcode_country(postcode):
+    """Petfinder location strings don't always say which country a postcode is in"""
+    compact = postcode.replace(" ", "")
+    if compact[:5].isdigit():
+        return "US"
+    if len(compact) in (3, 6) and compact[0].isalpha() and compact[1].isdigit():
+        return "CA"
+    return None
+
+
+def resolve_location(location, country=None):
+    """Resolve a Petfinder style location string to (lat, lon) without the network.
+
+    Handles "latitude,longitude", "city,state" (eg. "Toronto,ON") and postal
+    codes. Returns None for anything else, including a city the geocoder
+    doesn't know (rather than its state's centre).
+    """
+    if not location:
+        return None
+    location = location.strip()
+
+    parts = [part.strip() for part in location.split(",")]
+    if len(parts) == 2:
+        try:
+            return float(parts[0]), float(parts[1])
+        except ValueError:
+            pass
+        city, state = parts
+        # "city,state" doesn't say which country; the state code usually does
+        countries = [country] if country else [code for code in ("CA", "US") if geocoder.has_state(code, state)]
+        for code in countries:
+            coords = geocoder.geocode(code, state=state, city=city, min_precision=CITY)
+            if coords:
+                return coords
+        return None
+
+    country = country or guess_postcode_country(location)
+    return geocoder.geocode(country, postcode=location) if country else None
+
+
+##############################################################################
+# Grid index
+
+
+class GeoIndex:
+    """Points bucketed into a lat/lon grid of roughly cell_km x cell_km cells.
+
+    add() is O(1); within() only scans the cells in the bounding box of the
+    search circle and nearest() grows that circle until it holds k points,
+    so queries stay well under a millisecond for tens of thousands of orgs.
+    """
+
+    def __init__(self, cell_km=25):
+        self.cell_deg = cell_km / KM_PER_DEGREE_LAT
+        self.lon_cells = math.ceil(360 / self.cell_deg)
+        self._cells = {}
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell(self, lat, lon):
+        return (
+            math.floor((lat + 90) / self.cell_deg),
+            math.floor((lon + 180) / self.cell_deg) % self.lon_cells,
+        )
+
+    def get(self, key):
+        """(lat, lon) of a point or None"""
+        return self._points.get(key)
+
+    def add(self, key, lat, lon):
+        self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(key)
+
+    def remove(self, key):
+        point = self._points.pop(key, None)
+        if point:
+            cell = self._cell(*point)
+            self._cells[cell].discard(key)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def _candidate_keys(self, lat, lon, radius_km):
+        """Keys in every cell of the lat/lon bounding box around a circle of radius_km"""
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        worst_lat = min(90.0, abs(lat) + lat_span)
+        cos_lat = math.cos(math.radians(worst_lat))
+        lon_span = 180.0 if cos_lat < 1e-6 else min(180.0, lat_span / cos_lat)
+
+        min_lat_cell, min_lon_cell = self._cell(max(-90.0, lat - lat_span), lon - lon_span)
+        max_lat_cell, _ = self._cell(min(90.0, lat + lat_span), lon)
+        lon_cell_count = min(self.lon_cells, math.ceil(2 * lon_span / self.cell_deg) + 2)
+
+        for lat_cell in range(min_lat_cell, max_lat_cell + 1):
+            for lon_offset in range(lon_cell_count):
+                keys = self._cells.get((lat_cell, (min_lon_cell + lon_offset) % self.lon_cells))
+                if keys:
+                    yield from keys
+
+    def within(self, lat, lon, radius_km):
+        """All points within radius_km, as a list of (distance_km, key) sorted nearest first"""
+        matches = []
+        for key in self._candidate_keys(lat, lon, radius_km):
+            distance = haversine_km(lat, lon, *self._points[key])
+            if distance <= radius_km:
+                matches.append((distance, key))
+        return sorted(matches)
+
+    def nearest(self, lat, lon, k=10):
+        """The k closest points, as a list of (distance_km, key) sorted nearest first"""
+        if not self._points or k <= 0:
+            return []
+        # grow the search circle until it holds k points; within() is exact, so those are the k nearest
+        radius_km = self.cell_deg * KM_PER_DEGREE_LAT
+        while radius_km < math.pi * EARTH_RADIUS_KM:
+            matches = self.within(lat, lon, radius_km)
+            if len(matches) >= k:
+                return matches[:k]
+            radius_km *= 2
+        return self.within(lat, lon, math.pi * EARTH_RADIUS_KM)[:k]
+
+
+##############################################################################
+# Org index
+
+
+def org_coordinates(org):
+    """(lat, lon) of a Petfinder organization dict or RescueOrganization row, or None if it can't be placed by postcode or city"""
+    if isinstance(org, dict):
+        address = org.get("address") or {}
+        return geocoder.geocode(
+            address.get("country"), address.get("state"), address.get("city"), address.get("postcode"),
+            min_precision=CITY,
+        )
+    if org.latitude is not None and org.longitude is not None:
+        return org.latitude, org.longitude
+    return geocoder.geocode(org.country, org.state, org.city, org.postcode, min_precision=CITY)
+
+
+class OrgGeoIndex(GeoIndex):
+    """GeoIndex of rescue orgs keyed by Petfinder org id, loaded from the database on first use"""
+
+    def __init__(self, cell_km=25):
+        super().__init__(cell_km=cell_km)
+        self.loaded = False
+        self._load_lock = threading.Lock()
+
+    def add_org(self, org):
+        """Index an org (API dict or RescueOrganization row). Returns its (lat, lon) or None if it couldn't be placed."""
+        coords = org_coordinates(org)
+        if coords:
+            self.add(org["id"] if isinstance(org, dict) else org.id, *coords)
+        return coords
+
+    def load(self):
+        """(Re)build the index from every RescueOrganization with a usable location"""
+        from models import RescueOrganization
+
+        with self._load_lock:
+            self._cells = {}
+            self._points = {}
+            for org in RescueOrganization.query.yield_per(1000):
+                self.add_org(org)
+            self.loaded = True
+        return self
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+        return self
+
+    def distance_to_org(self, lat, lon, org_id):
+        """km from (lat, lon) to an indexed org, or None if the org isn't indexed"""
+        point = self.ensure_loaded().get(org_id)
+        return haversine_km(lat, lon, *point) if point else None
+
+
+org_index = OrgGeoIndex()
+
+
+def haversine_km_many(lat, lon, lats, lons):
+    """Great-circle distance in km from one point to arrays of points, in one vectorized NumPy pass.
+
+    NaN coordinates give NaN distances.
+    """
+    import numpy as np
+
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def animal_addresses(animals):
+    """(country, state, city, postcode) of each parsed animal's contact address, for geocoder.geocode_many"""
+    addresses = []
+    for animal in animals:
+        address = (animal.get("contact") or {}).get("address") or {}
+        addresses.append((address.get("country"), address.get("state"), address.get("city"), address.get("postcode")))
+    return addresses
+
+
+def animal_coordinates_many(animals):
+    """(lats, lons) arrays for parsed animals: their org's indexed location, else their contact address.
+
+    Animals whose org isn't indexed are geocoded in one bulk lookup; NaN where neither works, or
+    where only the address's state matched, so no animal gets a distance to a state's centre.
+    """
+    org_index.ensure_loaded()
+    lats, lons, precisions = geocoder.geocode_many(animal_addresses(animals))
+    imprecise = precisions < CITY
+    lats[imprecise] = lons[imprecise] = float("nan")
+    for position, animal in enumerate(animals):
+        point = org_index.get(animal.get("organization_id"))
+        if point:
+            lats[position], lons[position] = point
+    return lats, lons
+
+
+def animal_coordinates(animal):
+    """(lat, lon) of one parsed animal or None; see animal_coordinates_many"""
+    lats, lons = animal_coordinates_many([animal])
+    return None if math.isnan(lats[0]) else (float(lats[0]), float(lons[0]))
+
+
+def compute_distances(animals, origin):
+    """km from origin to every animal's org, as a list aligned with animals (None where it can't be placed by postcode or city)"""
+    import numpy as np
+
+    if not animals:
+        return []
+    lats, lons = animal_coordinates_many(animals)
+    distances = np.round(haversine_km_many(origin[0], origin[1], lats, lons), 2)
+    return [None if np.isnan(distance) else float(distance) for distance in distances]
+
+
+def set_distances(animals, origin):
+    """Overwrite animal["distance"] with the distance in miles from origin, eg. when cached results are reused for a new origin.
+
+    Miles, like the distances Petfinder returns, so locally placed and API placed animals sort together.
+    """
+    if not origin:
+        return animals
+    for animal, distance in zip(animals, compute_distances(animals, origin)):
+        animal["distance"] = None if distance is None else round(distance / KM_PER_MILE, 2)
+    return animals
+
+
+def fill_missing_distances(animals, origin):
+    """Set animal["distance"] (miles) only for parsed animals the API returned without one.
+
+    Args:
+        animals (LIST of DICTS): parsed animals
+        origin (TUPLE): (lat, lon) the search was made from
+    """
+    if not origin:
+        return animals
+    set_distances([animal for animal in animals if animal.get("distance") is None], origin)
+    return animals
@@ -0,0 +1,240 @@
+"""Offline geocoder: (country, state, city or postcode) -> (lat, lon) without the network.
+
+The bundled tables in geodata/ are
+
+    places.csv      every Canadian and US city, town and village of 1,000+
+                    people in GeoNames (cities1000, CC BY 4.0), with population
+    postcodes.csv   the centre of every Canadian FSA (the 1,645 in
+                    pypostalcode's table) and of every US ZIP3 prefix (the
+                    average of its standard ZIP codes' centres, from zipcodes)
+
+compiled into one fixed-width, key-sorted binary file, geodata/geocoder.bin:
+
+    header   8 byte magic, uint32 record count, uint32 key width
+    records  key (KEY_WIDTH bytes, NUL padded), float32 latitude, float32 longitude
+
+Keys are normalized strings:
+
+    "CA|ON|toronto"   a city
+    "CA|ON|"          a province/state, at the population weighted centre of its cities
+    "CA|#M5V"         a postcode prefix
+
+The file is opened with np.memmap on the first lookup (numpy is only imported
+then), so a worker pays nothing at import and only touches the pages its
+lookups hit; the OS shares those pages between workers.
+geocode_many() looks up a whole batch with one np.searchsorted per key kind,
+and says how precisely each place matched: a state's centre can be hundreds
+of km from a city in it, so callers that show distances ask for CITY or
+better.
+
+Rebuild the file after editing the CSVs:
+
+    python geocoder.py build
+"""
+
+import csv
+import math
+import os
+import re
+import struct
+import sys
+import threading
+import unicodedata
+
+GEODATA_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "geodata")
+PLACES_CSV = os.path.join(GEODATA_DIR, "places.csv")
+POSTCODES_CSV = os.path.join(GEODATA_DIR, "postcodes.csv")
+GEOCODER_BIN = os.path.join(GEODATA_DIR, "geocoder.bin")
+
+MAGIC = b"FFGEO1\x00\x00"
+HEADER = struct.Struct("<8sII")
+KEY_WIDTH = 40
+RECORD = struct.Struct(f"<{KEY_WIDTH}sff")
+
+# how precisely a place was matched, least precise first
+UNPLACED, STATE, CITY, POSTCODE = 0, 1, 2, 3
+
+
+def normalize_name(name):
+    """'St. John's' -> 'st john s', 'Québec' -> 'quebec': what city names are keyed and looked up by"""
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def postcode_prefix(country, postcode):
+    """Key a postcode is looked up by: the FSA for Canada ('M5V 2T6' -> 'M5V'), the ZIP3 for the US ('84660' -> '846')"""
+    if not postcode:
+        return None
+    postcode = postcode.replace(" ", "").upper()
+    if country == "CA":
+        return postcode[:3] if len(postcode) >= 3 else None
+    if country == "US":
+        return postcode[:3] if postcode[:5].isdigit() else None
+    return postcode
+
+
+def region_codes(country, state):
+    """(country code, state code) of names or codes, eg. ("Canada", "Québec") -> ("CA", "QC"); unknown names are kept"""
+    # autocomplete imports this module
+    from autocomplete import autocomplete
+
+    country, state = (country or "").strip(), (state or "").strip()
+    if len(country) > 2:
+        country = autocomplete.code_for("country", country) or country
+    if len(state) > 2:
+        state = autocomplete.code_for("state", state) or state
+    return country.upper(), state.upper()
+
+
+def city_key(country, state, city):
+    """Encoded lookup key; b"" (which matches nothing) when a name can't be resolved to ASCII codes"""
+    country, state = region_codes(country, state)
+    try:
+        return f"{country}|{state}|{normalize_name(city)}".encode("ascii")[:KEY_WIDTH]
+    except UnicodeEncodeError:
+        return b""
+
+
+def state_key(country, state):
+    return city_key(country, state, "")
+
+
+def postcode_key(country, postcode):
+    country = (country or "").upper()
+    prefix = postcode_prefix(country, postcode)
+    return f"{country}|#{prefix}".encode("ascii", "ignore")[:KEY_WIDTH] if prefix else b""
+
+
+##############################################################################
+# Build
+
+
+def build(out_path=GEOCODER_BIN, places_path=PLACES_CSV, postcodes_path=POSTCODES_CSV):
+    """Compile the CSV tables into the sorted binary file read by Geocoder. Returns the record count."""
+    records = {}
+    state_totals = {}
+
+    with open(places_path, newline="") as csv_file:
+        for row in csv.DictReader(csv_file):
+            lat, lon = float(row["latitude"]), float(row["longitude"])
+            records[city_key(row["country"], row["state"], row["city"])] = (lat, lon)
+
+            weight = int(row.get("population") or 1)
+            totals = state_totals.setdefault((row["country"], row["state"]), [0.0, 0.0, 0])
+            totals[0] += lat * weight
+            totals[1] += lon * weight
+            totals[2] += weight
+
+    for (country, state), (lat_sum, lon_sum, weight) in state_totals.items():
+        records[state_key(country, state)] = (lat_sum / weight, lon_sum / weight)
+
+    with open(postcodes_path, newline="") as csv_file:
+        for row in csv.DictReader(csv_file):
+            records[postcode_key(row["country"], row["prefix"])] = (float(row["latitude"]), float(row["longitude"]))
+
+    # NUL padding sorts before every other byte, so this is the order np.searchsorted expects
+    keys = sorted(records)
+    with open(out_path, "wb") as out_file:
+        out_file.write(HEADER.pack(MAGIC, len(keys), KEY_WIDTH))
+        for key in keys:
+            out_file.write(RECORD.pack(key, *records[key]))
+    return len(keys)
+
+
+##############################################################################
+# Lookup
+
+
+class Geocoder:
+    """Memory-mapped view of geocoder.bin, opened on first lookup"""
+
+    def __init__(self, path=GEOCODER_BIN):
+        self.path = path
+        self._records = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        import numpy as np
+
+        with open(self.path, "rb") as bin_file:
+            magic, count, key_width = HEADER.unpack(bin_file.read(HEADER.size))
+        if magic != MAGIC or key_width != KEY_WIDTH:
+            raise ValueError(f"{self.path} is not a geocoder file, rebuild it with `python geocoder.py build`")
+        dtype = np.dtype([("key", f"S{KEY_WIDTH}"), ("lat", "<f4"), ("lon", "<f4")])
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+
+    @property
+    def records(self):
+        if self._records is None:
+            with self._lock:
+                if self._records is None:
+                    self._records = self._open()
+        return self._records
+
+    def __len__(self):
+        return len(self.records)
+
+    def _lookup_keys(self, keys):
+        """Vectorized exact match of encoded keys -> (found mask, lats, lons)"""
+        import numpy as np
+
+        keys = np.asarray(keys, dtype=f"S{KEY_WIDTH}")
+        table_keys = self.records["key"]
+        positions = np.searchsorted(table_keys, keys)
+        positions = np.minimum(positions, len(table_keys) - 1)
+        found = (table_keys[positions] == keys) & (keys != b"")
+        lats = np.where(found, self.records["lat"][positions], np.nan)
+        lons = np.where(found, self.records["lon"][positions], np.nan)
+        return found, lats, lons
+
+    def geocode_many(self, places):
+        """Look up many places at once.
+
+        Each place is a (country, state, city, postcode) tuple, any of which may be
+        None. The postcode is tried first, then the city, then the state's centre.
+
+        Returns: (lats, lons, precisions) arrays aligned with places: float64
+        coordinates, NaN where nothing matched, and the int8 precision of each
+        match (POSTCODE, CITY, STATE or UNPLACED)
+        """
+        import numpy as np
+
+        if not len(places) or not len(self.records):
+            return np.full(len(places), np.nan), np.full(len(places), np.nan), np.full(len(places), UNPLACED, np.int8)
+
+        postcode_keys = [postcode_key(country, postcode) for country, _, _, postcode in places]
+        city_keys = [city_key(country, state, city) if city else b"" for country, state, city, _ in places]
+        state_keys = [state_key(country, state) if state else b"" for country, state, _, _ in places]
+
+        lats = np.full(len(places), np.nan)
+        lons = np.full(len(places), np.nan)
+        precisions = np.full(len(places), UNPLACED, np.int8)
+        for keys, precision in ((postcode_keys, POSTCODE), (city_keys, CITY), (state_keys, STATE)):
+            found, key_lats, key_lons = self._lookup_keys(keys)
+            found &= np.isnan(lats)
+            lats[found] = key_lats[found]
+            lons[found] = key_lons[found]
+            precisions[found] = precision
+        return lats, lons, precisions
+
+    def geocode(self, country, state=None, city=None, postcode=None, min_precision=STATE):
+        """(lat, lon) of one place, or None if it can't be placed at least as precisely as min_precision; see geocode_many"""
+        lats, lons, precisions = self.geocode_many([(country, state, city, postcode)])
+        if math.isnan(lats[0]) or precisions[0] < min_precision:
+            return None
+        return float(lats[0]), float(lons[0])
+
+    def has_state(self, country, state):
+        found, _, _ = self._lookup_keys([state_key(country, state)])
+        return bool(found[0])
+
+
+geocoder = Geocoder()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        sys.exit("usage: python geocoder.py build")
+    print(f"wrote {build()} records to {GEOCODER_BIN}")
@@ -0,0 +1,145 @@
+"""Password hashing that runs in a bounded process pool instead of on the request thread.
+
+bcrypt is CPU bound on purpose, so a burst of logins can tie up every worker
+for hundreds of ms each. PasswordHasher sends the hashing to a small process
+pool, caps how many hashes can be waiting (callers past the cap get
+PasswordHasherBusy instead of piling up), and keeps counters so queue depth
+and throughput can be watched.
+
+Config keys (see config.py):
+    BCRYPT_LOG_ROUNDS         bcrypt work factor for new hashes
+    PASSWORD_HASH_WORKERS     pool size; 0 hashes inline on the calling thread
+    PASSWORD_HASH_MAX_QUEUE   hashes allowed to wait for a free pool worker
+    PASSWORD_HASH_TIMEOUT     seconds to wait for a queue slot before giving up
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should treat it like a 503."""
+
+
+def _hash_password(password, rounds):
+    """Runs in a pool worker: hash a password with `rounds` as the bcrypt cost"""
+    return bcrypt.hashpw(password.encode("utf8"), bcrypt.gensalt(rounds)).decode("utf8")
+
+
+def _check_password(pw_hash, password):
+    """Runs in a pool worker: check a password against a bcrypt hash"""
+    return bcrypt.checkpw(password.encode("utf8"), pw_hash.encode("utf8"))
+
+
+def get_hash_rounds(pw_hash):
+    """Read the cost out of a bcrypt hash eg. '$2b$12$...' -> 12. Returns None if it isn't a bcrypt hash."""
+    try:
+        return int(pw_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Flask extension that hashes and checks passwords in a bounded process pool"""
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.max_workers = os.cpu_count() or 1
+        self.max_queue = self.max_workers * 4
+        self.queue_timeout = 5
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._metrics = {
+            "in_flight": 0,
+            "max_queue_depth": 0,
+            "completed": 0,
+            "rejected": 0,
+            "rehashed": 0,
+            "total_seconds": 0.0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get("BCRYPT_LOG_ROUNDS", self.rounds)
+        self.max_workers = app.config.get("PASSWORD_HASH_WORKERS", self.max_workers)
+        self.max_queue = app.config.get("PASSWORD_HASH_MAX_QUEUE", self.max_workers * 4)
+        self.queue_timeout = app.config.get("PASSWORD_HASH_TIMEOUT", self.queue_timeout)
+        self._slots = threading.BoundedSemaphore(max(1, self.max_workers + self.max_queue))
+        app.extensions["password_hasher"] = self
+
+    def _get_pool(self):
+        """Start the pool on first use so importing the app never forks processes"""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def _update_metrics(self, **changes):
+        with self._lock:
+            for key, change in changes.items():
+                self._metrics[key] += change
+            queue_depth = max(0, self._metrics["in_flight"] - self.max_workers)
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], queue_depth)
+
+    def _run(self, func, *args):
+        """Run func(*args) in the pool and wait for it; raise PasswordHasherBusy if the queue is full"""
+        if not self.max_workers:
+            return func(*args)
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._update_metrics(rejected=1)
+            raise PasswordHasherBusy("Too many password hashes waiting, try again shortly.")
+
+        started = time.perf_counter()
+        self._update_metrics(in_flight=1)
+        try:
+            return self._get_pool().submit(func, *args).result()
+        finally:
+            self._slots.release()
+            self._update_metrics(in_flight=-1, completed=1, total_seconds=time.perf_counter() - started)
+
+    def generate_password_hash(self, password, rounds=None):
+        """Hash password with the configured cost (or `rounds`) and return the hash as a str"""
+        if not password:
+            raise ValueError("Password must be non-empty.")
+        return self._run(_hash_password, password, rounds or self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        """Return True if password matches pw_hash"""
+        if not pw_hash or not password:
+            return False
+        return self._run(_check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """True if pw_hash was made with a different cost than the one configured now"""
+        return get_hash_rounds(pw_hash) != self.rounds
+
+    def rehash_if_needed(self, pw_hash, password):
+        """Return a fresh hash of an already-verified password if pw_hash used an old cost, else None"""
+        if not self.needs_rehash(pw_hash):
+            return None
+        self._update_metrics(rehashed=1)
+        return self.generate_password_hash(password)
+
+    def stats(self):
+        """Snapshot of the pool counters, eg. for a metrics endpoint or a benchmark"""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["queue_depth"] = max(0, stats["in_flight"] - self.max_workers)
+        stats["avg_seconds"] = stats["total_seconds"] / stats["completed"] if stats["completed"] else 0.0
+        stats["rounds"] = self.rounds
+        stats["max_workers"] = self.max_workers
+        stats["max_queue"] = self.max_queue
+        return stats
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
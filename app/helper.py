@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 from sqlalchemy.exc import NoResultFound  # type: ignore
 from models import db, User, UserLocation, UserAnimalPreferences
 from PetFinderAPI import PetFinderPetPyAPI
+from geo import resolve_location
+from geocoder import CITY, geocoder
 
 load_dotenv()
 CURR_USER_KEY = os.environ.get("CURR_USER_KEY", "curr_user")
@@ -200,6 +202,21 @@ def add_location_to_g(session, g):
     g.location = location
 
 
+def get_search_origin(session, g):
+    """(lat, lon) searches are made from: the logged-in user's UserLocation, else the anon session location.
+
+    Resolved offline; returns None if the location can't be placed.
+    """
+    user = g.get("user")
+    if user:
+        user_location = UserLocation.query.filter_by(user_id=user.id).first()
+        if user_location:
+            return geocoder.geocode(
+                user_location.country, state=user_location.state, city=user_location.city, min_precision=CITY
+            )
+    return resolve_location(session.get("CURR_LOCATION") or g.get("location"))
+
+
 def get_init_api_data(session, g):
     """Function to populate session with API data in between requests to simulate "live" API data updates to Jinja templates that make use of it"""
     if "api_data" not in session:
@@ -216,17 +233,29 @@ def get_init_api_data(session, g):
         raw_data = pf_api.get_animals_as_per_user_preferences(
             session=session, animal_types=animal_types, country=country
         )
-        parsed_data = pf_api.parse_api_animals_data(api_data=raw_data)
+        parsed_data = pf_api.parse_api_animals_data(
+            api_data=raw_data, origin=get_search_origin(session=session, g=g)
+        )
 
         return json.dumps({"api_data": parsed_data})
 
     if "top_results" not in session:
-        session["top_results"] = pf_api.get_top_results(parsed_data=parsed_data)
+        animal_types = (
+            get_user_preference(key="animal_types")
+            if "CURR_USER_KEY" in session
+            else get_anon_preference(key="animal_types", session=session, g=g)
+        )
+        # concurrent 1-row searches of the preferred types rather than a full page to pick four out of (see planner.py)
+        session["top_results"] = pf_api.fetch_top_results(
+            params={"location": session.get("CURR_LOCATION") or g.get("location"), "type": animal_types},
+            origin=get_search_origin(session=session, g=g),
+        )
 
     else:
         return json.dumps({session.get(key) for key in ["top_results", "api_data"]})
 
 
+# cheap to create: the petpy client inside authenticates on first use, not at import
 pf_api = PetFinderPetPyAPI(
     get_anon_preference_func=get_anon_preference,
     get_user_preference_func=get_user_preference,
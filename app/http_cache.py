@@ -0,0 +1,124 @@
+"""HTTP caching policy for every response, instead of one blanket no-store header.
+
+    static files        fingerprinted (a content hash in the file name, or a
+                        ?v= query arg): cached for a year and marked immutable.
+                        Everything else in /static: cached CACHE_STATIC_MAX_AGE
+                        seconds, then revalidated by ETag. Only 200s and
+                        304s get these lifetimes: a missing file (eg. an old
+                        fingerprint mid-deploy) is no-store.
+    @cacheable views    public data pages: strong ETag from the body, 304 when
+                        the browser already has it, cached max_age seconds.
+    other GET pages     personalized, so `private` (never in a shared cache),
+                        cached CACHE_PRIVATE_MAX_AGE seconds and revalidated by
+                        ETag. The default of 0 means always revalidate, since
+                        pages change right after a form post.
+    everything else     POSTs, errors, redirects and responses that change the
+                        session: no-store.
+
+Repeat visits then cost a 304 or nothing instead of the full page and assets.
+"""
+
+import re
+from functools import wraps
+
+from flask import current_app, request, session
+
+# "style.3f2a9c1b.css": a content hash as the last part before the extension
+FINGERPRINTED_FILENAME = re.compile(r"\.[0-9a-f]{8,}\.\w+$")
+
+
+def is_fingerprinted(filename):
+    return bool(FINGERPRINTED_FILENAME.search(filename or "")) or "v" in request.args
+
+
+def cacheable(max_age=60, private=False):
+    """Mark a view's GET responses as cacheable, with a strong ETag and If-None-Match -> 304 handling.
+
+    Args:
+        max_age (INT): seconds browsers (and shared caches, unless private) may reuse the response
+        private (BOOL): only the user's browser may cache it
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = current_app.make_response(view(*args, **kwargs))
+            if (
+                request.method not in ("GET", "HEAD")
+                or response.status_code != 200
+                or response.is_streamed
+                or session.modified
+            ):
+                # left to HttpCache.apply_policy, which makes it no-store
+                return response
+
+            response.cache_control.max_age = max_age
+            if private:
+                # eg. pages that depend on the visitor's saved location
+                response.cache_control.private = True
+                response.vary.add("Cookie")
+            else:
+                response.cache_control.public = True
+            response.add_etag()
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
+
+
+class HttpCache:
+    """Flask extension applying the policy above in an after_request hook"""
+
+    def __init__(self, app=None):
+        self.static_max_age = 3600
+        self.immutable_max_age = 365 * 24 * 3600
+        self.private_max_age = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_max_age = app.config.get("CACHE_STATIC_MAX_AGE", self.static_max_age)
+        self.immutable_max_age = app.config.get("CACHE_IMMUTABLE_MAX_AGE", self.immutable_max_age)
+        self.private_max_age = app.config.get("CACHE_PRIVATE_MAX_AGE", self.private_max_age)
+        app.after_request(self.apply_policy)
+        app.extensions["http_cache"] = self
+
+    def apply_policy(self, response):
+        if request.endpoint == "static" or (request.endpoint or "").endswith(".static"):
+            return self._static_policy(response)
+
+        # set by @cacheable (or by the view itself)
+        if "Cache-Control" in response.headers:
+            return response
+
+        if request.method not in ("GET", "HEAD") or response.status_code != 200 or session.modified:
+            response.headers["Cache-Control"] = "no-store"
+            return response
+
+        response.cache_control.private = True
+        response.cache_control.max_age = self.private_max_age
+        response.cache_control.must_revalidate = True
+        response.vary.add("Cookie")
+        if not response.is_streamed:
+            response.add_etag()
+            response = response.make_conditional(request)
+        return response
+
+    def _static_policy(self, response):
+        # send_file already added an ETag and handled If-None-Match; only the lifetime is decided here
+        response.headers.pop("Cache-Control", None)
+        if response.status_code not in (200, 304):
+            # a 404 for a fingerprinted name mustn't be cached for a year
+            response.headers["Cache-Control"] = "no-store"
+            return response
+        response.cache_control.public = True
+        if is_fingerprinted((request.view_args or {}).get("filename")):
+            response.cache_control.max_age = self.immutable_max_age
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = self.static_max_age
+        return response
+
+
+http_cache = HttpCache()
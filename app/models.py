@@ -2,48 +2,258 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert
 
-bcrypt = Bcrypt()
+from hashing import PasswordHasher, PasswordHasherBusy
+
+password_hasher = PasswordHasher()
 db = SQLAlchemy()
 
 
-# class Follows(db.Model):
-#     """Connection of a follower <-> followed_followed_org."""
+class Follows(db.Model):
+    """Connection of a follower <-> followed_org.
 
-#     __tablename__ = "follows"
+    The primary key (user_following_id, rescue_org_being_followed_id) answers
+    "which orgs does this user follow"; ix_follows_org_user is the reverse
+    index for "who follows this org". Use User.follow_org / User.unfollow_org
+    rather than inserting rows directly so the follower counters stay in sync.
+    """
 
-#     rescue_org_being_followed_id = db.Column(
-#         db.Integer,
-#         db.ForeignKey("rescueOrg.id", ondelete="cascade"),
-#         primary_key=True,
-#     )
+    __tablename__ = "follows"
 
-#     user_following_id = db.Column(
-#         db.Integer,
-#         db.ForeignKey("users.id", ondelete="cascade"),
-#         primary_key=True,
-#     )
+    user_following_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id", ondelete="cascade"),
+        primary_key=True,
+    )
 
+    rescue_org_being_followed_id = db.Column(
+        db.String(20),
+        db.ForeignKey("rescueOrg.id", ondelete="cascade"),
+        primary_key=True,
+    )
 
-# class RescueOrganization(db.Model):
-#     """Rescue Organization db.Model
-#     """
+    followed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
 
-#     __tablename__ = "rescueOrg"
+    __table_args__ = (
+        db.Index("ix_follows_org_user", "rescue_org_being_followed_id", "user_following_id"),
+    )
 
-#     id = db.Column(
-#         db.Integer,
-#         primary_key=True,
-#     )
 
-#     name = db.Column(
-#         db.Text,
-#         nullable=False,
-#         unique=True,
-#     )
+class UserFollows(db.Model):
+    """Connection of a follower user <-> followed user.
+
+    Same layout as Follows: the primary key leads with the follower and
+    ix_user_follows_followed_user is the reverse index. Use User.follow_user /
+    User.unfollow_user so the counters stay in sync.
+    """
+
+    __tablename__ = "user_follows"
+
+    user_following_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id", ondelete="cascade"),
+        primary_key=True,
+    )
+
+    user_being_followed_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id", ondelete="cascade"),
+        primary_key=True,
+    )
+
+    followed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.CheckConstraint("user_following_id <> user_being_followed_id", name="ck_user_follows_not_self"),
+        db.Index("ix_user_follows_followed_user", "user_being_followed_id", "user_following_id"),
+    )
+
+
+class RescueOrganization(db.Model):
+    """Rescue Organization db.Model, keyed by the Petfinder organization id (eg. 'ON123')
+    """
+
+    __tablename__ = "rescueOrg"
+
+    id = db.Column(
+        db.String(20),
+        primary_key=True,
+    )
+
+    name = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # denormalized count of Follows rows, maintained by User.follow_org / User.unfollow_org
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # location, used by the local geospatial index (geo.py)
+    city = db.Column(db.Text)
+    state = db.Column(db.String(10))
+    country = db.Column(db.String(2))
+    postcode = db.Column(db.String(10))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+
+
+class Animal(db.Model):
+    """Animal listed by a rescue org on Petfinder, mirrored locally so pages don't need a live API call"""
+
+    __tablename__ = "animals"
+
+    # Petfinder animal id
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # not a foreign key: animals can arrive before their org has been mirrored
+    organization_id = db.Column(db.String(20), nullable=False)
+    type = db.Column(db.String(30))
+    name = db.Column(db.Text)
+    url = db.Column(db.Text)
+    photo_url = db.Column(db.Text)
+    published_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    # the full API record, for anything the columns above don't cover
+    data = db.Column(JSONB)
+
+    # maintained by the sync job (sync.py)
+    status = db.Column(db.String(20), nullable=False, default="adoptable", server_default="adoptable")
+    # md5 of the API record, so unchanged animals are skipped without rewriting the row
+    content_hash = db.Column(db.String(32))
+    # the configured sync region the animal was found in, and when a full sweep of it last saw the animal
+    region = db.Column(db.String(100))
+    last_seen_at = db.Column(db.DateTime(timezone=True))
+    # set once the animal was adopted or removed from Petfinder; the row is kept as a tombstone
+    removed_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.Index("ix_animals_org_published", "organization_id", published_at.desc(), id.desc()),
+        db.Index("ix_animals_region_last_seen", "region", "last_seen_at"),
+    )
+
+
+class SyncCheckpoint(db.Model):
+    """Progress of one sync pass (see sync.py), committed after every page so an interrupted pass resumes where it stopped"""
+
+    __tablename__ = "sync_checkpoints"
+
+    # eg. "animals:Toronto,ON"
+    name = db.Column(db.String(200), primary_key=True)
+    # everything published up to here has been synced
+    high_water = db.Column(db.DateTime(timezone=True))
+    # the pass in progress: when it started, how far it got (published_at of the last animal stored)
+    # and the page to fetch at that cursor; next_page is None when no pass is running
+    started_at = db.Column(db.DateTime(timezone=True))
+    cursor = db.Column(db.DateTime(timezone=True))
+    next_page = db.Column(db.Integer)
+    completed_at = db.Column(db.DateTime(timezone=True))
+
+
+class CrawlPage(db.Model):
+    """A page of a paged Petfinder listing whose rows are already stored, so a restarted crawl skips it (see org_crawler.py)"""
+
+    __tablename__ = "crawl_pages"
+
+    # the SyncCheckpoint name of the crawl, eg. "organizations"
+    crawl = db.Column(db.String(200), primary_key=True)
+    page = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    completed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+class FeedEntry(db.Model):
+    """One animal in one user's home timeline (fan-out-on-write, see feed.py).
+
+    The primary key (user_id, published_at, animal_id) is also the order the
+    timeline is read in, so a page of the feed is a single index range scan.
+    """
+
+    __tablename__ = "feed_entries"
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="cascade"), primary_key=True
+    )
+    published_at = db.Column(db.DateTime(timezone=True), primary_key=True)
+    animal_id = db.Column(
+        db.Integer, db.ForeignKey("animals.id", ondelete="cascade"), primary_key=True
+    )
+    organization_id = db.Column(db.String(20), nullable=False)
+
+    animal = db.relationship("Animal", lazy="joined")
+
+
+def _add_edge(edge_model, edge_values, counter_updates):
+    """Idempotently insert a follow edge and bump its counters in the current transaction.
+
+    Args:
+        edge_model (db.Model): Follows or UserFollows
+        edge_values (DICT): primary key values of the edge
+        counter_updates (LIST of TUPLES): (model, id, counter column) to increment if the edge was created
+
+    Returns: True if the edge was created, False if it already existed
+    """
+    result = db.session.execute(
+        insert(edge_model).values(**edge_values).on_conflict_do_nothing()
+    )
+    if result.rowcount:
+        for model, model_id, column in counter_updates:
+            db.session.execute(
+                update(model).where(model.id == model_id).values({column: column + 1})
+            )
+        _expire_counters(counter_updates)
+    return bool(result.rowcount)
+
+
+def _remove_edge(edge_model, edge_values, counter_updates):
+    """Idempotently delete a follow edge and decrement its counters in the current transaction.
+
+    Returns: True if the edge was deleted, False if it didn't exist
+    """
+    result = db.session.execute(
+        delete(edge_model).filter_by(**edge_values)
+    )
+    if result.rowcount:
+        for model, model_id, column in counter_updates:
+            db.session.execute(
+                update(model).where(model.id == model_id).values({column: column - 1})
+            )
+        _expire_counters(counter_updates)
+    return bool(result.rowcount)
+
+
+def _expire_counters(counter_updates):
+    """Expire updated counters on rows already loaded in the session (eg. g.user and the user they followed) so they reload"""
+    for model, model_id, column in counter_updates:
+        loaded = db.session.identity_map.get(db.session.identity_key(model, model_id))
+        if loaded is not None:
+            db.session.expire(loaded, [column.key])
+
+
+def recount_follow_counters():
+    """Recompute every follower/following counter from the edge tables.
+
+    Only needed after bulk loading edges (eg. seed.py), the follow/unfollow methods keep counters current.
+    """
+    db.session.execute(
+        update(User).values(
+            following_count=select(func.count())
+            .where(UserFollows.user_following_id == User.id)
+            .scalar_subquery(),
+            followers_count=select(func.count())
+            .where(UserFollows.user_being_followed_id == User.id)
+            .scalar_subquery(),
+            orgs_following_count=select(func.count())
+            .where(Follows.user_following_id == User.id)
+            .scalar_subquery(),
+        )
+    )
+    db.session.execute(
+        update(RescueOrganization).values(
+            followers_count=select(func.count())
+            .where(Follows.rescue_org_being_followed_id == RescueOrganization.id)
+            .scalar_subquery()
+        )
+    )
 
 
 class MatchedRescueOrganization(db.Model):
@@ -57,7 +267,7 @@ class MatchedRescueOrganization(db.Model):
     )
 
     matched_user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
-    matched_org_id = db.Column(db.Integer, db.ForeignKey("rescueOrg.id"))
+    matched_org_id = db.Column(db.String(20), db.ForeignKey("rescueOrg.id"))
     matched_pct = db.Column(db.Integer, nullable=False, default=0)
     matched_datetime = db.Column(db.DateTime, nullable=False, default=datetime.now())
     followed_by_user_bool = db.Column(db.Boolean, default=False)
@@ -147,6 +357,14 @@ class User(db.Model):
 
     registration_date = db.Column(db.DateTime)
 
+    # set for rescue staff: the org whose matched applicants they may search and export
+    rescue_org_id = db.Column(db.String(20), db.ForeignKey("rescueOrg.id"), nullable=True)
+
+    # denormalized follow counts so profile cards never load the follow lists just to count them
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    orgs_following_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
     animal_handling_experience = db.Column(
         db.String,
         db.ForeignKey("user_animal_handling_history.id"),
@@ -162,33 +380,101 @@ class User(db.Model):
     matched_rescue_orgs = db.relationship(
         "MatchedRescueOrganization", back_populates="user"
     )
-    # followed_orgs = db.relationship("FollowedOrg", back_populates="user")
+    # follow lists are dynamic queries so they can be paged; use the *_count columns for counts
+    following = db.relationship(
+        "User",
+        secondary="user_follows",
+        primaryjoin="User.id == UserFollows.user_following_id",
+        secondaryjoin="User.id == UserFollows.user_being_followed_id",
+        lazy="dynamic",
+        viewonly=True,
+    )
+    followers = db.relationship(
+        "User",
+        secondary="user_follows",
+        primaryjoin="User.id == UserFollows.user_being_followed_id",
+        secondaryjoin="User.id == UserFollows.user_following_id",
+        lazy="dynamic",
+        viewonly=True,
+    )
+    followed_orgs = db.relationship(
+        "RescueOrganization", secondary="follows", lazy="dynamic", viewonly=True
+    )
     # user_reviews = db.relationship("UserReviews", back_populates="user")
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}, {self.bio}, {self.location}>"
 
-    # def is_following(self, specific_org):
-    #     """Is this user following any rescue agencies?"""
+    def is_following(self, other_user):
+        """Is this user following `other_user`? (a primary key lookup, never loads the follow list)"""
+
+        return db.session.get(UserFollows, (self.id, other_user.id)) is not None
+
+    def is_following_org(self, specific_org):
+        """Is this user following this rescue agency?"""
+
+        return db.session.get(Follows, (self.id, specific_org.id)) is not None
+
+    def follow_user(self, other_user_id):
+        """Follow another user. Safe to repeat; returns True only if a new follow was created.
+
+        Counters are updated in the same transaction, the caller commits.
+        """
+        if other_user_id == self.id:
+            raise ValueError("Users can't follow themselves.")
 
-    #     return specific_org in self.followed_orgs
+        created = _add_edge(
+            UserFollows,
+            {"user_following_id": self.id, "user_being_followed_id": other_user_id},
+            [(User, self.id, User.following_count), (User, other_user_id, User.followers_count)],
+        )
+        return created
+
+    def unfollow_user(self, other_user_id):
+        """Stop following another user. Safe to repeat; returns True only if a follow was removed."""
+        removed = _remove_edge(
+            UserFollows,
+            {"user_following_id": self.id, "user_being_followed_id": other_user_id},
+            [(User, self.id, User.following_count), (User, other_user_id, User.followers_count)],
+        )
+        return removed
+
+    def follow_org(self, org_id):
+        """Follow a rescue org. Safe to repeat; returns True only if a new follow was created."""
+        created = _add_edge(
+            Follows,
+            {"user_following_id": self.id, "rescue_org_being_followed_id": org_id},
+            [(User, self.id, User.orgs_following_count),
+             (RescueOrganization, org_id, RescueOrganization.followers_count)],
+        )
+        return created
+
+    def unfollow_org(self, org_id):
+        """Stop following a rescue org. Safe to repeat; returns True only if a follow was removed."""
+        removed = _remove_edge(
+            Follows,
+            {"user_following_id": self.id, "rescue_org_being_followed_id": org_id},
+            [(User, self.id, User.orgs_following_count),
+             (RescueOrganization, org_id, RescueOrganization.followers_count)],
+        )
+        return removed
 
     @classmethod
     def signup(cls, username, email, password, image_url, rescue_action_type, animal_types, bio=None, **user_data_kwargs):
         """Sign up user.
 
-        Hashes password and adds user to system.
+        Hashes password (in the password_hasher pool) and adds user to system.
         """
 
         # Hash the password if provided as a positional argument
         if password:
-            hashed_pwd = bcrypt.generate_password_hash(password).decode("utf8")
+            hashed_pwd = password_hasher.generate_password_hash(password)
         else:
             # Check if password is provided in user_data_kwargs
             #use .pop() to prevent additional 'password' keywords being passed
             password = user_data_kwargs.pop("password", None)
             if password:
-                hashed_pwd = bcrypt.generate_password_hash(password).decode("utf8")
+                hashed_pwd = password_hasher.generate_password_hash(password)
             else:
                 raise ValueError("Password is required for signup.")
 
@@ -214,11 +500,24 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the stored hash was made with a different bcrypt cost than the one
+        configured now (BCRYPT_LOG_ROUNDS), the password is transparently
+        rehashed with the current cost and saved. That upgrade is best-effort:
+        if the hash queue is full it's skipped and retried on a later login.
         """
 
         user = cls.query.filter_by(username=username).first()
 
-        if user and bcrypt.check_password_hash(user.password, password):
+        if user and password_hasher.check_password_hash(user.password, password):
+            try:
+                new_hash = password_hasher.rehash_if_needed(user.password, password)
+            except PasswordHasherBusy:
+                new_hash = None
+            if new_hash:
+                user.password = new_hash
+                db.session.add(user)
+                db.session.commit()
             return user
 
         return False
@@ -395,8 +694,9 @@ class UserTravelPreferences(db.Model):
     __tablename__ = "user_travel_preferences"
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"))
-    user_preferences_id = db.Column(db.Integer, db.ForeignKey("user_preferences.id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
+    # the user_preferences table is not in use yet (see the commented out UserPreferences model)
+    user_preferences_id = db.Column(db.Integer)
 
     distance_filter_preference = db.Column(db.Integer)
 
@@ -464,6 +764,39 @@ class UserCurrentPets(db.Model):
     user_pets_friendly_to_new_misc_animal_types = db.Column(db.Boolean)
 
 
+class ApplicantProfile(db.Model):
+    """One compact row per user, denormalized from UserResidence, UserCurrentPets,
+    UserResources, UserTravelPreferences and UserLocation so rescues can filter
+    applicants without joining those tables.
+
+    Every boolean answer is packed into `flags` (bit positions in
+    applicants.APPLICANT_FLAGS), so a filter like "has a yard and a car but no
+    pool" is one bitwise test. Kept current by applicants.py; don't write rows directly.
+    """
+
+    __tablename__ = "applicant_profiles"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id", ondelete="cascade"),
+        primary_key=True,
+    )
+    flags = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+    country = db.Column(db.String(2))
+    state = db.Column(db.String(2))
+    dwelling_type = db.Column(db.String)
+    dwelling_size = db.Column(db.String)
+    pet_quantity = db.Column(db.Integer)
+    pet_types = db.Column(ARRAY(db.String))
+    pets_ages = db.Column(ARRAY(db.String))
+    distance_filter_preference = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index("ix_applicant_profiles_region", "country", "state"),
+        db.Index("ix_applicant_profiles_pet_types", "pet_types", postgresql_using="gin"),
+    )
+
+
 def connect_db(app):
     """Connect this database to provided Flask app.
 
@@ -472,3 +805,4 @@ def connect_db(app):
 
     db.app = app
     db.init_app(app)
+    password_hasher.init_app(app)
@@ -0,0 +1,159 @@
+"""Mirror Petfinder's whole organization catalog into the rescueOrg table.
+
+The catalog is about 15k orgs, ~150 pages of 100. Page 1 is fetched first to
+learn the page count; the rest are fetched by a small thread pool. Every
+request goes through PetFinderPetPyAPI.request_page, so the threads share one
+rate budget with the animal sync. The database is only touched from the
+calling thread: rows are geocoded and upserted in batches, and a page is
+recorded in CrawlPage in the same transaction as its rows. A crawl that is
+interrupted skips the pages it already stored when it is run again.
+
+Once the mirror is loaded, org lookups, the geospatial index (geo.py) and
+matching read the database instead of the API.
+
+    python org_crawler.py               # start or resume a crawl
+    python org_crawler.py --restart     # forget an unfinished crawl and start over
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from geo import org_index
+from geocoder import CITY, geocoder
+from models import db, CrawlPage, RescueOrganization, SyncCheckpoint
+
+CRAWL_NAME = "organizations"
+PAGE_SIZE = 100
+
+
+def org_rows(records):
+    """rescueOrg column values for a batch of API org records, geocoded in one bulk lookup.
+
+    Orgs only placed at their state's centre get no coordinates; see geo.py.
+    """
+    addresses = [record.get("address") or {} for record in records]
+    lats, lons, precisions = geocoder.geocode_many(
+        [(address.get("country"), address.get("state"), address.get("city"), address.get("postcode")) for address in addresses]
+    )
+    imprecise = precisions < CITY
+    lats[imprecise] = lons[imprecise] = np.nan
+    return [
+        {
+            "id": record["id"],
+            "name": record.get("name") or record["id"],
+            "city": address.get("city"),
+            "state": address.get("state"),
+            "country": address.get("country"),
+            "postcode": address.get("postcode"),
+            "latitude": None if np.isnan(lat) else float(lat),
+            "longitude": None if np.isnan(lon) else float(lon),
+        }
+        for record, address, lat, lon in zip(records, addresses, lats, lons)
+    ]
+
+
+def store_orgs(records, pages):
+    """Upsert a batch of orgs and mark the pages they came from as done, in one transaction"""
+    if records:
+        # the same org can turn up on two pages if the catalog shifts mid-crawl
+        rows = list({row["id"]: row for row in org_rows(records)}.values())
+        statement = insert(RescueOrganization).values(rows)
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[RescueOrganization.id],
+                set_={column: statement.excluded[column] for column in rows[0] if column != "id"},
+            )
+        )
+        if org_index.loaded:
+            for row in rows:
+                if row["latitude"] is not None:
+                    org_index.add(row["id"], row["latitude"], row["longitude"])
+
+    now = datetime.now(timezone.utc)
+    db.session.execute(
+        insert(CrawlPage)
+        .values([{"crawl": CRAWL_NAME, "page": page, "completed_at": now} for page in pages])
+        .on_conflict_do_nothing()
+    )
+    db.session.commit()
+
+
+def fetch_page(pf_api, page):
+    data = pf_api.request_page("organizations", {"limit": PAGE_SIZE, "page": page, "sort": "name"})
+    return data.get("organizations") or [], (data.get("pagination") or {}).get("total_pages", 0)
+
+
+def crawl_organizations(pf_api, workers=None, batch_size=None, restart=False):
+    """Start or resume a crawl of every Petfinder organization.
+
+    Returns: OBJECT = {"pages": INT fetched this run, "orgs": INT upserted this run, "total_pages": INT}
+    """
+    workers = workers or current_app.config.get("ORG_CRAWL_WORKERS", 4)
+    batch_size = batch_size or current_app.config.get("ORG_CRAWL_BATCH_SIZE", 500)
+
+    checkpoint = db.session.get(SyncCheckpoint, CRAWL_NAME) or SyncCheckpoint(name=CRAWL_NAME)
+    if restart or checkpoint.next_page is None:
+        # a new crawl; next_page just marks it as in progress
+        db.session.execute(delete(CrawlPage).where(CrawlPage.crawl == CRAWL_NAME))
+        checkpoint.started_at = datetime.now(timezone.utc)
+        checkpoint.next_page = 1
+        checkpoint.completed_at = None
+        db.session.add(checkpoint)
+        db.session.commit()
+
+    done = set(db.session.scalars(select(CrawlPage.page).where(CrawlPage.crawl == CRAWL_NAME)))
+    stats = {"pages": 0, "orgs": 0, "total_pages": 0}
+
+    # page 1 also tells us how many pages there are
+    first_page, stats["total_pages"] = fetch_page(pf_api, 1)
+    if 1 not in done:
+        store_orgs(first_page, [1])
+        stats["pages"] += 1
+        stats["orgs"] += len(first_page)
+
+    batch, batch_pages = [], []
+    remaining = [page for page in range(2, stats["total_pages"] + 1) if page not in done]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_page, pf_api, page): page for page in remaining}
+        try:
+            for future in as_completed(futures):
+                records, _ = future.result()
+                batch.extend(records)
+                batch_pages.append(futures[future])
+                if len(batch) >= batch_size:
+                    store_orgs(batch, batch_pages)
+                    stats["pages"] += len(batch_pages)
+                    stats["orgs"] += len(batch)
+                    batch, batch_pages = [], []
+        except BaseException:
+            # stored pages stay recorded; don't spend rate budget on the rest before re-raising
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    if batch_pages:
+        store_orgs(batch, batch_pages)
+        stats["pages"] += len(batch_pages)
+        stats["orgs"] += len(batch)
+
+    checkpoint.next_page = None
+    checkpoint.completed_at = datetime.now(timezone.utc)
+    db.session.commit()
+    return stats
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Mirror every Petfinder organization into the rescueOrg table")
+    arg_parser.add_argument("--workers", type=int, help="pages fetched at once, defaults to ORG_CRAWL_WORKERS")
+    arg_parser.add_argument("--restart", action="store_true", help="start over instead of resuming an unfinished crawl")
+    args = arg_parser.parse_args()
+
+    from app import app
+    from helper import pf_api
+
+    with app.app_context():
+        print(crawl_organizations(pf_api, workers=args.workers, restart=args.restart))
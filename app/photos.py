@@ -0,0 +1,250 @@
+"""Petfinder photos at the right size for where they're shown.
+
+Petfinder gives every photo in four sizes: small (100px wide), medium (300),
+large (600) and full (the original, often several MB). Templates ask for a
+slot instead of a size; photo_set() returns the slot's default as src, every
+size as a srcset and the slot's rendered width as sizes, so the browser
+downloads the smallest image that looks sharp at its pixel density:
+
+    {% set photo = animal_photo(animal.data, "thumbnail") %}
+    <img src="{{ photo.src }}" srcset="{{ photo.srcset }}" sizes="{{ photo.sizes }}">
+
+With IMAGE_PROXY_ENABLED the URLs point at /photos/<width> instead, which
+fetches the smallest Petfinder size at least that wide, resizes it to exactly
+that width, re-encodes it (WebP when the browser takes it) and keeps it on
+disk. The disk cache evicts least recently used thumbnails once it holds more
+than IMAGE_PROXY_MAX_BYTES; recency is the file mtime, so worker processes
+sharing the directory share it too. Only IMAGE_PROXY_HOSTS are fetched and
+only IMAGE_PROXY_WIDTHS are generated, so the proxy can't be used to fetch or
+resize anything else.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from flask import Blueprint, abort, current_app, has_app_context, redirect, request, send_file, url_for
+
+# Petfinder's sizes and their widths, smallest first; "full" is the original
+PHOTO_WIDTHS = {"small": 100, "medium": 300, "large": 600}
+
+# slot: (default Petfinder size, <img sizes> for its rendered width)
+SLOTS = {
+    "thumbnail": ("small", "48px"),
+    "card": ("medium", "(max-width: 576px) 100vw, 300px"),
+    "detail": ("large", "(max-width: 768px) 100vw, 600px"),
+}
+
+# originals above this are refused rather than decoded
+MAX_SOURCE_BYTES = 15 * 1024 * 1024
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+
+def photo_set(photo, slot="card"):
+    """src, srcset and sizes for an <img> showing a Petfinder photo object in a template slot.
+
+    Args:
+        photo (OBJECT): {"small": URL, "medium": URL, "large": URL, "full": URL}, any of which may be missing
+        slot (STR): one of SLOTS
+
+    Returns: OBJECT = {"src": URL, "srcset": STR, "sizes": STR}, or None without a photo
+    """
+    if not photo:
+        return None
+    default_size, sizes = SLOTS[slot]
+    proxy = current_app.extensions.get("photo_proxy") if has_app_context() else None
+    if proxy is not None and proxy.enabled:
+        return proxy.photo_set(photo, PHOTO_WIDTHS[default_size], sizes)
+
+    sources = [(photo[size], width) for size, width in PHOTO_WIDTHS.items() if photo.get(size)]
+    src = photo.get(default_size) or (sources[-1][0] if sources else photo.get("full"))
+    if not src:
+        return None
+    return {"src": src, "srcset": ", ".join(f"{url} {width}w" for url, width in sources), "sizes": sizes}
+
+
+def animal_photo(record, slot="card"):
+    """photo_set() for an API animal record's main photo; the square crop for thumbnails"""
+    if not record:
+        return None
+    cropped = record.get("primary_photo_cropped")
+    photos = record.get("photos") or [None]
+    return photo_set(cropped if slot == "thumbnail" and cropped else photos[0] or cropped, slot)
+
+
+##############################################################################
+# Thumbnail proxy
+
+
+class DiskLRU:
+    """Files in one directory, evicting the least recently used once they exceed max_bytes in total"""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._entries = None  # name -> size, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self._total = sum(self._entries.values())
+
+    def get(self, name):
+        """Path of a cached file, marking it as recently used; None on a miss"""
+        full_path = os.path.join(self.path, name)
+        with self._lock:
+            self._load()
+            try:
+                # other workers see the hit through the mtime
+                os.utime(full_path)
+            except FileNotFoundError:
+                # never cached, or evicted by another worker
+                if name in self._entries:
+                    self._total -= self._entries.pop(name)
+                return None
+            if name not in self._entries:
+                # cached by another worker
+                self._entries[name] = os.path.getsize(full_path)
+                self._total += self._entries[name]
+            self._entries.move_to_end(name)
+        return full_path
+
+    def put(self, name, content):
+        """Store a file, evicting the oldest ones to stay under max_bytes. Returns its path."""
+        full_path = os.path.join(self.path, name)
+        with self._lock:
+            self._load()
+            temp_path = f"{full_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as cache_file:
+                cache_file.write(content)
+            os.replace(temp_path, full_path)
+
+            self._total += len(content) - self._entries.pop(name, 0)
+            self._entries[name] = len(content)
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                oldest, size = self._entries.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(os.path.join(self.path, oldest))
+                except FileNotFoundError:
+                    pass
+        return full_path
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            self._load()
+            return self._total
+
+
+def resize_photo(content, width, image_format):
+    """content scaled down to width (never up) and encoded as "jpeg" or "webp" """
+    from io import BytesIO
+
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        out = BytesIO()
+        if image_format == "webp":
+            image.save(out, "webp", quality=WEBP_QUALITY, method=4)
+        else:
+            image.save(out, "jpeg", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+class PhotoProxy:
+    """Flask extension: the optional /photos/<width> thumbnail proxy and the photo template helpers"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.widths = (100, 300, 600)
+        self.hosts = set()
+        self.max_age = 7 * 24 * 3600
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("IMAGE_PROXY_ENABLED", False)
+        self.widths = tuple(sorted(app.config.get("IMAGE_PROXY_WIDTHS", self.widths)))
+        self.hosts = set(app.config.get("IMAGE_PROXY_HOSTS", ()))
+        self.max_age = app.config.get("IMAGE_PROXY_MAX_AGE", self.max_age)
+        self.cache = DiskLRU(
+            app.config.get("IMAGE_PROXY_PATH") or os.path.join(app.root_path, "cache", "photos"),
+            app.config.get("IMAGE_PROXY_MAX_BYTES", 256 * 1024 * 1024),
+        )
+        if self.enabled:
+            blueprint = Blueprint("photos", __name__)
+            blueprint.add_url_rule("/photos/<int:width>", "thumbnail", self.send_thumbnail)
+            app.register_blueprint(blueprint)
+        app.add_template_global(photo_set)
+        app.add_template_global(animal_photo)
+        app.extensions["photo_proxy"] = self
+
+    def photo_set(self, photo, default_width, sizes):
+        """photo_set() with every URL pointing at the proxy"""
+
+        def thumbnail_url(width):
+            # the smallest Petfinder size that's at least as wide, so the proxy downloads as little as possible
+            source = next(
+                (photo[size] for size, size_width in PHOTO_WIDTHS.items() if size_width >= width and photo.get(size)),
+                photo.get("full") or next(photo[size] for size in reversed(PHOTO_WIDTHS) if photo.get(size)),
+            )
+            return url_for("photos.thumbnail", width=width, src=source)
+
+        if not any(photo.get(size) for size in (*PHOTO_WIDTHS, "full")):
+            return None
+        default = next((width for width in self.widths if width >= default_width), self.widths[-1])
+        return {
+            "src": thumbnail_url(default),
+            "srcset": ", ".join(f"{thumbnail_url(width)} {width}w" for width in self.widths),
+            "sizes": sizes,
+        }
+
+    def send_thumbnail(self, width):
+        source = request.args.get("src", "")
+        if width not in self.widths or urlsplit(source).hostname not in self.hosts:
+            abort(404)
+
+        image_format = "webp" if request.accept_mimetypes["image/webp"] else "jpeg"
+        name = hashlib.md5(f"{source}|{width}".encode("utf8")).hexdigest() + (".webp" if image_format == "webp" else ".jpg")
+        path = self.cache.get(name)
+        if path is None:
+            try:
+                path = self.cache.put(name, resize_photo(self.fetch(source), width, image_format))
+            except Exception as e:
+                # the browser can still show the original
+                print(f"An error occurred while resizing {source}: {e}")
+                return redirect(source)
+
+        response = send_file(path, mimetype=f"image/{image_format}", max_age=self.max_age)
+        response.vary.add("Accept")
+        return response
+
+    def fetch(self, source):
+        import requests
+
+        with requests.get(source, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            content = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        if len(content) > MAX_SOURCE_BYTES:
+            raise ValueError(f"photo is larger than {MAX_SOURCE_BYTES} bytes")
+        return content
+
+
+photo_proxy = PhotoProxy()
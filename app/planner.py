@@ -0,0 +1,252 @@
+"""Limit pushdown for Petfinder searches: request only the rows a page view renders.
+
+A consumer asks for a window of a sorted search, `count` rows from `offset`
+(eg. the 12 cards of a results page, or the single newest animal of a
+top-results widget), instead of a fixed 100-row page it then mostly discards.
+plan_pages() picks the page size and pages covering the window with the
+fewest requests, then the fewest rows:
+
+    plan_pages(0, 12)    -> (12, [1])     one 12-row request
+    plan_pages(24, 12)   -> (12, [3])
+    plan_pages(20, 15)   -> (18, [2])     rows 18-35, the smallest page holding rows 20-34
+    plan_pages(150, 100) -> (50, [4, 5]) past Petfinder's 100-row limit
+
+Fetched pages are cached per (search, page size, page) for
+PLANNER_PAGE_CACHE_TTL seconds, and a window already covered by cached pages
+of any size (eg. the newest animal, out of the first page of cards) is
+answered without a request.
+
+Every Petfinder request made while handling a page view is counted, with its
+body size, and reported on the response so it shows in the browser's network
+panel:
+
+    Server-Timing: upstream;desc="calls=2 bytes=18422 cache_hits=1"
+
+QueryPlanner.snapshot() returns the per-view averages since startup, and
+benchmarks/planner_benchmark.py compares a page view with and without planning.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+
+from fragments import search_key
+
+# Petfinder's largest page
+MAX_PAGE_SIZE = 100
+
+
+def plan_pages(offset, count, max_page_size=MAX_PAGE_SIZE):
+    """(page size, [page number, ...]) covering rows [offset, offset + count) with the fewest requests, then the fewest rows.
+
+    Pages are numbered from 1, as Petfinder numbers them.
+    """
+    if count <= 0:
+        return 0, []
+    best = None
+    for page_size in range(1, max_page_size + 1):
+        first, last = offset // page_size, (offset + count - 1) // page_size
+        cost = (last - first + 1, (last - first + 1) * page_size)
+        if best is None or cost < best[0]:
+            best = (cost, page_size, list(range(first + 1, last + 2)))
+    return best[1], best[2]
+
+
+class PageCache:
+    """LRU + TTL cache of fetched search pages, that can answer a window from pages of any size"""
+
+    def __init__(self, max_pages=1000, ttl=300):
+        self.max_pages = max_pages
+        self.ttl = ttl
+        # (query key, page size, page) -> (expires at, rows), least recently used first
+        self._pages = OrderedDict()
+        # query key -> {(page size, page), ...}
+        self._queries = {}
+        # query key -> (expires at, total rows the search matches)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def get(self, query_key, page_size, page):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pages.get((query_key, page_size, page))
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._drop((query_key, page_size, page))
+                return None
+            self._pages.move_to_end((query_key, page_size, page))
+            return entry[1]
+
+    def put(self, query_key, page_size, page, rows, total=None):
+        """Store a page; total is the search's row count when known (Petfinder's pagination.total_count)"""
+        expires = time.monotonic() + self.ttl
+        if total is None and len(rows) < page_size:
+            # a short page is the last one
+            total = (page - 1) * page_size + len(rows)
+        with self._lock:
+            key = (query_key, page_size, page)
+            if key in self._pages:
+                self._drop(key)
+            self._pages[key] = (expires, list(rows))
+            self._queries.setdefault(query_key, set()).add((page_size, page))
+            if total is not None:
+                self._totals[query_key] = (expires, total)
+            while len(self._pages) > self.max_pages:
+                self._drop(next(iter(self._pages)))
+
+    def _drop(self, key):
+        """Remove one page and its index entry; the caller holds the lock"""
+        del self._pages[key]
+        query_key, page_size, page = key
+        pages = self._queries.get(query_key)
+        if pages is not None:
+            pages.discard((page_size, page))
+            if not pages:
+                del self._queries[query_key]
+                self._totals.pop(query_key, None)
+
+    def window(self, query_key, offset, count):
+        """Rows [offset, offset + count) of a search if cached pages cover all of them (or up to its last row), else None"""
+        now = time.monotonic()
+        with self._lock:
+            end = offset + count
+            expires, total = self._totals.get(query_key, (None, None))
+            if total is not None and expires >= now:
+                end = min(end, total)
+            found = {}
+            used = []
+            for page_size, page in list(self._queries.get(query_key, ())):
+                key = (query_key, page_size, page)
+                expires, rows = self._pages[key]
+                if expires < now:
+                    self._drop(key)
+                    continue
+                start = (page - 1) * page_size
+                if start >= end or start + len(rows) <= offset:
+                    continue
+                used.append(key)
+                for position in range(max(start, offset), min(start + len(rows), end)):
+                    found.setdefault(position, rows[position - start])
+            if len(found) < end - offset:
+                return None
+            for key in used:
+                self._pages.move_to_end(key)
+            return [found[position] for position in range(offset, end)]
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._queries.clear()
+            self._totals.clear()
+
+
+class UpstreamUsage:
+    """Petfinder requests made for one page view; threads of a fan-out add to it concurrently"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def add(self, calls=0, nbytes=0, cache_hits=0):
+        with self._lock:
+            self.calls += calls
+            self.bytes += nbytes
+            self.cache_hits += cache_hits
+
+
+def record_upstream(calls=0, nbytes=0, cache_hits=0):
+    """Count Petfinder requests (or windows answered from cached pages) against the current page view, if any"""
+    if has_app_context():
+        usage = g.get("upstream_usage")
+        if usage is not None:
+            usage.add(calls, nbytes, cache_hits)
+
+
+class QueryPlanner:
+    """Flask extension: plans and caches windowed Petfinder searches, and reports upstream usage per page view"""
+
+    def __init__(self, app=None):
+        self.page_cache = PageCache()
+        self.server_timing = True
+        # totals over every page view since startup
+        self._totals = {"page_views": 0, "calls": 0, "bytes": 0, "cache_hits": 0}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.page_cache.max_pages = app.config.get("PLANNER_PAGE_CACHE_SIZE", self.page_cache.max_pages)
+        self.page_cache.ttl = app.config.get("PLANNER_PAGE_CACHE_TTL", self.page_cache.ttl)
+        self.server_timing = app.config.get("PLANNER_SERVER_TIMING", self.server_timing)
+        app.before_request(self._start_page_view)
+        app.after_request(self._report_page_view)
+        app.extensions["query_planner"] = self
+
+    def _start_page_view(self):
+        g.upstream_usage = UpstreamUsage()
+
+    def _report_page_view(self, response):
+        usage = g.get("upstream_usage")
+        if usage is None or not (usage.calls or usage.cache_hits):
+            return response
+        with self._lock:
+            self._totals["page_views"] += 1
+            self._totals["calls"] += usage.calls
+            self._totals["bytes"] += usage.bytes
+            self._totals["cache_hits"] += usage.cache_hits
+        if self.server_timing:
+            response.headers.add(
+                "Server-Timing",
+                f'upstream;desc="calls={usage.calls} bytes={usage.bytes} cache_hits={usage.cache_hits}"',
+            )
+        return response
+
+    def snapshot(self):
+        """Petfinder usage of the page views that searched it, since startup.
+
+        Returns: OBJECT = {"page_views": INT, "calls": INT, "bytes": INT, "cache_hits": INT,
+                           "calls_per_view": FLOAT, "bytes_per_view": FLOAT}
+        """
+        with self._lock:
+            totals = dict(self._totals)
+        views = totals["page_views"] or 1
+        totals["calls_per_view"] = round(totals["calls"] / views, 2)
+        totals["bytes_per_view"] = round(totals["bytes"] / views)
+        return totals
+
+    def fetch(self, fetch_page, params, count, offset=0):
+        """Rows [offset, offset + count) of a sorted search, from cached pages or the fewest, smallest requests.
+
+        Args:
+            fetch_page (FUNCTION): fetch_page(page_size, page) -> ([row, ...], total rows or None)
+            params (DICT): everything that identifies the search, sort included; the cache key
+            count (INT): rows the consumer renders
+            offset (INT, optional): rows to skip
+
+        Returns: [row, ...], shorter than count past the last row
+        """
+        query_key = search_key(**params)
+        rows = self.page_cache.window(query_key, offset, count)
+        if rows is not None:
+            record_upstream(cache_hits=1)
+            return rows
+
+        page_size, pages = plan_pages(offset, count)
+        fetched = []
+        for page in pages:
+            page_rows = self.page_cache.get(query_key, page_size, page)
+            if page_rows is None:
+                page_rows, total = fetch_page(page_size, page)
+                self.page_cache.put(query_key, page_size, page, page_rows, total)
+            fetched.extend(page_rows)
+            if len(page_rows) < page_size:
+                break
+        start = offset - (pages[0] - 1) * page_size if pages else 0
+        return fetched[start:start + count]
+
+
+query_planner = QueryPlanner()
@@ -0,0 +1,260 @@
+"""Local faceted search over the mirrored animal catalog (the animals table).
+
+Every animal gets a dense document number, and every (facet, value) pair
+keeps a posting list stored as a Python int bitmap: bit d is set if document
+d has that value. A search ORs together the values picked within a facet and
+ANDs the facets together, so it is a handful of big-int operations no matter
+how many animals match. Facet counts are popcounts of the result ANDed with
+each value's bitmap.
+
+Facet counts are disjunctive: a facet's own selection is left out when
+counting that facet, so picking type=Dog still shows how many cats there
+are. No Petfinder call is made.
+
+Each web worker builds its own index. The sync job (sync.py) runs in another
+process, so workers notice a finished sync pass through
+SyncCheckpoint.completed_at (checked every check_seconds, like fragments.py)
+and rebuild from the database; the old index answers searches meanwhile.
+"""
+
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from geo import org_index
+
+# facet -> function pulling its value(s) out of a Petfinder animal record
+FACETS = {
+    "type": lambda record: record.get("type"),
+    "species": lambda record: record.get("species"),
+    "age": lambda record: record.get("age"),
+    "gender": lambda record: record.get("gender"),
+    "size": lambda record: record.get("size"),
+    "coat": lambda record: record.get("coat"),
+    "breed": lambda record: [
+        (record.get("breeds") or {}).get(key) for key in ("primary", "secondary")
+    ],
+    "color": lambda record: [
+        (record.get("colors") or {}).get(key) for key in ("primary", "secondary", "tertiary")
+    ],
+    "good_with_children": lambda record: (record.get("environment") or {}).get("children"),
+    "good_with_dogs": lambda record: (record.get("environment") or {}).get("dogs"),
+    "good_with_cats": lambda record: (record.get("environment") or {}).get("cats"),
+    "house_trained": lambda record: (record.get("attributes") or {}).get("house_trained"),
+    "special_needs": lambda record: (record.get("attributes") or {}).get("special_needs"),
+    "state": lambda record: ((record.get("contact") or {}).get("address") or {}).get("state"),
+    "organization_id": lambda record: record.get("organization_id"),
+}
+
+
+def facet_value(value):
+    """Posting list key for a value; booleans become 'true'/'false' to match the query string"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def extract_facets(record):
+    """[(facet, value), ...] for one Petfinder animal record, skipping missing and repeated values"""
+    pairs = {}
+    for facet, extract in FACETS.items():
+        values = extract(record)
+        for value in values if isinstance(values, list) else [values]:
+            if value is not None and value != "":
+                pairs[(facet, facet_value(value))] = None
+    return list(pairs)
+
+
+def latest_sync():
+    """When the last sync pass finished, in any process; None before the first"""
+    from models import SyncCheckpoint, db
+
+    return db.session.scalar(select(func.max(SyncCheckpoint.completed_at)))
+
+
+def iter_bits(bitmap):
+    """Document numbers set in a bitmap, lowest first"""
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
+
+
+class AnimalSearchIndex:
+    """Bitmap posting lists over animals, loaded from the database on first use.
+
+    Documents are numbered in load order (newest published first), so
+    results come back newest first; animals added later go to the end.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.check_seconds = 60
+        self._sync_generation = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._animal_ids = []
+        self._docs = {}
+        self._doc_facets = []
+        self._postings = {facet: {} for facet in FACETS}
+        self._live = 0
+
+    def __len__(self):
+        return self._live.bit_count()
+
+    def add(self, animal_id, record):
+        """Index (or re-index) one animal from its Petfinder record.
+
+        A re-indexed animal keeps its document number, so it keeps its place in
+        the newest-first order and the index doesn't grow.
+        """
+        with self._lock:
+            doc = self._docs.get(animal_id)
+            if doc is None:
+                doc = len(self._animal_ids)
+                self._animal_ids.append(animal_id)
+                self._doc_facets.append([])
+                self._docs[animal_id] = doc
+            else:
+                self._clear_postings(doc)
+            pairs = extract_facets(record)
+            self._doc_facets[doc] = pairs
+            bit = 1 << doc
+            for facet, value in pairs:
+                postings = self._postings[facet]
+                postings[value] = postings.get(value, 0) | bit
+            self._live |= bit
+
+    def _clear_postings(self, doc):
+        """Unset a document's bit in its posting lists; the caller holds the lock"""
+        bit = 1 << doc
+        for facet, value in self._doc_facets[doc]:
+            postings = self._postings[facet]
+            postings[value] &= ~bit
+            if not postings[value]:
+                del postings[value]
+        self._doc_facets[doc] = []
+
+    def remove(self, animal_id):
+        """Drop an animal, eg. once it's been adopted. Its document number is not reused."""
+        with self._lock:
+            doc = self._docs.pop(animal_id, None)
+            if doc is None:
+                return
+            self._clear_postings(doc)
+            self._live &= ~(1 << doc)
+
+    def load(self):
+        """(Re)build the index from every mirrored animal that hasn't been adopted or removed.
+
+        The new index is built aside and swapped in, so searches aren't blocked while it loads.
+        """
+        from models import Animal
+
+        with self._load_lock:
+            # read first, so a pass finishing mid-load triggers another rebuild
+            generation = latest_sync()
+            fresh = AnimalSearchIndex()
+            query = Animal.query.filter(Animal.removed_at.is_(None)).order_by(
+                Animal.published_at.desc(), Animal.id.desc()
+            )
+            for animal in query.yield_per(1000):
+                record = dict(animal.data or {}, type=animal.type, organization_id=animal.organization_id)
+                fresh.add(animal.id, record)
+            with self._lock:
+                self._animal_ids = fresh._animal_ids
+                self._docs = fresh._docs
+                self._doc_facets = fresh._doc_facets
+                self._postings = fresh._postings
+                self._live = fresh._live
+                self._sync_generation = generation
+                self._checked_at = time.monotonic()
+                self.loaded = True
+        return self
+
+    def ensure_loaded(self):
+        """Load the index on first use, and rebuild it once another process has finished a sync pass"""
+        if not self.loaded:
+            self.load()
+        else:
+            self._check_sync()
+        return self
+
+    def _check_sync(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_seconds:
+            return
+        self._checked_at = now
+        if latest_sync() != self._sync_generation:
+            self.load()
+
+    def _facet_bitmap(self, facet, values):
+        """OR of the posting lists of the picked values of one facet"""
+        postings = self._postings[facet]
+        bitmap = 0
+        for value in values:
+            bitmap |= postings.get(facet_value(value), 0)
+        return bitmap
+
+    def org_bitmap(self, org_ids):
+        """Bitmap of every animal listed by these orgs"""
+        return self._facet_bitmap("organization_id", org_ids)
+
+    def search(self, filters=None, within=None, offset=0, limit=20, facets=None):
+        """Filter the catalog and count facets.
+
+        Args:
+            filters (DICT): facet -> list of values; values are ORed, facets ANDed
+            within (INT, optional): bitmap the results must also fall in, eg. org_bitmap() of nearby orgs
+            offset, limit (INT): page of animal ids to return
+            facets (LIST, optional): facets to count, defaults to all of them
+
+        Returns: OBJECT = {
+            "total": INT,
+            "animal_ids": [INT, ...],
+            "facets": {facet: {value: count, ...}, ...}
+        }
+        """
+        filters = {facet: values for facet, values in (filters or {}).items() if facet in FACETS and values}
+        with self._lock:
+            base = self._live if within is None else self._live & within
+            selected = {facet: self._facet_bitmap(facet, values) for facet, values in filters.items()}
+
+            result = base
+            for bitmap in selected.values():
+                result &= bitmap
+
+            counts = {}
+            for facet in facets or FACETS:
+                # every filter except this facet's own
+                others = base
+                for other, bitmap in selected.items():
+                    if other != facet:
+                        others &= bitmap
+                counts[facet] = {
+                    value: count
+                    for value, posting in self._postings[facet].items()
+                    if (count := (others & posting).bit_count())
+                }
+
+            animal_ids = []
+            for position, doc in enumerate(iter_bits(result)):
+                if position >= offset + limit:
+                    break
+                if position >= offset:
+                    animal_ids.append(self._animal_ids[doc])
+
+        return {"total": result.bit_count(), "animal_ids": animal_ids, "facets": counts}
+
+    def search_near(self, lat, lon, radius_km, **kwargs):
+        """search() limited to animals of orgs within radius_km of (lat, lon)"""
+        nearby = [org_id for _, org_id in org_index.ensure_loaded().within(lat, lon, radius_km)]
+        return self.search(within=self.org_bitmap(nearby), **kwargs)
+
+
+animal_index = AnimalSearchIndex()
@@ -1,8 +1,81 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
+
+Generate (or regenerate) the CSVs first with fake-user-generator/create_csvs.py.
+"""
 
 from csv import DictReader
+from sqlalchemy import Integer, text
 from app import app, db
-from models import User, Message, Follows
+from applicants import refresh_applicant_profiles
+from models import (
+    RescueOrganization,
+    User,
+    UserLocation,
+    UserAnimalPreferences,
+    MatchedRescueOrganization,
+    UserTravelPreferences,
+    UserResources,
+    UserResidence,
+    UserCurrentPets,
+    UserFollows,
+    Follows,
+    recount_follow_counters,
+)
+
+# CSV file -> model, in foreign key order
+SEED_FILES = [
+    ("fake-user-generator/rescue_org.csv", RescueOrganization),
+    ("fake-user-generator/users.csv", User),
+    ("fake-user-generator/user_location.csv", UserLocation),
+    ("fake-user-generator/user_animal_preferences.csv", UserAnimalPreferences),
+    ("fake-user-generator/matched_rescue_org.csv", MatchedRescueOrganization),
+    ("fake-user-generator/user_travel_preferences.csv", UserTravelPreferences),
+    ("fake-user-generator/user_resources.csv", UserResources),
+    ("fake-user-generator/user_residence.csv", UserResidence),
+    ("fake-user-generator/user_current_pets.csv", UserCurrentPets),
+    ("fake-user-generator/user_follows.csv", UserFollows),
+    ("fake-user-generator/follows.csv", Follows),
+]
+BATCH_SIZE = 10_000
+
+
+def parse_csv_value(value):
+    """Turn CSV strings back into python values: 'True'/'False' -> bool, '{a,b}' -> ['a', 'b'], '' -> None"""
+    if value in ("True", "False"):
+        return value == "True"
+    if value.startswith("{") and value.endswith("}"):
+        return [item for item in value[1:-1].split(",") if item]
+    if value == "":
+        return None
+    return value
+
+
+def seed_csv(path, model):
+    """Bulk insert a CSV in batches so large generated files never have to fit in memory"""
+    with open(path) as csv_file:
+        batch = []
+        for row in DictReader(csv_file):
+            batch.append({key: parse_csv_value(value) for key, value in row.items()})
+            if len(batch) >= BATCH_SIZE:
+                db.session.bulk_insert_mappings(model, batch)
+                batch = []
+        if batch:
+            db.session.bulk_insert_mappings(model, batch)
+
+
+def reset_id_sequence(model):
+    """Move a serial id's sequence past the ids loaded from a CSV, so the next insert (eg. User.signup) gets a free id"""
+    id_column = model.__table__.columns.get("id")
+    if id_column is None or not isinstance(id_column.type, Integer):
+        return
+    table = model.__table__.name
+    db.session.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), coalesce(max(id), 1), max(id) IS NOT NULL) "
+            f'FROM "{table}"'
+        )
+    )
+
 
 # create app context for db
 app.app_context().push()
@@ -11,13 +84,14 @@ app.app_context().push()
 db.drop_all()
 db.create_all()
 
-with open('fake-user-generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+for path, model in SEED_FILES:
+    seed_csv(path, model)
+    reset_id_sequence(model)
 
-with open('fake-user-generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+# follows were bulk loaded, so fill in the denormalized follower/following counts in one pass
+recount_follow_counters()
 
-with open('fake-user-generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
+# same for the applicant index, which is otherwise refreshed as the source rows change
+refresh_applicant_profiles()
 
 db.session.commit()
@@ -0,0 +1,260 @@
+"""Columnar Parquet snapshots of the mirrored animal catalog, for analytics.
+
+`python snapshots.py write` (run it daily after the sync job, eg. from cron)
+writes the live animals to ANALYTICS_SNAPSHOT_PATH as a hive-partitioned
+Parquet dataset, one flat row per animal:
+
+    <root>/country=CA/state=ON/snapshot_date=2024-03-01/part-0.parquet
+
+Rewriting a day replaces that day's partitions, and days older than
+ANALYTICS_SNAPSHOT_KEEP_DAYS are deleted. Rows are streamed from a
+server-side cursor into Arrow record batches, so memory use doesn't grow with
+the catalog.
+
+Reads memory-map the files and only decode the columns an aggregation
+needs. Country, state and date filters prune whole directories, and other
+filters (eg. type) are pushed down to skip row groups by their statistics.
+The aggregations below replace computing the same numbers from live API
+DataFrames (eg. PetFinderPetPyAPI.animals_df_to_org_animal_count_dict).
+"""
+
+import glob
+import os
+import shutil
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from models import db, Animal
+
+SNAPSHOT_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "cache", "snapshots")
+PARTITIONING = ("country", "state", "snapshot_date")
+BATCH_ROWS = 50_000
+
+# column: (JSONB path in Animal.data, Arrow type name); None for the table's own columns
+SNAPSHOT_COLUMNS = {
+    "id": (None, "int64"),
+    "organization_id": (None, "string"),
+    "type": (None, "string"),
+    "species": (("species",), "string"),
+    "primary_breed": (("breeds", "primary"), "string"),
+    "mixed_breed": (("breeds", "mixed"), "bool"),
+    "primary_color": (("colors", "primary"), "string"),
+    "age": (("age",), "string"),
+    "gender": (("gender",), "string"),
+    "size": (("size",), "string"),
+    "coat": (("coat",), "string"),
+    "status": (None, "string"),
+    "published_at": (None, "timestamp"),
+    # days between published_at and the snapshot: how long the animal has been listed
+    "days_listed": (None, "int32"),
+    "country": (("contact", "address", "country"), "string"),
+    "state": (("contact", "address", "state"), "string"),
+}
+
+
+def snapshot_schema():
+    import pyarrow as pa
+
+    types = {
+        "int64": pa.int64(),
+        "int32": pa.int32(),
+        "string": pa.string(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema(
+        [(name, types[type_name]) for name, (_, type_name) in SNAPSHOT_COLUMNS.items()]
+        + [("snapshot_date", pa.date32())]
+    )
+
+
+def _snapshot_query():
+    columns = []
+    for name, (path, _) in SNAPSHOT_COLUMNS.items():
+        if name == "days_listed":
+            continue
+        if path is None:
+            columns.append(getattr(Animal, name))
+        else:
+            element = Animal.data
+            for key in path:
+                element = element[key]
+            columns.append(element.astext.label(name))
+    return select(*columns).where(Animal.removed_at.is_(None)).order_by(Animal.id)
+
+
+def _record_batches(snapshot_date, chunk_size):
+    """Live animals as Arrow record batches of at most BATCH_ROWS rows"""
+    import pyarrow as pa
+
+    schema = snapshot_schema()
+    snapshot_end = datetime.combine(snapshot_date + timedelta(days=1), datetime.min.time(), timezone.utc)
+    result = db.session.execute(_snapshot_query().execution_options(stream_results=True, yield_per=chunk_size))
+    mappings = result.mappings()
+    try:
+        while True:
+            rows = mappings.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            columns = {name: [row.get(name) for row in rows] for name in SNAPSHOT_COLUMNS if name != "days_listed"}
+            columns["mixed_breed"] = [None if value is None else value == "true" for value in columns["mixed_breed"]]
+            # partition values can't be null
+            columns["country"] = [value or "unknown" for value in columns["country"]]
+            columns["state"] = [value or "unknown" for value in columns["state"]]
+            columns["days_listed"] = [(snapshot_end - published_at).days for published_at in columns["published_at"]]
+            columns["snapshot_date"] = [snapshot_date] * len(rows)
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+    finally:
+        result.close()
+
+
+def write_snapshot(snapshot_date=None, root=SNAPSHOT_DIR, keep_days=90, chunk_size=1000):
+    """Write today's (or snapshot_date's) snapshot and delete the ones older than keep_days.
+
+    Returns: OBJECT = {"snapshot_date": STR, "rows": INT, "deleted_dates": [STR, ...]}
+    """
+    import pyarrow.dataset as ds
+
+    snapshot_date = snapshot_date or datetime.now(timezone.utc).date()
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        counted(_record_batches(snapshot_date, chunk_size)),
+        root,
+        schema=snapshot_schema(),
+        format="parquet",
+        partitioning=list(PARTITIONING),
+        partitioning_flavor="hive",
+        # replaces this date's partitions and leaves the other dates alone
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=BATCH_ROWS,
+    )
+
+    deleted = []
+    oldest_kept = snapshot_date - timedelta(days=keep_days)
+    for day in snapshot_dates(root):
+        if day < oldest_kept:
+            for partition in glob.glob(os.path.join(root, "*", "*", f"snapshot_date={day.isoformat()}")):
+                shutil.rmtree(partition)
+            deleted.append(day.isoformat())
+    return {"snapshot_date": snapshot_date.isoformat(), "rows": rows, "deleted_dates": deleted}
+
+
+##############################################################################
+# Reading
+
+
+def snapshot_dates(root=SNAPSHOT_DIR):
+    """Sorted dates that have a snapshot, from the partition directory names alone"""
+    return sorted(
+        {
+            date.fromisoformat(os.path.basename(path).split("=", 1)[1])
+            for path in glob.glob(os.path.join(root, "*", "*", "snapshot_date=*"))
+        }
+    )
+
+
+def open_snapshots(root=SNAPSHOT_DIR):
+    """The snapshot dataset, memory-mapped"""
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    return ds.dataset(
+        root,
+        schema=snapshot_schema(),
+        format="parquet",
+        partitioning="hive",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def snapshot_filter(snapshot_date=None, country=None, state=None, animal_type=None, root=SNAPSHOT_DIR):
+    """Filter expression for one snapshot (the latest by default), or None if there are no snapshots"""
+    import pyarrow.dataset as ds
+
+    snapshot_date = snapshot_date or (snapshot_dates(root) or [None])[-1]
+    if snapshot_date is None:
+        return None
+    expression = ds.field("snapshot_date") == snapshot_date
+    if country:
+        expression &= ds.field("country") == country
+    if state:
+        expression &= ds.field("state") == state
+    if animal_type:
+        expression &= ds.field("type") == animal_type
+    return expression
+
+
+def _grouped_counts(column, root=SNAPSHOT_DIR, **filters):
+    """{value: count} of one column over a filtered snapshot, most common first"""
+    expression = snapshot_filter(root=root, **filters)
+    if expression is None:
+        return {}
+    table = open_snapshots(root).to_table(columns=[column], filter=expression)
+    counts = table.group_by(column).aggregate([([], "count_all")]).sort_by([("count_all", "descending")])
+    return dict(zip(counts[column].to_pylist(), counts["count_all"].to_pylist()))
+
+
+def org_animal_counts(**filters):
+    """{organization_id: live animals}, most first; filters as in snapshot_filter()"""
+    return _grouped_counts("organization_id", **filters)
+
+
+def breed_distribution(**filters):
+    """{primary breed: animals}, most common first; filters as in snapshot_filter()"""
+    return _grouped_counts("primary_breed", **filters)
+
+
+def days_listed_by_type(root=SNAPSHOT_DIR, **filters):
+    """How long animals of each type have been listed.
+
+    Returns: OBJECT = {type: {"animals": INT, "mean_days": FLOAT, "median_days": FLOAT, "max_days": INT}, ...}
+    """
+    expression = snapshot_filter(root=root, **filters)
+    if expression is None:
+        return {}
+    table = open_snapshots(root).to_table(columns=["type", "days_listed"], filter=expression)
+    stats = table.group_by("type").aggregate(
+        [
+            ("days_listed", "count"),
+            ("days_listed", "mean"),
+            ("days_listed", "approximate_median"),
+            ("days_listed", "max"),
+        ]
+    )
+    return {
+        row["type"]: {
+            "animals": row["days_listed_count"],
+            "mean_days": round(row["days_listed_mean"], 1),
+            "median_days": row["days_listed_approximate_median"],
+            "max_days": row["days_listed_max"],
+        }
+        for row in stats.to_pylist()
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["write"]:
+        sys.exit("usage: python snapshots.py write")
+
+    from flask import current_app
+
+    from app import app
+
+    with app.app_context():
+        print(
+            write_snapshot(
+                root=current_app.config.get("ANALYTICS_SNAPSHOT_PATH", SNAPSHOT_DIR),
+                keep_days=current_app.config.get("ANALYTICS_SNAPSHOT_KEEP_DAYS", 90),
+                chunk_size=current_app.config.get("EXPORT_CHUNK_SIZE", 1000),
+            )
+        )
@@ -0,0 +1,239 @@
+"""Keep the local animals table current for the configured regions (SYNC_REGIONS).
+
+Each region has two kinds of pass, both resumable:
+
+    delta   animals published since the region's high-water mark, oldest
+            first, using Petfinder's `after` filter as a keyset cursor.
+            Cheap; run it every few minutes.
+    sweep   every adoptable animal in the region. Picks up edits to older
+            listings, and any live animal of the region the sweep didn't see
+            has been adopted or removed, so it gets a tombstone (removed_at).
+            Run it daily.
+
+The delta cursor is inclusive: `after` is sent CURSOR_OVERLAP before it, since
+Petfinder's filter is strict and animals sharing the last timestamp of a page
+could otherwise fall between pages for good. The re-read animals hash the
+same, so they aren't rewritten.
+
+Every record is hashed and rows whose hash didn't change are not rewritten,
+so after the initial load a cycle writes only the delta. Newly listed animals
+are fanned out to their org followers' home feeds (feed.py). Web workers
+rebuild their search index (search.py) once they see the pass completed.
+
+The pass's cursor is committed in SyncCheckpoint after every page, so an
+interrupted pass picks up at the page it stopped on.
+
+    python sync.py                          # delta pass for every region
+    python sync.py --sweep                  # full sweep for every region
+    python sync.py --region "Toronto,ON"    # just this region
+"""
+
+import argparse
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from dateutil import parser as date_parser
+from flask import current_app
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from feed import fan_out_new_animals
+from fragments import fragment_cache
+from models import db, Animal, FeedEntry, SyncCheckpoint
+from search import animal_index
+
+# how far before the cursor each page re-reads, so animals sharing its timestamp aren't skipped
+CURSOR_OVERLAP = timedelta(seconds=1)
+
+# fields that change between identical listings (distance depends on the search location)
+VOLATILE_FIELDS = {"distance", "_links"}
+
+
+def content_hash(record):
+    """md5 of an API animal record, ignoring the fields that change without the listing changing"""
+    stable = {key: value for key, value in record.items() if key not in VOLATILE_FIELDS}
+    return hashlib.md5(json.dumps(stable, sort_keys=True, separators=(",", ":")).encode("utf8")).hexdigest()
+
+
+def photo_url(record):
+    cropped = record.get("primary_photo_cropped") or {}
+    photos = record.get("photos") or [{}]
+    return cropped.get("medium") or photos[0].get("medium")
+
+
+def animal_row(record, region, seen_at):
+    """Animal column values for an API animal record"""
+    return {
+        "id": record["id"],
+        "organization_id": record["organization_id"],
+        "type": record.get("type"),
+        "name": record.get("name"),
+        "url": record.get("url"),
+        "photo_url": photo_url(record),
+        "published_at": date_parser.isoparse(record["published_at"]),
+        "data": record,
+        "status": record.get("status") or "adoptable",
+        "content_hash": content_hash(record),
+        "region": region,
+        "last_seen_at": seen_at,
+        "removed_at": None,
+    }
+
+
+def index_record(row):
+    """The record the search index expects for an Animal row"""
+    return dict(row["data"], type=row["type"], organization_id=row["organization_id"])
+
+
+def store_page(records, region, seen_at):
+    """Upsert one page of API animals, skipping the ones whose content hash didn't change.
+
+    Returns: (new animals, changed animals) as counts
+    """
+    if not records:
+        return 0, 0
+
+    rows = {record["id"]: animal_row(record, region, seen_at) for record in records}
+    stored = {
+        animal_id: (stored_hash, removed_at)
+        for animal_id, stored_hash, removed_at in db.session.execute(
+            select(Animal.id, Animal.content_hash, Animal.removed_at).where(Animal.id.in_(rows))
+        )
+    }
+    new_rows = [row for animal_id, row in rows.items() if animal_id not in stored]
+    changed_rows = [
+        row
+        for animal_id, row in rows.items()
+        if animal_id in stored and (stored[animal_id][0] != row["content_hash"] or stored[animal_id][1])
+    ]
+
+    upserts = new_rows + changed_rows
+    if upserts:
+        statement = insert(Animal).values(upserts)
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[Animal.id],
+                # an animal keeps the region it was first found in
+                set_={column: statement.excluded[column] for column in upserts[0] if column not in ("id", "region")},
+            )
+        )
+
+    # unchanged rows only need to be marked as seen, in one statement
+    changed_ids = {row["id"] for row in changed_rows}
+    unchanged_ids = [animal_id for animal_id in stored if animal_id not in changed_ids]
+    if unchanged_ids:
+        db.session.execute(update(Animal).where(Animal.id.in_(unchanged_ids)).values(last_seen_at=seen_at))
+
+    if new_rows:
+        fan_out_new_animals([Animal(**row) for row in new_rows])
+    if animal_index.loaded:
+        for row in upserts:
+            animal_index.add(row["id"], index_record(row))
+    if upserts:
+        fragment_cache.invalidate_animals([row["id"] for row in upserts])
+
+    return len(new_rows), len(changed_rows)
+
+
+def tombstone_unseen(region, seen_since):
+    """Tombstone the region's live animals a completed sweep didn't see. Returns how many."""
+    removed_ids = list(
+        db.session.scalars(
+            update(Animal)
+            .where(
+                Animal.region == region,
+                Animal.removed_at.is_(None),
+                Animal.last_seen_at < seen_since,
+            )
+            .values(removed_at=datetime.now(timezone.utc), status="removed")
+            .returning(Animal.id)
+        )
+    )
+    if removed_ids:
+        db.session.execute(delete(FeedEntry).where(FeedEntry.animal_id.in_(removed_ids)))
+        for animal_id in removed_ids:
+            animal_index.remove(animal_id)
+        fragment_cache.invalidate_animals(removed_ids)
+    return len(removed_ids)
+
+
+def sync_region(pf_api, region, sweep=False):
+    """Run (or resume) one delta pass or sweep of a region.
+
+    Returns: OBJECT = {"pages": INT, "new": INT, "changed": INT, "removed": INT}
+    """
+    config = current_app.config
+    name = f"{'sweep' if sweep else 'animals'}:{region}"
+    checkpoint = db.session.get(SyncCheckpoint, name) or SyncCheckpoint(name=name)
+
+    if checkpoint.next_page is None:
+        # start a new pass; a delta pass starts at the high-water mark, a sweep from the beginning
+        checkpoint.started_at = datetime.now(timezone.utc)
+        checkpoint.cursor = None if sweep else checkpoint.high_water
+        checkpoint.next_page = 1
+        db.session.add(checkpoint)
+        db.session.commit()
+
+    stats = {"pages": 0, "new": 0, "changed": 0, "removed": 0}
+    while checkpoint.next_page is not None:
+        params = {
+            "location": region,
+            "distance": config.get("SYNC_DISTANCE", 100),
+            "status": "adoptable",
+            "sort": "-recent",
+            "limit": config.get("SYNC_PAGE_SIZE", 100),
+            "page": checkpoint.next_page,
+            "after": (checkpoint.cursor - CURSOR_OVERLAP).isoformat() if checkpoint.cursor else None,
+        }
+        records = pf_api.request_page("animals", params).get("animals") or []
+
+        new, changed = store_page(records, region, checkpoint.started_at)
+        stats["pages"] += 1
+        stats["new"] += new
+        stats["changed"] += changed
+
+        if len(records) < params["limit"]:
+            # last page: the pass is complete
+            if records:
+                checkpoint.cursor = date_parser.isoparse(records[-1]["published_at"])
+            if sweep:
+                stats["removed"] = tombstone_unseen(region, checkpoint.started_at)
+            else:
+                checkpoint.high_water = checkpoint.cursor
+            checkpoint.next_page = None
+            checkpoint.completed_at = datetime.now(timezone.utc)
+        else:
+            # keyset paging: continue from the newest animal stored. If the page didn't get
+            # past the cursor (a whole page inside the overlap), step to the next page instead.
+            cursor = date_parser.isoparse(records[-1]["published_at"])
+            if checkpoint.cursor is not None and cursor <= checkpoint.cursor:
+                checkpoint.next_page += 1
+            else:
+                checkpoint.next_page = 1
+                checkpoint.cursor = cursor
+
+        # the page and its checkpoint commit together
+        db.session.commit()
+
+    return stats
+
+
+def sync_all(pf_api, regions=None, sweep=False):
+    """Sync every configured region. Returns {region: stats}."""
+    regions = regions or current_app.config.get("SYNC_REGIONS", [])
+    return {region: sync_region(pf_api, region, sweep=sweep) for region in regions}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Sync Petfinder animals into the local animals table")
+    arg_parser.add_argument("--sweep", action="store_true", help="full sweep: refresh every animal and tombstone removed ones")
+    arg_parser.add_argument("--region", action="append", help="Petfinder location to sync, defaults to SYNC_REGIONS")
+    args = arg_parser.parse_args()
+
+    from app import app
+    from helper import pf_api
+
+    with app.app_context():
+        for region, stats in sync_all(pf_api, regions=args.region, sweep=args.sweep).items():
+            print(f"{region}: {stats}")
@@ -0,0 +1,89 @@
+"""State transitions of circuit.CircuitBreaker. Run from the app/ directory:
+
+    python -m unittest discover tests
+"""
+
+import unittest
+from unittest.mock import patch
+
+from circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = patch("circuit.time.monotonic", lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = CircuitBreaker("animals", failure_threshold=3, reset_seconds=30, max_open_seconds=600)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            self.breaker.record_failure()
+
+    def test_opens_at_threshold(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.trips, 1)
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertFalse(self.breaker.allow())
+        # reset_seconds plus up to a second of jitter
+        self.assertTrue(30 <= self.breaker.retry_in() < 31)
+
+    def test_success_resets_failure_count(self):
+        self.fail(2)
+        self.breaker.record_success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failures_while_open_are_ignored(self):
+        # calls that were in flight when the breaker opened
+        self.fail(12)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.trips, 1)
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertTrue(30 <= self.breaker.retry_in() < 31)
+
+    def test_half_open_allows_one_probe(self):
+        self.fail(3)
+        self.now += 31
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_successful_probe_closes(self):
+        self.fail(3)
+        self.now += 31
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+        # the backoff starts over after closing
+        self.fail(3)
+        self.assertTrue(30 <= self.breaker.retry_in() < 31)
+
+    def test_failed_probe_reopens_with_longer_backoff(self):
+        self.fail(3)
+        self.now += 31
+        self.breaker.allow()
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.trips, 2)
+        self.assertTrue(60 <= self.breaker.retry_in() < 61)
+
+    def test_backoff_is_capped(self):
+        self.fail(3)
+        for _ in range(10):
+            self.now += self.breaker.retry_in() + 1
+            self.breaker.allow()
+            self.fail()
+        self.assertTrue(600 <= self.breaker.retry_in() < 601)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,8 +3,9 @@ from flask import Blueprint, flash, redirect, session, g, render_template, url_f
 from dotenv import load_dotenv
 from sqlalchemy.exc import IntegrityError
 
-from models import db, User
+from models import db, User, RescueOrganization
 from forms import UserEditForm
+from hashing import PasswordHasherBusy
 from ..users.routes import do_logout
 
 users_bp = Blueprint('users', __name__, template_folder='templates', static_folder='static', url_prefix='/users')
@@ -74,11 +75,15 @@ def add_follow(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    if follow_id == g.user.id:
+        flash("You can't follow yourself.", "danger")
+        return redirect(url_for("users.users_show", user_id=g.user.id))
+
+    User.query.get_or_404(follow_id)
+    g.user.follow_user(follow_id)
     db.session.commit()
 
-    return redirect(f"/{g.user.id}/following")
+    return redirect(url_for("users.show_following", user_id=g.user.id))
 
 
 @users_bp.route('/stop-following/<int:follow_id>', methods=['POST'])
@@ -89,11 +94,39 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    g.user.unfollow_user(follow_id)
+    db.session.commit()
+
+    return redirect(url_for("users.show_following", user_id=g.user.id))
+
+
+@users_bp.route('/follow-org/<org_id>', methods=['POST'])
+def add_org_follow(org_id):
+    """Have currently-logged-in-user follow a rescue org."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    RescueOrganization.query.get_or_404(org_id)
+    g.user.follow_org(org_id)
     db.session.commit()
 
-    return redirect(f"/{g.user.id}/following")
+    return redirect(request.referrer or url_for("users.users_show", user_id=g.user.id))
+
+
+@users_bp.route('/stop-following-org/<org_id>', methods=['POST'])
+def stop_following_org(org_id):
+    """Have currently-logged-in-user stop following a rescue org."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    g.user.unfollow_org(org_id)
+    db.session.commit()
+
+    return redirect(request.referrer or url_for("users.users_show", user_id=g.user.id))
 
 
 @users_bp.route('/profile', methods=["GET", "POST"])
@@ -109,7 +142,13 @@ def profile():
         form = UserEditForm(obj=logged_in_user)
 
         if form.validate_on_submit(): 
-            if User.authenticate(form.username.data, form.password.data):
+            try:
+                user = User.authenticate(form.username.data, form.password.data)
+            except PasswordHasherBusy:
+                flash("We're busy right now, please try again in a moment.", 'danger')
+                return render_template('/edit.html', form=form, user=logged_in_user), 503
+
+            if user:
                 form.populate_obj(logged_in_user)
                 db.session.add(logged_in_user)
                 db.session.commit() #commit to db
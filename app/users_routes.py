@@ -1,11 +1,13 @@
 import os
+from urllib.parse import urlsplit
 from flask import Blueprint, flash, redirect, session, g, render_template, url_for, request
 from dotenv import load_dotenv
 from sqlalchemy.exc import IntegrityError
 
-from models import db, User
+from models import db, User, RescueOrganization
 from forms import UserEditForm
-from .users.routes import do_logout
+from hashing import PasswordHasherBusy
+from auth_routes import do_logout
 
 users_bp = Blueprint('users', __name__, template_folder='templates', static_folder='static', url_prefix='/users')
 
@@ -13,6 +15,14 @@ load_dotenv()
 CURR_USER_KEY = os.environ.get("CURR_USER_KEY", 'curr_user')
 
 
+def redirect_back(default):
+    """Redirect to the page the request came from if it's on this site (the Referer header is client-supplied), else to default"""
+    referrer = urlsplit(request.referrer or "")
+    if referrer.scheme in ("http", "https") and referrer.netloc == request.host:
+        return redirect(request.referrer)
+    return redirect(default)
+
+
 ##############################################################################
 # General user routes:
 
@@ -74,11 +84,15 @@ def add_follow(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    if follow_id == g.user.id:
+        flash("You can't follow yourself.", "danger")
+        return redirect(url_for("users.users_show", user_id=g.user.id))
+
+    User.query.get_or_404(follow_id)
+    g.user.follow_user(follow_id)
     db.session.commit()
 
-    return redirect(f"/{g.user.id}/following")
+    return redirect(url_for("users.show_following", user_id=g.user.id))
 
 
 @users_bp.route('/stop-following/<int:follow_id>', methods=['POST'])
@@ -89,11 +103,39 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    g.user.unfollow_user(follow_id)
+    db.session.commit()
+
+    return redirect(url_for("users.show_following", user_id=g.user.id))
+
+
+@users_bp.route('/follow-org/<org_id>', methods=['POST'])
+def add_org_follow(org_id):
+    """Have currently-logged-in-user follow a rescue org."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    RescueOrganization.query.get_or_404(org_id)
+    g.user.follow_org(org_id)
     db.session.commit()
 
-    return redirect(f"/{g.user.id}/following")
+    return redirect_back(url_for("users.users_show", user_id=g.user.id))
+
+
+@users_bp.route('/stop-following-org/<org_id>', methods=['POST'])
+def stop_following_org(org_id):
+    """Have currently-logged-in-user stop following a rescue org."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    g.user.unfollow_org(org_id)
+    db.session.commit()
+
+    return redirect_back(url_for("users.users_show", user_id=g.user.id))
 
 
 @users_bp.route('/profile', methods=["GET", "POST"])
@@ -109,7 +151,13 @@ def profile():
         form = UserEditForm(obj=logged_in_user)
 
         if form.validate_on_submit(): 
-            if User.authenticate(form.username.data, form.password.data):
+            try:
+                user = User.authenticate(form.username.data, form.password.data)
+            except PasswordHasherBusy:
+                flash("We're busy right now, please try again in a moment.", 'danger')
+                return render_template('/edit.html', form=form, user=logged_in_user), 503
+
+            if user:
                 form.populate_obj(logged_in_user)
                 db.session.add(logged_in_user)
                 db.session.commit() #commit to db